@@ -17,11 +17,24 @@ class Message {
         this.__payload["request_id"] = Math.floor(Math.random() * (+max - +min)) + +min; 
     }
     
-    // clone an object
-    __clone(object) {
+    // clone an object or, if no copy is requested, return a read-only view of it
+    __clone(object, copy=true) {
+        if (! copy) return this.__readonly(object)
         return JSON.parse(JSON.stringify(object))
     }
     
+    // return a read-only view of an object, nested objects are wrapped on access
+    __readonly(object) {
+        if (object == null || typeof object != "object") return object
+        var this_class = this
+        return new Proxy(object, {
+            get: function(target, property) { return this_class.__readonly(target[property]) },
+            set: function(target, property) { throw "cannot set "+String(property)+" on a read-only view" },
+            deleteProperty: function(target, property) { throw "cannot delete "+String(property)+" from a read-only view" },
+            defineProperty: function(target, property) { throw "cannot define "+String(property)+" on a read-only view" }
+        })
+    }
+    
     // reset the message
     reset() {
         // topic from which the message comes from, populated only for incoming messages
@@ -79,6 +92,8 @@ class Message {
         }
         // null payload (for clearing retain flag)
         if (payload == null) this.is_null = true
+        // binary codecs (marked by a leading null character) are not supported
+        else if (payload.charAt(0) == "\u0000") throw "unsupported payload codec"
         else {
             // expecting a json payload
             try {
@@ -110,26 +125,26 @@ class Message {
         this.__payload = null
     }
     
-    // get the value of key of the payload
-    get(key) {
+    // get the value of key of the payload. If copy is false, a read-only view is returned instead of a copy
+    get(key, copy=true) {
         if (this.is_null) return null
         if (this.__payload["data"].constructor != Object) return null
         if (! ("data" in this.__payload)) return null
         if (! (key in this.__payload["data"])) return null
-        return this.__clone(this.__payload["data"][key])
+        return this.__clone(this.__payload["data"][key], copy)
     }
     
     // return true if payload has the given key
     has(key) {
-        if (this.get(key) == null) return false
+        if (this.get(key, false) == null) return false
         return true
     }
     
-    // get the value of the payload
-    get_data() {
+    // get the value of the payload. If copy is false, a read-only view is returned instead of a copy
+    get_data(copy=true) {
         if (! ("data" in this.__payload)) return null
         // return a clone of the data
-        return this.__clone(this.__payload["data"])
+        return this.__clone(this.__payload["data"], copy)
     }
     
     // get the request_id
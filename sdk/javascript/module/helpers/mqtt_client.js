@@ -6,10 +6,10 @@ class Mqtt_client {
         this.__module = module
         // mqtt object
         this.__gateway = null;
-        // track the topics subscribed
-        this.__topics_to_subscribe = []
-        this.__topics_subscribed = []
-        this.__topics_to_wait = []
+        // track the topics subscribed, each associated with the listener's settings
+        this.__topics_to_subscribe = {}
+        this.__topics_subscribed = new Topic_trie()
+        this.__topics_to_wait = new Topic_trie()
         // queue messages while offline
         this.__publish_queue = []
         // queue configuration messages while not configured
@@ -24,9 +24,9 @@ class Mqtt_client {
             this_class.__module.connected = true
             this_class.__module.on_connect()
             // subscribe to the requested topics
-            for (var topic of this_class.__topics_to_subscribe) {
+            for (var topic in this_class.__topics_to_subscribe) {
                 this_class.__subscribe(topic)
-                this_class.__topics_subscribed.push(topic)
+                this_class.__topics_subscribed.add(topic, this_class.__topics_to_subscribe[topic])
             }
             // there are message in the queue, send them
             if (this_class.__publish_queue.length > 0) { 
@@ -102,6 +102,7 @@ class Mqtt_client {
     // unsubscribe from a topic
     unsubscribe(topic) {
         this.__module.log_debug("Unsubscribing from "+topic)
+        delete this.__topics_to_subscribe[topic]
         this.__topics_subscribed.remove(topic)
         try {
             this.__gateway.unsubscribe(topic)
@@ -122,9 +123,9 @@ class Mqtt_client {
             this_class.__module.log_debug("Connected to "+this_class.__module.gateway_hostname+":"+this_class.__module.gateway_port)
             this_class.__module.connected = true
             // subscribe to the requested topics
-            for (var topic of this_class.__topics_to_subscribe) {
+            for (var topic in this_class.__topics_to_subscribe) {
                 this_class.__subscribe(topic)
-                this_class.__topics_subscribed.push(topic)
+                this_class.__topics_subscribed.add(topic, this_class.__topics_to_subscribe[topic])
             }
         }
 
@@ -146,74 +147,72 @@ class Mqtt_client {
                 return
             }
             try {
-                // identify the subscribed topic which caused this message to get here
-                for (var pattern of this_class.__topics_subscribed) {
-                    if (topic_matches_sub(pattern, message.topic)) {
-                        // if the message is a configuration
-                        if (message.sender == "controller/config" && message.command == "CONF") {
-                            // notify the module about the configuration just received
-                            try {
-                                this_class.__module.on_configuration(message)
-                            } catch(e) {
-                                this_class.__module.log_error("runtime error during on_configuration() - "+message.dump()+": "+get_exception(e))
-                                return
-                            }
-                            // check if we had to wait for this to start the module
-                            var configuration_consumed = false
-                            if (this_class.__topics_to_wait.length > 0) {
-                                for (var req_pattern of this_class.__topics_to_wait) {
-                                    if (topic_matches_sub(req_pattern, message.topic)) {
-                                        this_class.__module.log_debug("received configuration "+message.topic)
-                                        var index = this_class.__topics_to_wait.indexOf(req_pattern)
-                                        this_class.__topics_to_wait.splice(index, 1)
-                                        // if there are no more topics to wait for, start the module
-                                        if (this_class.__topics_to_wait.length == 0) { 
-                                            this_class.__module.log_debug("Configuration completed for "+this_class.__module.fullname+", starting the module...")
-                                            this_class.__module.configured = true
-                                            // now that is configured, if there are configuration messages waiting in the queue, deliver them
-                                            if (this_class.__configuration_queue.length > 0) { 
-                                                for (var queued_message of this_class.__configuration_queue) {
-                                                    try {
-                                                        this_class.__module.on_configuration(queued_message)
-                                                    } catch(e) {
-                                                        this_class.__module.log_error("runtime error during on_configuration() - "+message.dump()+": "+get_exception(e))
-                                                    }
-                                                }
-                                                this_class.__configuration_queue = []
-                                            }
-                                            // now that is configured, start the module
-                                            try { 
-                                                this_class.__module.on_start()
-                                            } catch(e) {
-                                                this_class.__module.log_error("runtime error during on_start(): "+get_exception(e))
-                                            }
-                                        } else {
-                                            this_class.__module.log_debug("still waiting for configuration on "+JSON.stringify(this_class.__topics_to_wait))
+                // identify the subscribed topics which caused this message to get here
+                var matches = this_class.__topics_subscribed.match(message.topic)
+                if (matches.length == 0) return
+                var handler = this_class.__get_handler(matches)
+                // if the message is a configuration
+                if (message.sender == "controller/config" && message.command == "CONF") {
+                    // notify the module about the configuration just received
+                    try {
+                        if (handler != null) handler(message)
+                        else this_class.__module.on_configuration(message)
+                    } catch(e) {
+                        this_class.__module.log_error("runtime error during on_configuration() - "+message.dump()+": "+get_exception(e))
+                        return
+                    }
+                    // check if we had to wait for this to start the module
+                    var configuration_consumed = false
+                    if (this_class.__topics_to_wait.length > 0) {
+                        for (var req of this_class.__topics_to_wait.match(message.topic)) {
+                            this_class.__module.log_debug("received configuration "+message.topic)
+                            this_class.__topics_to_wait.remove(req[0])
+                            // if there are no more topics to wait for, start the module
+                            if (this_class.__topics_to_wait.length == 0) { 
+                                this_class.__module.log_debug("Configuration completed for "+this_class.__module.fullname+", starting the module...")
+                                this_class.__module.configured = true
+                                // now that is configured, if there are configuration messages waiting in the queue, deliver them
+                                if (this_class.__configuration_queue.length > 0) { 
+                                    for (var queued_message of this_class.__configuration_queue) {
+                                        var queued_handler = this_class.__get_handler(this_class.__topics_subscribed.match(queued_message.topic))
+                                        try {
+                                            if (queued_handler != null) queued_handler(queued_message)
+                                            else this_class.__module.on_configuration(queued_message)
+                                        } catch(e) {
+                                            this_class.__module.log_error("runtime error during on_configuration() - "+message.dump()+": "+get_exception(e))
                                         }
                                     }
+                                    this_class.__configuration_queue = []
                                 }
-                            }
-                            // if this message was not consumed and the module is still unconfigured, queue it, will be delivered once configured
-                            if (! configuration_consumed && ! this_class.__module.configured) {
-                                this_class.__configuration_queue.push(message)
-                            }
-                        // handle internal messages
-                        } else if (message.command == "PING") {
-                            message.reply()
-                            message.command = "PONG"
-                            this_class.__module.send(message)
-                        // notify the module about this message (only if fully configured)
-                        } else {
-                            if (this_class.__module.configured) {
-                                try {
-                                    this_class.__module.on_message(message)
+                                // now that is configured, start the module
+                                try { 
+                                    this_class.__module.on_start()
                                 } catch(e) {
-                                    this_class.__module.log_error("runtime error during on_message(): "+get_exception(e))
+                                    this_class.__module.log_error("runtime error during on_start(): "+get_exception(e))
                                 }
+                            } else {
+                                this_class.__module.log_debug("still waiting for configuration on "+JSON.stringify(this_class.__topics_to_wait.patterns()))
                             }
                         }
-                        // avoid delivering the same message multiple times for overlapping subscribers
-                        return 
+                    }
+                    // if this message was not consumed and the module is still unconfigured, queue it, will be delivered once configured
+                    if (! configuration_consumed && ! this_class.__module.configured) {
+                        this_class.__configuration_queue.push(message)
+                    }
+                // handle internal messages
+                } else if (message.command == "PING") {
+                    message.reply()
+                    message.command = "PONG"
+                    this_class.__module.send(message)
+                // notify the module about this message (only if fully configured)
+                } else {
+                    if (this_class.__module.configured) {
+                        try {
+                            if (handler != null) handler(message)
+                            else this_class.__module.on_message(message)
+                        } catch(e) {
+                            this_class.__module.log_error("runtime error during on_message(): "+get_exception(e))
+                        }
                     }
                 }
             } catch(e) {
@@ -240,28 +239,38 @@ class Mqtt_client {
         this.__connect({"userName": this.__module.house_id, "password": this.__module.house_passcode})
     }
     
-    // add a listener for the given request
-    add_listener(from_module, to_module, command, filter, wait_for_it) {
+    // return the handler of the first matching listener which has one, if any. This way a message is delivered only once even with overlapping subscribers
+    __get_handler(matches) {
+        for (var match of matches) {
+            if (match[1] != null && match[1]["handler"] != null) return match[1]["handler"]
+        }
+        return null
+    }
+    
+    // add a listener for the given request. If a handler is provided, it will be called instead of the module's callback
+    add_listener(from_module, to_module, command, filter, wait_for_it, handler=null) {
         var topic = this.__build_topic("+", from_module, to_module, command, filter)
+        var listener = {"handler": handler}
         if (wait_for_it) {
             // if this is mandatory topic, unconfigure the module and add it to the list of topics to wait for
             if (wait_for_it) {
-                this.__topics_to_wait.push(topic)
+                this.__topics_to_wait.add(topic)
                 this.__module.configured = false
                 this.__module.log_debug("will wait for configuration on "+topic)
             }
         } 
         // subscribe the topic and keep track of it
         if (this.__module.connected) {
-            if (this.__topics_subscribed.includes(topic)) return topic
+            if (this.__topics_subscribed.has(topic)) {
+                // already subscribed, just update the handler
+                this.__topics_subscribed.add(topic, listener)
+                return topic
+            }
             this.__subscribe(topic)
-            this.__topics_subscribed.push(topic)
+            this.__topics_subscribed.add(topic, listener)
         }
         // if not connected, will subscribed once connected
-        else {
-            if (this.__topics_to_subscribe.includes(topic)) return topic
-            this.__topics_to_subscribe.push(topic)
-        }
+        else this.__topics_to_subscribe[topic] = listener
         return topic
     }
     
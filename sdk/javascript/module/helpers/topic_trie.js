@@ -0,0 +1,97 @@
+// index of MQTT subscription patterns, matching a topic in O(topic depth)
+class Topic_trie {
+    constructor() {
+        // each node is made of [children by topic level, {pattern: entry} of the patterns ending here]. Maps have no prototype, so that levels like "constructor" are not found in an empty one
+        this.__root = this.__new_node()
+        // map pattern with its entry [sequence, value], the sequence is used to return matches in the order patterns were added
+        this.__patterns = Object.create(null)
+        this.__sequence = 0
+        this.length = 0
+    }
+    
+    // return a new empty node
+    __new_node() {
+        return [Object.create(null), Object.create(null)]
+    }
+    
+    // add a pattern (supporting + and # wildcards) associating a value to it. Replace the value if already there
+    add(pattern, value=null) {
+        var node = this.__root
+        for (var level of pattern.split("/")) {
+            if (! (level in node[0])) node[0][level] = this.__new_node()
+            node = node[0][level]
+        }
+        if (pattern in this.__patterns) this.__patterns[pattern][1] = value
+        else {
+            this.__sequence++
+            this.__patterns[pattern] = [this.__sequence, value]
+            this.length++
+        }
+        node[1][pattern] = this.__patterns[pattern]
+    }
+    
+    // remove a pattern
+    remove(pattern) {
+        if (! (pattern in this.__patterns)) return
+        delete this.__patterns[pattern]
+        this.length--
+        // walk down to the node keeping track of the path so to prune empty nodes
+        var path = []
+        var node = this.__root
+        for (var level of pattern.split("/")) {
+            path.push([node, level])
+            node = node[0][level]
+        }
+        delete node[1][pattern]
+        for (var i = path.length-1; i >= 0; i--) {
+            var parent = path[i][0]
+            var child = parent[0][path[i][1]]
+            if (Object.keys(child[0]).length > 0 || Object.keys(child[1]).length > 0) break
+            delete parent[0][path[i][1]]
+        }
+    }
+    
+    // return the value associated to a pattern
+    get(pattern) {
+        return pattern in this.__patterns ? this.__patterns[pattern][1] : null
+    }
+    
+    // return true if the pattern has been added
+    has(pattern) {
+        return pattern in this.__patterns
+    }
+    
+    // return a list of [pattern, value] of all the patterns matching the topic, in the order they were added
+    match(topic) {
+        var found = []
+        var add = function(entries) {
+            for (var pattern in entries) found.push([pattern, entries[pattern]])
+        }
+        var nodes = [this.__root]
+        for (var level of topic.split("/")) {
+            var next_nodes = []
+            for (var node of nodes) {
+                var children = node[0]
+                // multi-level wildcard matches whatever follows
+                if ("#" in children) add(children["#"][1])
+                if (level in children) next_nodes.push(children[level])
+                if ("+" in children) next_nodes.push(children["+"])
+            }
+            nodes = next_nodes
+            if (nodes.length == 0) break
+        }
+        for (var node of nodes) {
+            add(node[1])
+            // multi-level wildcard matches the parent level as well
+            if ("#" in node[0]) add(node[0]["#"][1])
+        }
+        found.sort(function(a, b) { return a[1][0] - b[1][0] })
+        return found.map(function(item) { return [item[0], item[1][1]] })
+    }
+    
+    // return the list of patterns, in the order they were added
+    patterns() {
+        var this_class = this
+        return Object.keys(this.__patterns).sort(function(a, b) { return this_class.__patterns[a][0] - this_class.__patterns[b][0] })
+    }
+}
\ No newline at end of file
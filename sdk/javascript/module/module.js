@@ -41,25 +41,25 @@ class Module {
         }
         
     }
-    // Add a listener for the given configuration request (will call on_configuration())
-    add_configuration_listener(args, version=null, wait_for_it=false) {
+    // Add a listener for the given configuration request (will call on_configuration() or the given handler)
+    add_configuration_listener(args, version=null, wait_for_it=false, handler=null) {
         var filename = version == null ? args : version+"/"+args
-        return this.__mqtt.add_listener("controller/config", "*/*", "CONF", filename, wait_for_it)
+        return this.__mqtt.add_listener("controller/config", "*/*", "CONF", filename, wait_for_it, handler)
     }
     
-    // add a listener for the messages addressed to this module (will call on_message())
-    add_request_listener(from_module, command, args) {
-        return this.__mqtt.add_listener(from_module, this.fullname, command, args, false)
+    // add a listener for the messages addressed to this module (will call on_message() or the given handler)
+    add_request_listener(from_module, command, args, handler=null) {
+        return this.__mqtt.add_listener(from_module, this.fullname, command, args, false, handler)
     }
     
-    // add a listener for broadcasted messages from the given module (will call on_message())
-    add_broadcast_listener(from_module, command, args) {
-        return this.__mqtt.add_listener(from_module, "*/*", command, args, false)
+    // add a listener for broadcasted messages from the given module (will call on_message() or the given handler)
+    add_broadcast_listener(from_module, command, args, handler=null) {
+        return this.__mqtt.add_listener(from_module, "*/*", command, args, false, handler)
     }
     
-    // add a listener for intercepting messages from a given module to a given module (will call on_message())
-    add_inspection_listener(from_module, to_module, command, args) {
-        return this.__mqtt.add_listener(from_module, to_module, command, args, false)
+    // add a listener for intercepting messages from a given module to a given module (will call on_message() or the given handler)
+    add_inspection_listener(from_module, to_module, command, args, handler=null) {
+        return this.__mqtt.add_listener(from_module, to_module, command, args, false, handler)
     }
     
     // remove a topic previously subscribed
@@ -0,0 +1,40 @@
+// test the topic trie, run with: node sdk/javascript/tests/topic_trie.js
+const assert = require("assert")
+const fs = require("fs")
+const path = require("path")
+const vm = require("vm")
+
+// load the class as the browser does
+const Topic_trie = vm.runInThisContext(fs.readFileSync(path.join(__dirname, "../module/helpers/topic_trie.js"), "utf8")+"\nTopic_trie")
+
+// return the patterns matching the topic
+function match(trie, topic) {
+    return trie.match(topic).map(function(item) { return item[0] })
+}
+
+var trie = new Topic_trie()
+trie.add("egeoffrey/v1/+/+/+/+/+/IN/#", 1)
+trie.add("egeoffrey/v1/h/a/b/c/d/+/sensor1", 2)
+trie.add("egeoffrey/v1/h/a/b/c/d/IN/#", 3)
+assert.deepStrictEqual(match(trie, "egeoffrey/v1/h/a/b/c/d/IN/sensor1"), ["egeoffrey/v1/+/+/+/+/+/IN/#", "egeoffrey/v1/h/a/b/c/d/+/sensor1", "egeoffrey/v1/h/a/b/c/d/IN/#"])
+assert.deepStrictEqual(match(trie, "egeoffrey/v1/h/a/b/c/d/IN"), ["egeoffrey/v1/+/+/+/+/+/IN/#", "egeoffrey/v1/h/a/b/c/d/IN/#"])
+assert.deepStrictEqual(match(trie, "egeoffrey/v1/h/a/b/c/d/OUT/sensor2"), [])
+
+// levels named as the properties of Object.prototype are levels like any other
+for (var name of ["constructor", "toString", "__proto__", "hasOwnProperty", "valueOf"]) {
+    assert.deepStrictEqual(match(trie, "egeoffrey/v1/h/a/b/c/d/IN/"+name+"/x"), ["egeoffrey/v1/+/+/+/+/+/IN/#", "egeoffrey/v1/h/a/b/c/d/IN/#"])
+    assert.deepStrictEqual(match(trie, "egeoffrey/v1/h/a/b/c/d/"+name+"/x"), [])
+    assert.deepStrictEqual(match(trie, name), [])
+    var pattern = "egeoffrey/v1/h/a/b/c/d/"+name+"/"+name
+    assert.strictEqual(trie.has(name), false)
+    assert.strictEqual(trie.get(name), null)
+    trie.add(pattern, name)
+    assert.deepStrictEqual(match(trie, pattern), [pattern])
+    assert.strictEqual(trie.get(pattern), name)
+    trie.remove(pattern)
+    assert.deepStrictEqual(match(trie, pattern), [])
+}
+trie.remove("constructor")
+assert.strictEqual(trie.length, 3)
+assert.deepStrictEqual(trie.patterns(), ["egeoffrey/v1/+/+/+/+/+/IN/#", "egeoffrey/v1/h/a/b/c/d/+/sensor1", "egeoffrey/v1/h/a/b/c/d/IN/#"])
+console.log("ok")
@@ -0,0 +1,98 @@
+### Benchmark threads, memory and context switches of N thread based modules against N async modules sharing one event loop and connection
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.async_modules [modules] [messages per module]
+
+import os
+import sys
+import json
+import resource
+import subprocess
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+# return the resident memory of this process in kB
+def get_memory():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1])
+    return 0
+
+# return the context switches of this process so far
+def get_context_switches():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+# start the modules, deliver the messages and print the measures as json (run in a dedicated process)
+def run(mode, count, messages):
+    from sdk.python.module.module import Module
+    from sdk.python.module.async_module import AsyncModule
+    base = AsyncModule if mode == "async" else Module
+    received = [0]
+    lock = threading.Lock()
+    # module counting the messages received
+    class Benchmark(base):
+        def on_init(self):
+            self.started = False
+            self.add_request_listener("+/+", "BENCH", "#")
+        def on_start(self):
+            self.started = True
+        def on_stop(self):
+            pass
+        def on_message(self, message):
+            with lock:
+                received[0] = received[0] + 1
+        def on_configuration(self, message):
+            pass
+    memory = get_memory()
+    start = time.time()
+    modules = []
+    for i in range(count):
+        module = Benchmark("service", "bench"+str(i))
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.01)
+    # give the gateway the time to acknowledge the subscriptions
+    time.sleep(1)
+    startup = time.time() - start
+    threads = threading.active_count()
+    memory = get_memory() - memory
+    # measure the context switches while idle
+    switches = get_context_switches()
+    time.sleep(2)
+    idle_switches = (get_context_switches() - switches)/2.0
+    # deliver the messages
+    publisher = mqtt.Client(client_id="benchmark-publisher")
+    publisher.connect(os.environ["EGEOFFREY_GATEWAY_HOSTNAME"], int(os.environ["EGEOFFREY_GATEWAY_PORT"]))
+    publisher.loop_start()
+    switches = get_context_switches()
+    start = time.time()
+    for i in range(messages):
+        for module in modules: publisher.publish("egeoffrey/v1/house/system/benchmark/"+module.fullname+"/BENCH/"+str(i), json.dumps({"data": i}), qos=0)
+    while received[0] < count*messages and time.time() - start < 60: time.sleep(0.01)
+    elapsed = time.time() - start
+    switches = get_context_switches() - switches
+    publisher.loop_stop()
+    print json.dumps({"startup": startup, "threads": threads, "memory": memory, "idle_switches": idle_switches, "switches": switches, "elapsed": elapsed, "received": received[0]})
+    sys.stdout.flush()
+    os._exit(0)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    from sdk.python.benchmarks.broker import Broker
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    for mode in ["thread", "async"]:
+        output = subprocess.check_output([sys.executable, "-m", "sdk.python.benchmarks.async_modules", "--child", mode, str(count), str(messages)])
+        result = json.loads(output.strip().split("\n")[-1])
+        print "%-6s %d modules: %3d threads, %6d kB, started in %.2f s, %6.0f context switches/s idle, %.1f context switches/message, %d/%d messages in %.2f s" % (mode, count, result["threads"], result["memory"], result["startup"], result["idle_switches"], float(result["switches"])/max(1, result["received"]), result["received"], count*messages, result["elapsed"])
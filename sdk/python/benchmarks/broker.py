@@ -0,0 +1,235 @@
+### Minimal in-process MQTT 3.1.1 broker (tcp only) for running the benchmarks without a gateway
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: broker = Broker(); broker.start(); os.environ["EGEOFFREY_GATEWAY_PORT"] = str(broker.port)
+
+import os
+import socket
+import struct
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+# a client connected to the broker
+class Connection(threading.Thread):
+    def __init__(self, broker, sock):
+        super(Connection, self).__init__()
+        self.daemon = True
+        self.broker = broker
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = threading.Lock()
+        # map topic filter with the granted qos
+        self.subscriptions = {}
+        self.running = True
+
+    # read exactly size bytes
+    def __read(self, size):
+        data = ""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if chunk == "": raise EOFError()
+            data = data + chunk
+        return data
+
+    # read a packet, return [type, flags, body]
+    def __read_packet(self):
+        header = ord(self.__read(1))
+        length = 0
+        multiplier = 1
+        while True:
+            byte = ord(self.__read(1))
+            length = length + (byte & 127) * multiplier
+            multiplier = multiplier * 128
+            if byte & 128 == 0: break
+        return [header >> 4, header & 15, self.__read(length)]
+
+    # send a packet
+    def send(self, header, body):
+        length = len(body)
+        encoded = ""
+        while True:
+            byte = length % 128
+            length = length // 128
+            if length > 0: byte = byte | 128
+            encoded = encoded + chr(byte)
+            if length == 0: break
+        with self.lock:
+            self.sock.sendall(chr(header)+encoded+body)
+
+    # deliver a message to this client (always with qos 0)
+    def deliver(self, topic, payload, retain):
+        topic = topic.encode("utf-8") if isinstance(topic, unicode) else topic
+        self.send(0x30 | (1 if retain else 0), struct.pack("!H", len(topic))+topic+payload)
+
+    def run(self):
+        try:
+            while self.running:
+                packet_type, flags, body = self.__read_packet()
+                # CONNECT
+                if packet_type == 1:
+                    self.broker.connections = self.broker.connections + 1
+                    self.send(0x20, "\x00\x00")
+                # PUBLISH
+                elif packet_type == 3:
+                    qos = (flags >> 1) & 3
+                    length = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2+length]
+                    position = 2+length
+                    if qos > 0:
+                        packet_id = body[position:position+2]
+                        position = position + 2
+                    self.broker.publish(topic, body[position:], flags & 1 == 1)
+                    if qos == 1: self.send(0x40, packet_id)
+                    elif qos == 2: self.send(0x50, packet_id)
+                # PUBREL
+                elif packet_type == 6:
+                    self.send(0x70, body[:2])
+                # SUBSCRIBE
+                elif packet_type == 8:
+                    packet_id = body[:2]
+                    position = 2
+                    granted = ""
+                    topics = []
+                    while position < len(body):
+                        length = struct.unpack("!H", body[position:position+2])[0]
+                        topic = body[position+2:position+2+length]
+                        qos = ord(body[position+2+length])
+                        position = position+3+length
+                        self.subscriptions[topic] = qos
+                        topics.append(topic)
+                        granted = granted + chr(qos)
+                    self.broker.subscribes = self.broker.subscribes + len(topics)
+                    self.broker.subscribe_packets = self.broker.subscribe_packets + 1
+                    self.send(0x90, packet_id+granted)
+                    for topic in topics: self.broker.send_retained(self, topic)
+                # UNSUBSCRIBE
+                elif packet_type == 10:
+                    packet_id = body[:2]
+                    position = 2
+                    while position < len(body):
+                        length = struct.unpack("!H", body[position:position+2])[0]
+                        topic = body[position+2:position+2+length]
+                        position = position+2+length
+                        if topic in self.subscriptions: del self.subscriptions[topic]
+                    self.send(0xB0, packet_id)
+                # PINGREQ
+                elif packet_type == 12:
+                    self.send(0xD0, "")
+                # DISCONNECT
+                elif packet_type == 14:
+                    break
+        except Exception:
+            pass
+        self.close()
+
+    # drop the connection
+    def close(self):
+        self.running = False
+        self.broker.remove(self)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        self.sock.close()
+
+class Broker(threading.Thread):
+    def __init__(self, port=0):
+        super(Broker, self).__init__()
+        self.daemon = True
+        self.port = port
+        self.__listen()
+        # set while accepting connections
+        self.listening = threading.Event()
+        self.listening.set()
+        self.clients = []
+        self.retained = {}
+        self.lock = threading.Lock()
+        # when set, new connections are closed right away, e.g. to simulate an outage
+        self.refuse = False
+        # number of connections accepted, topics subscribed, subscribe packets received and messages published so far
+        self.connections = 0
+        self.subscribes = 0
+        self.subscribe_packets = 0
+        self.publishes = 0
+
+    # open the listening socket
+    def __listen(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", self.port))
+        self.server.listen(128)
+        self.port = self.server.getsockname()[1]
+
+    # point the modules created from now on to this broker
+    def configure(self):
+        os.environ["EGEOFFREY_GATEWAY_HOSTNAME"] = "127.0.0.1"
+        os.environ["EGEOFFREY_GATEWAY_PORT"] = str(self.port)
+        os.environ["EGEOFFREY_GATEWAY_TRANSPORT"] = "tcp"
+        os.environ["EGEOFFREY_GATEWAY_SSL"] = "0"
+
+    def run(self):
+        while True:
+            self.listening.wait()
+            try:
+                sock, address = self.server.accept()
+            except socket.error:
+                continue
+            if self.refuse:
+                sock.close()
+                continue
+            connection = Connection(self, sock)
+            with self.lock:
+                self.clients.append(connection)
+            connection.start()
+
+    # forget a connection
+    def remove(self, connection):
+        with self.lock:
+            if connection in self.clients: self.clients.remove(connection)
+
+    # simulate a restart of the broker: stop listening, drop all the connections and listen again after the given number of seconds
+    def restart(self, downtime):
+        self.listening.clear()
+        # wake up the accepting thread
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.server.close()
+        self.disconnect_all()
+        time.sleep(downtime)
+        self.__listen()
+        self.listening.set()
+
+    # drop all the connections, e.g. to simulate a broker restart
+    def disconnect_all(self):
+        with self.lock:
+            clients = list(self.clients)
+        for connection in clients: connection.close()
+
+    # deliver a message to all the subscribers and keep track of retained messages
+    def publish(self, topic, payload, retain):
+        self.publishes = self.publishes + 1
+        if retain:
+            with self.lock:
+                if payload == "": self.retained.pop(topic, None)
+                else: self.retained[topic] = payload
+        with self.lock:
+            clients = list(self.clients)
+        for connection in clients:
+            for subscription in connection.subscriptions.keys():
+                if mqtt.topic_matches_sub(subscription, topic):
+                    try:
+                        connection.deliver(topic, payload, False)
+                    except Exception:
+                        pass
+                    break
+
+    # send the retained messages matching a new subscription
+    def send_retained(self, connection, subscription):
+        with self.lock:
+            retained = self.retained.items()
+        for topic, payload in retained:
+            if mqtt.topic_matches_sub(subscription, topic): connection.deliver(topic, payload, True)
@@ -0,0 +1,52 @@
+### Benchmark the cache of a service: lookup cost, entries held when reading many distinct keys and device reads when many threads miss the same key
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.cache [keys] [threads]
+
+import sys
+import threading
+import time
+
+from sdk.python.module.helpers.cache import Cache
+
+# simulate a slow device read, counting the reads
+def read_device(reads):
+    with reads[1]:
+        reads[0] = reads[0] + 1
+    time.sleep(0.05)
+    return 21.5
+
+# look up the value with find() and get() and read it from the device if not there, as done before get_or_compute()
+def check_then_read(cache, key, reads):
+    if cache.find(key): return cache.get(key)
+    value = read_device(reads)
+    cache.add(key, value, 60)
+    return value
+
+# run the given function from the given number of threads at once and return the device reads
+def run_threads(count, function):
+    reads = [0, threading.Lock()]
+    threads = [threading.Thread(target=function, args=(reads,)) for i in range(count)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return reads[0]
+
+if __name__ == "__main__":
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # lookups of a key in the cache
+    cache = Cache()
+    cache.add("sensor", 21.5)
+    for name, lookup in [["find() + get()", lambda: cache.find("sensor") and cache.get("sensor")], ["get()", lambda: cache.get("sensor")], ["get_or_compute()", lambda: cache.get_or_compute("sensor", None)]]:
+        start = time.time()
+        for i in range(keys): lookup()
+        print "%-18s %.2f us per lookup" % (name, (time.time() - start)*1000000/keys)
+    # many distinct keys, e.g. a service polling sensors with different arguments
+    for max_size in [0, 1000]:
+        cache = Cache(max_size)
+        for i in range(keys): cache.add("sensor"+str(i), {"value": i}, 3600)
+        print "max_size=%-5d %d distinct keys: %d entries held, %s" % (max_size, keys, cache.get_stats()["size"], cache.get_stats())
+    # many consumers missing the same key at once
+    cache = Cache()
+    print "%d threads missing the same key: %d device reads with find()/add(), %d with get_or_compute()" % (threads, run_threads(threads, lambda reads: check_then_read(cache, "a", reads)), run_threads(threads, lambda reads: cache.get_or_compute("b", lambda: read_device(reads))))
@@ -0,0 +1,83 @@
+### Benchmark the time a module waiting for its configuration takes to start with and without the configuration snapshot
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.config_snapshot [configuration files] [replay delay in ms]
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+
+# module waiting for a set of configuration files before starting
+class Benchmark(Module):
+    def on_init(self):
+        self.configurations = 0
+        self.deleted = 0
+        for i in range(int(os.getenv("BENCHMARK_FILES"))):
+            self.add_configuration_listener("sensors/sensor"+str(i), 1, True)
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        if message.is_null: self.deleted = self.deleted + 1
+        else: self.configurations = self.configurations + 1
+
+# start the module while controller/config replays the configuration after the given delay, without the first deleted files. Return the time to start, the number of configurations delivered and deleted once the replay completed and those left in the snapshot
+def run(files, delay, snapshot_dir, version, deleted=0):
+    os.environ["EGEOFFREY_CONFIG_SNAPSHOT_DIR"] = snapshot_dir
+    module = Benchmark("service", "benchmark")
+    mqtt_client = module._Module__mqtt
+    # the replay of the retained configuration by the gateway, the last file has changed in the meantime
+    def replay():
+        time.sleep(delay)
+        for i in range(deleted, files):
+            payload = {"request_id": 1, "data": {"description": "sensor "+str(i), "unit": "C", "version": version if i == files-1 else 1}}
+            mqtt_client.receive("egeoffrey/v1/"+module.house_id+"/controller/config/*/*/CONF/1/sensors/sensor"+str(i), json.dumps(payload), True)
+    # the broker is not involved, subscribe the topics as the client would do once connected
+    start = time.time()
+    mqtt_client.load_snapshot()
+    for topic in mqtt_client.topics_to_subscribe: mqtt_client.topics_subscribed.add(topic, mqtt_client.topics_to_subscribe[topic])
+    for consumer in mqtt_client.consumers: consumer.start()
+    replayer = threading.Thread(target=replay)
+    replayer.start()
+    while not module.configured: time.sleep(0.001)
+    elapsed = time.time() - start
+    replayer.join()
+    for consumer in mqtt_client.consumers: consumer.queue.join()
+    # the replay is over, as it would be once the snapshot timeout expires, the files not replayed have been deleted
+    if snapshot_dir != "":
+        module.connected = True
+        mqtt_client.reconcile_snapshot()
+        for consumer in mqtt_client.consumers: consumer.queue.join()
+    for consumer in mqtt_client.consumers: consumer.join()
+    left = len(mqtt_client.snapshot.load()) if snapshot_dir != "" else 0
+    return elapsed, module.configurations, module.deleted, left
+
+if __name__ == "__main__":
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay = float(sys.argv[2])/1000 if len(sys.argv) > 2 else 2
+    os.environ["BENCHMARK_FILES"] = str(files)
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+        elapsed, configurations, deleted, left = run(files, delay, "", 1)
+        print "without snapshot: started in %.3f s, %d configurations delivered" % (elapsed, configurations)
+        # the first run with the snapshot enabled populates it
+        run(files, delay, snapshot_dir, 1)
+        elapsed, configurations, deleted, left = run(files, delay, snapshot_dir, 2)
+        print "with snapshot: started in %.3f s, %d configurations delivered (%d from the snapshot, 1 changed while offline)" % (elapsed, configurations, files)
+        elapsed, configurations, deleted, left = run(files, delay, snapshot_dir, 2, 1)
+        print "with snapshot: started in %.3f s, %d configurations delivered, %d deleted while offline, %d/%d left in the snapshot" % (elapsed, configurations, deleted, left, files)
+    finally:
+        shutil.rmtree(snapshot_dir)
@@ -0,0 +1,83 @@
+### Benchmark the throughput of the consumer threads with a deliberately slow handler and verify messages of the same sensor are consumed in order
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.consumer_threads [sensors] [messages per sensor] [handler delay in ms]
+
+import os
+import sys
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# module generating the traffic
+class Sender(Module):
+    def on_init(self):
+        pass
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# module with a slow on_message (e.g. doing network I/O) keeping track of the order messages are consumed
+class Benchmark(Module):
+    def on_init(self):
+        self.delay = 0
+        self.received = {}
+        self.lock = threading.Lock()
+        self.add_inspection_listener("+", "+", "+", "#")
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        time.sleep(self.delay)
+        with self.lock:
+            self.received.setdefault(message.args, []).append(message.get("sequence"))
+    def on_configuration(self, message):
+        pass
+
+# deliver the messages to the module and return the time spent (in seconds) until all of them are consumed and whether the order has been preserved
+def run(sender, threads, sensors, count, delay):
+    module = Benchmark("controller", "hub", consumer_threads=threads, shard_by="args")
+    module.delay = delay
+    mqtt_client = module._Module__mqtt
+    # the broker is not involved, just start the consumers and subscribe the topics
+    for topic in mqtt_client.topics_to_subscribe: mqtt_client.topics_subscribed.add(topic, mqtt_client.topics_to_subscribe[topic])
+    for consumer in mqtt_client.consumers: consumer.start()
+    # the sender is not connected so publishes are collected in the offline queue
+    sender_mqtt_client = sender._Module__mqtt
+    sender_mqtt_client.publish_queue = []
+    for i in range(count):
+        for j in range(sensors):
+            message = Message(sender)
+            message.recipient = "controller/hub"
+            message.command = "IN"
+            message.args = "sensor"+str(j)
+            message.set("sequence", i)
+            sender.send(message)
+    start = time.time()
+    for topic, payload, retain, qos in sender_mqtt_client.publish_queue: mqtt_client.receive(topic, payload, retain)
+    for consumer in mqtt_client.consumers: consumer.queue.join()
+    elapsed = time.time() - start
+    for consumer in mqtt_client.consumers: consumer.join()
+    ordered = len(module.received) == sensors and all([sequence == range(count) for sequence in module.received.values()])
+    return elapsed, ordered
+
+if __name__ == "__main__":
+    sensors = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    delay = float(sys.argv[3])/1000 if len(sys.argv) > 3 else 0.005
+    sender = Sender("service", "sensor")
+    for threads in [1, 2, 4, 8]:
+        elapsed, ordered = run(sender, threads, sensors, count, delay)
+        print str(threads)+" consumer threads: %.0f messages/s, per sensor ordering " % (sensors*count/elapsed)+("preserved" if ordered else "NOT preserved")
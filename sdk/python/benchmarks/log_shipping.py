@@ -0,0 +1,51 @@
+### Benchmark a module logging errors in a loop, shipping each log synchronously and through the asynchronous and rate limited pipeline, with and without batching
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.log_shipping [logs]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "1"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+
+# module just logging
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    for async_logging, log_batch in [[False, False], [True, False], [True, True]]:
+        os.environ["EGEOFFREY_ASYNC_LOGGING"] = "1" if async_logging else "0"
+        os.environ["EGEOFFREY_LOG_BATCH"] = "1" if log_batch else "0"
+        module = Benchmark("service", "logger"+str(int(async_logging))+str(int(log_batch)))
+        module.daemon = True
+        module.start()
+        while not module.started or not module.connected: time.sleep(0.01)
+        time.sleep(1)
+        publishes = broker.publishes
+        # a module stuck in an error loop
+        start = time.time()
+        for i in range(count): module.log_error("unable to read from the device: timeout ("+str(i)+")")
+        elapsed = time.time() - start
+        module.flush_logs()
+        time.sleep(1)
+        print "async_logging=%-5s log_batch=%-5s %d errors logged: %6.1f us per log in the caller, %5d publishes to the gateway, %s" % (async_logging, log_batch, count, elapsed*1000000/count, broker.publishes - publishes, module.get_log_stats())
+        module.join()
@@ -0,0 +1,72 @@
+### Benchmark the round trip between two modules of the same process through the gateway and with the loopback delivery
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.loopback [round trips]
+
+import os
+import sys
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# module replying to any PING_BENCH request and notifying the replies received
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+        self.replied = threading.Event()
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        if message.command == "BENCH_REQUEST":
+            message.reply()
+            message.command = "BENCH_REPLY"
+            message.set("value", 21.5)
+            self.send(message)
+        elif message.command == "BENCH_REPLY":
+            self.replied.set()
+    def on_configuration(self, message):
+        pass
+
+# run the round trips and return the average and 99th percentile latency in microseconds
+def run(requester, count):
+    latencies = []
+    for i in range(count):
+        message = Message(requester)
+        message.recipient = "service/responder"
+        message.command = "BENCH_REQUEST"
+        message.set("value", i)
+        requester.replied.clear()
+        start = time.time()
+        requester.send(message)
+        # waiting without a timeout, python 2 would poll the event otherwise
+        requester.replied.wait()
+        latencies.append((time.time() - start)*1000000)
+    latencies.sort()
+    return sum(latencies)/len(latencies), latencies[int(len(latencies)*0.99)]
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    requester = Benchmark("service", "requester")
+    responder = Benchmark("service", "responder")
+    for module in [requester, responder]:
+        module.daemon = True
+        module.start()
+    while not requester.started or not responder.started or not requester.connected or not responder.connected: time.sleep(0.01)
+    time.sleep(0.5)
+    for loopback in [False, True]:
+        requester.loopback = responder.loopback = loopback
+        publishes = broker.publishes
+        average, percentile = run(requester, count)
+        print "loopback="+str(loopback)+": round trip average %.0f us, 99th percentile %.0f us, %d messages through the broker" % (average, percentile, broker.publishes - publishes)
@@ -0,0 +1,63 @@
+### Benchmark memory footprint and construction time of a Message, compared with the previous dictionary-based implementation
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.message_alloc [iterations]
+
+import os
+import sys
+import gc
+import time
+import struct
+
+from sdk.python.module.helpers.message import Message
+
+# replica of the previous implementation: per-instance __dict__ and a syscall per request_id
+class Legacy_message():
+    def __init__(self, module=None):
+        self.topic = ""
+        self.house_id = ""
+        self.sender = ""
+        self.recipient = ""
+        self.command = ""
+        self.args = ""
+        self.config_schema = None
+        self.payload = {}
+        self.payload = {"request_id": 0, "data": {}}
+        self.payload["request_id"] = struct.unpack("<L", os.urandom(4))[0]
+        self.is_null = False
+        self.retain = False
+        if module is not None:
+            self.sender = module.fullname
+            self.house_id = module.house_id
+
+# module-like object providing what a message needs
+class Sender():
+    def __init__(self):
+        self.fullname = "system/benchmark"
+        self.house_id = "house"
+
+# return the memory used by an instance, including its __dict__ if any
+def get_size(instance):
+    size = sys.getsizeof(instance)
+    if hasattr(instance, "__dict__"): size = size + sys.getsizeof(instance.__dict__)
+    return size
+
+# build a log message as Module.__log() does and return the average time (in microseconds) per message
+def run(cls, iterations):
+    sender = Sender()
+    gc.disable()
+    start = time.time()
+    for i in range(iterations):
+        message = cls(sender)
+        message.recipient = "controller/logger"
+        message.command = "LOG"
+        message.args = "debug"
+    elapsed = time.time() - start
+    gc.enable()
+    return elapsed/iterations*1000000
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for cls in [Legacy_message, Message]:
+        print cls.__name__+": "+str(get_size(cls(Sender())))+" bytes/instance (excluding payload), "+"%.2f" % run(cls, iterations)+" us/message"
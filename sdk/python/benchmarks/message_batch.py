@@ -0,0 +1,71 @@
+### Benchmark sending a bulk of sensor updates individually and as a batch, and unpacking them on the receiving side
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.message_batch [sensors] [iterations]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+from sdk.python.module.helpers.mqtt_client import Mqtt_client
+
+# minimal module used to send and receive the messages
+class Benchmark(Module):
+    def on_init(self):
+        pass
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# return the messages generated by a single bus scan
+def get_messages(module, sensors):
+    messages = []
+    for i in range(sensors):
+        message = Message(module)
+        message.recipient = "controller/hub"
+        message.command = "IN"
+        message.args = "sensor"+str(i)
+        message.set("value", 20+i%10)
+        messages.append(message)
+    return messages
+
+# send the messages and return the number of publishes and the time spent (in milliseconds) including the recipient's unpacking and decoding
+def run(module, receiver, sensors, iterations, batch):
+    # the module is not connected so publishes are collected in the offline queue
+    mqtt_client = module._Module__mqtt
+    mqtt_client.publish_queue = []
+    elapsed = 0
+    for i in range(iterations):
+        messages = get_messages(module, sensors)
+        start = time.time()
+        if batch: module.send_batch(messages)
+        else:
+            for message in messages: module.send(message)
+        for topic, payload, retain, qos in mqtt_client.publish_queue: receiver.receive(topic, payload, retain)
+        # decode the payloads as the consumer thread would do
+        for consumer in receiver.consumers:
+            while not consumer.queue.empty(): consumer.queue.get_nowait().get_data(copy=False)
+        elapsed = elapsed + time.time() - start
+        publishes = len(mqtt_client.publish_queue)
+        mqtt_client.publish_queue = []
+    return publishes, elapsed/iterations*1000
+
+if __name__ == "__main__":
+    sensors = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    module = Benchmark("service", "benchmark")
+    receiver = Mqtt_client(Benchmark("controller", "hub"))
+    for batch in [False, True]:
+        publishes, elapsed = run(module, receiver, sensors, iterations, batch)
+        print "batch="+str(batch)+": "+str(publishes)+" publishes, %.2f ms per scan of " % elapsed+str(sensors)+" sensors (send, unpack and decode)"
@@ -0,0 +1,68 @@
+### Benchmark the time spent by the mqtt network thread for each incoming message, with eager and lazy payload decoding
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.message_parse [iterations]
+
+import os
+import sys
+import json
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.mqtt_client import Mqtt_client
+
+# minimal module used to host the mqtt client
+class Benchmark(Module):
+    def on_init(self):
+        pass
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# build a representative sample of the traffic seen on a busy bus
+def get_traffic(house_id):
+    sensor = {"request_id": 1234, "data": {"value": 21.5, "timestamp": 1571234567}}
+    config = {"request_id": 1234, "data": {"description": "Temperature", "format": "float_1", "unit": "C", "service": {"name": "weather", "mode": "pull", "schedule": {"trigger": "cron", "minute": "*/10"}, "configuration": {"latitude": 45.1, "longitude": 9.2}}, "retention": {"realtime_new_only": True}}}
+    manifest = {"request_id": 1234, "data": {"package": "egeoffrey-service-weather", "modules": [{"service/weather": {"description": "weather"}}]*20, "default_config": [{"sensors/s"+str(i)+".1": config["data"]} for i in range(50)]}}
+    traffic = []
+    # measures delivered to this module
+    traffic.append(["egeoffrey/v1/"+house_id+"/service/weather/controller/hub/IN/outdoor/temperature", json.dumps(sensor)])
+    # configuration broadcasted to everybody
+    traffic.append(["egeoffrey/v1/"+house_id+"/controller/config/*/*/CONF/1/sensors/outdoor/temperature", json.dumps(config)])
+    # inspection traffic
+    traffic.append(["egeoffrey/v1/"+house_id+"/controller/hub/controller/db/SAVE/outdoor/temperature", json.dumps(sensor)])
+    # large broadcast
+    traffic.append(["egeoffrey/v1/"+house_id+"/system/watchdog-weather/*/*/MANIFEST/egeoffrey-service-weather", json.dumps(manifest)])
+    # message for another house
+    traffic.append(["egeoffrey/v1/other_house/controller/config/*/*/CONF/1/sensors/outdoor/temperature", json.dumps(config)])
+    return traffic
+
+# feed the traffic to the mqtt client and return the average time (in microseconds) spent per message
+def run(mqtt_client, traffic, iterations):
+    elapsed = 0
+    for i in range(iterations):
+        start = time.time()
+        for entry in traffic:
+            mqtt_client.receive(entry[0], entry[1], False)
+        elapsed = elapsed + time.time() - start
+        # drain the queue as the consumer thread would do
+        for consumer in mqtt_client.consumers:
+            while not consumer.queue.empty(): consumer.queue.get_nowait()
+    return elapsed/(iterations*len(traffic))*1000000
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    module = Benchmark("system", "benchmark")
+    mqtt_client = Mqtt_client(module)
+    traffic = get_traffic(module.house_id)
+    for lazy in [False, True]:
+        module.lazy_payload = lazy
+        print "lazy_payload="+str(lazy)+": "+"%.2f" % run(mqtt_client, traffic, iterations)+" us/message in the network thread"
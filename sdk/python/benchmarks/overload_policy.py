@@ -0,0 +1,77 @@
+### Benchmark the overload policies on a module with a slow handler flooded with sensor updates
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.overload_policy [sensors] [messages per sensor] [handler delay in ms]
+
+import os
+import sys
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# minimal module with a slow on_message keeping track of the latest value received for each sensor
+class Benchmark(Module):
+    def on_init(self):
+        self.delay = 0
+        self.latest = {}
+        self.add_inspection_listener("+/+", "+/+", "+", "#")
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        time.sleep(self.delay)
+        self.latest[message.args] = message.get("value")
+    def on_configuration(self, message):
+        pass
+
+# flood the module and return the time to consume the messages, the max queue size, the messages consumed, the shed stats and the sensors whose latest value was delivered
+def run(sender, policy, sensors, count, delay):
+    module = Benchmark("controller", "hub")
+    module.delay = delay
+    module.overload_policy = policy
+    module.queue_low_watermark = 50
+    module.queue_high_watermark = 200
+    mqtt_client = module._Module__mqtt
+    # the broker is not involved, just start the consumers and subscribe the topics
+    for topic in mqtt_client.topics_to_subscribe: mqtt_client.topics_subscribed.add(topic, mqtt_client.topics_to_subscribe[topic])
+    for consumer in mqtt_client.consumers: consumer.start()
+    # the sender is not connected so publishes are collected in the offline queue
+    sender_mqtt_client = sender._Module__mqtt
+    sender_mqtt_client.publish_queue = []
+    for i in range(count):
+        for j in range(sensors):
+            message = Message(sender)
+            message.recipient = "controller/hub"
+            message.command = "IN"
+            message.args = "sensor"+str(j)
+            message.set("value", i)
+            sender.send(message)
+    max_size = 0
+    start = time.time()
+    for topic, payload, retain, qos in sender_mqtt_client.publish_queue:
+        # as the broker would, do not deliver the messages of the topics paused by the overload policy
+        if len([pattern for pattern, listener in mqtt_client.topics_subscribed.match(topic) if pattern not in mqtt_client.paused_topics]) == 0: continue
+        mqtt_client.receive(topic, payload, retain)
+        max_size = max(max_size, mqtt_client.get_queue_size())
+    for consumer in mqtt_client.consumers: consumer.queue.join()
+    elapsed = time.time() - start
+    for consumer in mqtt_client.consumers: consumer.join()
+    latest = len([value for value in module.latest.values() if value == count-1])
+    return elapsed, max_size, module.get_consumer_stats()["data"]["consumed"], module.get_overload_stats(), latest
+
+if __name__ == "__main__":
+    sensors = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    delay = float(sys.argv[3])/1000 if len(sys.argv) > 3 else 0.001
+    sender = Benchmark("service", "sensor")
+    for policy in ["drop_oldest", "drop_newest", "coalesce", "pause"]:
+        elapsed, max_size, consumed, stats, latest = run(sender, policy, sensors, count, delay)
+        shed = dict([[key, value] for key, value in stats.items() if value > 0])
+        print "%-12s %5.2f s, max queue %4d, consumed %4d/%d, latest value delivered for %d/%d sensors, shed: %s" % (policy, elapsed, max_size, consumed, sensors*count, latest, sensors, shed)
@@ -0,0 +1,43 @@
+### Benchmark size and speed of the available payload codecs on typical eGeoffrey payloads
+## DEPENDENCIES:
+# OS:
+# Python: msgpack (optional)
+## USAGE: python -m sdk.python.benchmarks.payload_codec [iterations]
+
+import sys
+import time
+import yaml
+
+import sdk.python.module.helpers.codec as codec
+
+# return the typical payloads exchanged on the bus
+def get_payloads():
+    payloads = {}
+    # a measure sent by a service to the hub
+    payloads["sensor IN"] = {"request_id": 5546928787947522, "data": {"value": 21.5, "timestamp": 1571234567}}
+    # a sensor configuration file
+    payloads["CONF"] = {"request_id": 5546928787947522, "data": {"description": "Outdoor temperature", "icon": "thermometer-half", "format": "float_1", "unit": "C", "retain": True, "service": {"name": "openweathermap", "mode": "pull", "schedule": {"trigger": "cron", "minute": "*/10"}, "configuration": {"type": "temperature", "latitude": 45.4642, "longitude": 9.19}}, "retention": {"realtime_new_only": True, "realtime_count": 10000, "recent_values": 7, "history_days": 365}}}
+    # the manifest published by the watchdog with the default configuration embedded
+    with open("sdk/manifest.yml") as f: manifest = yaml.load(f.read(), Loader=yaml.SafeLoader)
+    manifest["sdk"] = dict(manifest)
+    manifest["modules"] = [{"service/openweathermap": {"description": "retrieve weather information", "service_configuration": {"pull": [{"parameter": "type", "name": "Type", "required": True, "format": "string"}]}}}]
+    manifest["default_config"] = [{"sensors/outdoor/sensor"+str(i)+".1": payloads["CONF"]["data"]} for i in range(30)]
+    payloads["manifest"] = {"request_id": 5546928787947522, "data": manifest}
+    return payloads
+
+# return the average time (in microseconds) to run function(argument)
+def measure(function, argument, iterations):
+    start = time.time()
+    for i in range(iterations): function(argument)
+    return (time.time() - start)/iterations*1000000
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    names = [codec.DEFAULT] + sorted(codec.codecs.keys())
+    for title, payload in sorted(get_payloads().items()):
+        print title+":"
+        for name in names:
+            raw = codec.encode(payload, name)
+            encode_time = measure(lambda p: codec.encode(p, name), payload, iterations)
+            decode_time = measure(codec.decode, raw, iterations)
+            print "  %-8s %7d bytes  encode %8.2f us  decode %8.2f us" % (name, len(raw), encode_time, decode_time)
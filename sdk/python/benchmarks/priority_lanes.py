@@ -0,0 +1,67 @@
+### Benchmark the time a PING waits in the queue of a module flooded with data messages
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.priority_lanes [data messages] [handler delay in ms]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# minimal module with a slow on_message
+class Benchmark(Module):
+    def on_init(self):
+        self.delay = 0
+        self.add_inspection_listener("+", "+", "+", "#")
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        time.sleep(self.delay)
+    def on_configuration(self, message):
+        pass
+
+# flood the module with data messages followed by a ping and return the stats of the consumers
+def run(sender, control_commands, count, delay):
+    module = Benchmark("controller", "hub")
+    module.delay = delay
+    mqtt_client = module._Module__mqtt
+    mqtt_client.control_commands = control_commands
+    # the broker is not involved, just start the consumers and subscribe the topics
+    for topic in mqtt_client.topics_to_subscribe: mqtt_client.topics_subscribed.add(topic, mqtt_client.topics_to_subscribe[topic])
+    # the sender is not connected so publishes are collected in the offline queue
+    sender_mqtt_client = sender._Module__mqtt
+    sender_mqtt_client.publish_queue = []
+    for i in range(count):
+        message = Message(sender)
+        message.recipient = "controller/hub"
+        message.command = "IN"
+        message.args = "sensor"+str(i)
+        message.set("value", i)
+        sender.send(message)
+    message = Message(sender)
+    message.recipient = "controller/hub"
+    message.command = "PING"
+    sender.send(message)
+    for topic, payload, retain, qos in sender_mqtt_client.publish_queue: mqtt_client.receive(topic, payload, retain)
+    for consumer in mqtt_client.consumers: consumer.start()
+    for consumer in mqtt_client.consumers: consumer.queue.join()
+    for consumer in mqtt_client.consumers: consumer.join()
+    return module.get_consumer_stats()
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    delay = float(sys.argv[2])/1000 if len(sys.argv) > 2 else 0.002
+    sender = Benchmark("system", "watchdog")
+    # without control commands every message goes through the data lane, i.e. first in first out
+    for title, control_commands in [["fifo", []], ["priority", ["CONF", "PING", "PONG", "STATUS"]]]:
+        stats = run(sender, control_commands, count, delay)
+        ping = stats["control"] if len(control_commands) > 0 else stats["data"]
+        print title+": ping queue wait %.1f ms, data queue wait avg %.1f ms, data handler time avg %.1f ms" % (ping["queue_wait_max"]*1000, stats["data"]["queue_wait_avg"]*1000, stats["data"]["handler_time_avg"]*1000)
@@ -0,0 +1,94 @@
+### Benchmark the overhead of profiling a busy module and verify the time spent in its handler and in its scheduled jobs is reported
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt, APScheduler
+## USAGE: python -m sdk.python.benchmarks.profiler [messages]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+# never shed the messages queued behind the slow handler
+os.environ["EGEOFFREY_QUEUE_HIGH_WATERMARK"] = "1000000"
+os.environ["EGEOFFREY_QUEUE_RESTART_WATERMARK"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+from sdk.python.module.helpers.profiler import Profiler
+from sdk.python.module.helpers.scheduler import Scheduler
+
+# cpu bound work, e.g. parsing a reading
+def crunch(count):
+    total = 0
+    for i in xrange(count): total = total + i * i % 7
+    return total
+
+# module doing some work for every message received and in a scheduled job
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+        self.received = 0
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        crunch(2000)
+        self.received = self.received + 1
+    def on_configuration(self, message):
+        pass
+    def poll(self):
+        crunch(200000)
+
+# send count messages to the sensor and return the time in seconds until all of them are consumed
+def run_once(requester, sensor, count):
+    sensor.received = 0
+    start = time.time()
+    for i in range(count):
+        message = Message(requester)
+        message.recipient = sensor.fullname
+        message.command = "IN"
+        message.set("value", i)
+        requester.send(message)
+    while sensor.received < count: time.sleep(0.001)
+    return time.time() - start
+
+# return the best time of a few runs, so to smooth out the scheduled job competing for the interpreter
+def run(requester, sensor, count):
+    return min([run_once(requester, sensor, count) for i in range(3)])
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    modules = []
+    for name in ["requester", "sensor"]:
+        module = Benchmark("service", name)
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.01)
+    requester, sensor = modules
+    scheduler = Scheduler(sensor)
+    scheduler.add_job({"trigger": "interval", "seconds": 0.2, "func": sensor.poll})
+    run_once(requester, sensor, count)
+    baseline = run(requester, sensor, count)
+    print "no profiler:        %.0f messages per second" % (count / baseline)
+    for interval in [0.01, 0.001]:
+        profiler = Profiler(sensor.get_thread_ids, 3600, interval)
+        profiler.start()
+        elapsed = run(requester, sensor, count)
+        profiler.stop()
+        profiler.join()
+        print "profiling every %.0fms: %.0f messages per second (%+.1f%%), %d samples" % (interval * 1000, count / elapsed, (baseline / elapsed - 1) * 100, profiler.samples)
+    stats = profiler.get_stats(5, True)
+    print "top functions by self samples, %d threads profiled:" % stats["threads"]
+    for function, samples, percentage in stats["top_self"]: print "  %5.1f%% %s" % (percentage, function)
+    lines = stats["collapsed"].split("\n")
+    print "collapsed stacks: %d lines, %.1f%% of the samples in the scheduled job" % (len(lines), 100.0 * sum([int(line.split(" ")[-1]) for line in lines if "poll (" in line]) / stats["samples"])
+    scheduler.stop()
+    for module in modules: module.join()
@@ -0,0 +1,79 @@
+### Benchmark the publish throughput for each QoS level, publishing from the caller's thread and through the asynchronous publishing pipeline
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.publish_qos [messages]
+
+import os
+import sys
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+# each module needs its own connection so to compare the two publishing modes
+os.environ["EGEOFFREY_SHARED_CONNECTION"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# module just publishing
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# publish the messages with the given QoS level, return the time spent by the caller and the time until all the messages have been delivered
+def run(module, qos, count, received):
+    received[0] = 0
+    start = time.time()
+    for i in range(count):
+        message = Message(module)
+        message.recipient = "service/receiver"
+        message.command = "BENCH"
+        message.args = str(i)
+        message.qos = qos
+        message.set("value", i)
+        module.send(message)
+    sent = time.time() - start
+    while received[0] < count and time.time() - start < 60: time.sleep(0.001)
+    return sent, time.time() - start
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    # count the messages delivered by the broker
+    received = [0]
+    lock = threading.Lock()
+    def on_message(client, userdata, msg):
+        with lock:
+            received[0] = received[0] + 1
+    receiver = mqtt.Client(client_id="benchmark-receiver")
+    receiver.on_message = on_message
+    receiver.connect("127.0.0.1", broker.port)
+    receiver.subscribe("egeoffrey/+/+/+/+/service/receiver/BENCH/#", qos=0)
+    receiver.loop_start()
+    for async_publish in [False, True]:
+        os.environ["EGEOFFREY_ASYNC_PUBLISH"] = "1" if async_publish else "0"
+        module = Benchmark("service", "sender"+str(int(async_publish)))
+        module.daemon = True
+        module.start()
+        while not module.started or not module.connected: time.sleep(0.01)
+        time.sleep(0.5)
+        for qos in range(0, 3):
+            sent, delivered = run(module, qos, count, received)
+            print "async_publish=%-5s qos %d: %6.0f msg/s handed over by the caller, %6.0f msg/s delivered (%d/%d)" % (async_publish, qos, count/sent, received[0]/delivered, received[0], count)
+        stats = module.get_publish_stats()
+        if stats is not None: print "    published by qos %s, dropped %d" % (stats["published"], stats["dropped"])
+        module.join()
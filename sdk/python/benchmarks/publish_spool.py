@@ -0,0 +1,97 @@
+### Benchmark the messages surviving a gateway outage and a restart of the module, with the in-memory queue and with the disk spool
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.publish_spool [messages]
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# module just publishing
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# start the module and wait for it to be connected
+def start():
+    module = Benchmark("service", "sensor")
+    module.daemon = True
+    module.start()
+    while not module.started or not module.connected: time.sleep(0.01)
+    return module
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    # keep track of the measures delivered by the broker
+    received = []
+    last_received = [0]
+    def on_message(client, userdata, msg):
+        received.append(int(msg.topic.split("/")[-1]))
+        last_received[0] = time.time()
+    # subscribe again when reconnecting after the outage
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe("egeoffrey/+/+/+/+/controller/hub/IN/#", qos=0)
+    receiver = mqtt.Client(client_id="benchmark-receiver")
+    receiver.on_message = on_message
+    receiver.on_connect = on_connect
+    receiver.reconnect_delay_set(0.1, 0.1)
+    receiver.connect("127.0.0.1", broker.port)
+    receiver.loop_start()
+    for spool, restart in [[False, False], [False, True], [True, False], [True, True]]:
+        directory = tempfile.mkdtemp()
+        os.environ["EGEOFFREY_SPOOL_DIR"] = directory if spool else ""
+        del received[:]
+        module = start()
+        # simulate an outage of the gateway
+        broker.refuse = True
+        broker.disconnect_all()
+        while module.connected: time.sleep(0.01)
+        for i in range(count):
+            message = Message(module)
+            message.recipient = "controller/hub"
+            message.command = "IN"
+            message.args = str(i)
+            message.set("value", i)
+            module.send(message)
+        # the module may be restarted while the gateway is still down, which comes back shortly after
+        if restart:
+            module.join()
+            module = Benchmark("service", "sensor")
+            module.daemon = True
+            module.start()
+        time.sleep(0.5)
+        broker.refuse = False
+        while not module.connected: time.sleep(0.01)
+        connected = time.time()
+        # wait for the deliveries to stop
+        delivered = -1
+        while len(received) != delivered:
+            delivered = len(received)
+            time.sleep(2)
+        elapsed = max(0, last_received[0] - connected)
+        print "spool=%-5s restart=%-5s %4d/%d measures delivered after the outage in %4.1f s, in order: %s, spool: %s" % (spool, restart, len(received), count, elapsed, received == sorted(received), module.get_spool_stats())
+        module.join()
+        shutil.rmtree(directory)
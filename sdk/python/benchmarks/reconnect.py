@@ -0,0 +1,72 @@
+### Benchmark the time N modules take to reconnect and subscribe again all their topics after a restart of the gateway
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.reconnect [modules] [downtime]
+
+import os
+import sys
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+# each module has its own connection, as when running in different processes
+os.environ["EGEOFFREY_SHARED_CONNECTION"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+
+# module subscribing a few topics
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+        self.add_broadcast_listener("+/+", "STATUS", "#")
+        self.add_broadcast_listener("controller/hub", "SET", "#")
+        self.add_configuration_listener("house", 1)
+    def on_start(self):
+        self.started = True
+        # subscribed while connected
+        self.add_request_listener("controller/alerter", "RUN", "#")
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# return the number of modules connected to the broker with all their topics subscribed
+def get_recovered(broker, topics):
+    with broker.lock:
+        clients = list(broker.clients)
+    return len([connection for connection in clients if len(connection.subscriptions) >= topics])
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    downtime = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    modules = []
+    for i in range(count):
+        module = Benchmark("service", "bench"+str(i))
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.01)
+    # the request listener added in on_start() and the one added by the module itself
+    topics = 5
+    while get_recovered(broker, topics) < count: time.sleep(0.01)
+    # restart the gateway
+    connections = broker.connections
+    subscribe_packets = broker.subscribe_packets
+    broker.restart(downtime)
+    restarted = time.time()
+    # measure the time until each module is back with all its topics
+    recovered = []
+    while len(recovered) < count and time.time() - restarted < 120:
+        ready = get_recovered(broker, topics)
+        while len(recovered) < ready: recovered.append(time.time() - restarted)
+        time.sleep(0.01)
+    if len(recovered) == 0: recovered.append(0)
+    print "%d modules, gateway down for %.1f s: first recovered after %.2f s, half after %.2f s, %d/%d after %.2f s, %d connection attempts accepted, %.1f subscribe packets per module" % (count, downtime, recovered[0], recovered[len(recovered)/2], len(recovered), count, recovered[-1], broker.connections - connections, float(broker.subscribe_packets - subscribe_packets)/count)
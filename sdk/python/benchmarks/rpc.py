@@ -0,0 +1,86 @@
+### Benchmark querying N modules one after the other with request() and all at once with request_many()
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.rpc [modules] [rounds]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+import sdk.python.module.helpers.event_loop as event_loop
+
+# module replying to any BENCH_REQUEST after 20ms, as if reading a sensor
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        if message.command == "BENCH_REQUEST":
+            time.sleep(0.02)
+            message.reply()
+            message.set("value", 21.5)
+            self.send(message)
+    def on_configuration(self, message):
+        pass
+
+# return a new request for the given module
+def get_request(requester, recipient):
+    message = Message(requester)
+    message.recipient = recipient
+    message.command = "BENCH_REQUEST"
+    return message
+
+# query the given modules and return the number of replies received and the time spent in milliseconds
+def run(requester, recipients, many, timeout):
+    replies = 0
+    start = time.time()
+    if many:
+        future = requester.request_many(get_request(requester, None), recipients, timeout)
+        future.wait()
+        replies = len(future.result())
+    else:
+        for recipient in recipients:
+            future = requester.request(get_request(requester, recipient), timeout)
+            future.wait()
+            if future.exception() is None: replies = replies + 1
+    return replies, (time.time() - start) * 1000
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    modules = []
+    for name in ["requester"] + ["sensor"+str(i) for i in range(count)]:
+        module = Benchmark("service", name)
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.01)
+    time.sleep(0.5)
+    requester = modules[0]
+    recipients = [module.fullname for module in modules[1:]]
+    for many in [False, True]:
+        elapsed = 0
+        for i in range(rounds):
+            replies, spent = run(requester, recipients, many, 5)
+            elapsed = elapsed + spent
+        print "%-14s %d/%d replies in %6.1f ms per round" % ("request_many()" if many else "request()", replies, count, elapsed/rounds)
+    # a module not running, the replies of the others are gathered upon timeout
+    replies, spent = run(requester, recipients + ["service/missing"], True, 1)
+    print "%-14s %d/%d replies in %6.1f ms with a recipient not running and a timeout of 1 s" % ("request_many()", replies, count+1, spent)
+    for module in modules: module.join()
+    # stop the event loop keeping track of the timeouts
+    event_loop.get().stop()
+    event_loop.get().join()
@@ -0,0 +1,73 @@
+### Benchmark the memory held by the sessions of requests never replied, with an unbounded session store and with ttl and maximum size
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.session_store [requests] [ttl] [max size]
+
+import os
+import sys
+import json
+import subprocess
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+# return the resident memory of this process in kB
+def get_memory():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1])
+    return 0
+
+# register the sessions of requests whose replies never arrive and print the measures as json (run in a dedicated process)
+def run(count, ttl, max_size):
+    os.environ["EGEOFFREY_SESSION_TTL"] = str(ttl)
+    os.environ["EGEOFFREY_SESSION_MAX_SIZE"] = str(max_size)
+    from sdk.python.module.module import Module
+    from sdk.python.module.helpers.message import Message
+    # module just keeping track of its requests
+    class Benchmark(Module):
+        def on_init(self):
+            pass
+        def on_start(self):
+            pass
+        def on_stop(self):
+            pass
+        def on_message(self, message):
+            pass
+        def on_configuration(self, message):
+            pass
+    module = Benchmark("controller", "alerter")
+    timeouts = [0]
+    def on_expire(request_id, session):
+        timeouts[0] = timeouts[0] + 1
+    memory = get_memory()
+    elapsed = 0
+    # requests sent over time, e.g. by a long running controller
+    for i in range(count):
+        start = time.time()
+        message = Message(module)
+        message.recipient = "controller/db"
+        message.command = "GET"
+        message.args = "sensor"+str(i % 100)
+        module.sessions.register(message, {"rule": "rule"+str(i % 100), "sensor": "sensor"+str(i % 100), "values": range(10)}, on_expire)
+        elapsed = elapsed + time.time() - start
+        if ttl > 0 and i % (count/10) == 0: time.sleep(ttl/10.0)
+    # let the last sessions expire
+    if ttl > 0: time.sleep(ttl + 0.5)
+    result = module.get_session_stats()
+    result.update({"memory": get_memory() - memory, "elapsed": elapsed, "timeouts": timeouts[0]})
+    print json.dumps(result)
+    os._exit(0)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run(int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4]))
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    ttl = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    max_size = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    for settings in [[0, 0], [ttl, max_size]]:
+        output = subprocess.check_output([sys.executable, "-m", "sdk.python.benchmarks.session_store", "--child", str(count), str(settings[0]), str(settings[1])])
+        result = json.loads(output.strip().split("\n")[-1])
+        print "ttl=%-4s max_size=%-6d %d requests never replied: %6d kB held, %6d active, %6d expired, %6d evicted, %6d timeout callbacks, %.1f us per register" % (settings[0], settings[1], count, result["memory"], result["active"], result["expired"], result["evicted"], result["timeouts"], result["elapsed"]*1000000/count)
@@ -0,0 +1,66 @@
+### Benchmark the requests to a provider when N services of the same process poll the same data at once, each with its own cache and with a shared cache
+## DEPENDENCIES:
+# OS:
+# Python: apscheduler
+## USAGE: python -m sdk.python.benchmarks.shared_cache [modules] [polls]
+
+import os
+import sys
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.service import Service
+from sdk.python.module.helpers.cache import cached
+
+# requests made to the provider so far
+requests = [0]
+lock = threading.Lock()
+
+# simulate a slow request to a weather provider
+def fetch(city):
+    with lock:
+        requests[0] = requests[0] + 1
+    time.sleep(0.1)
+    return {"city": city, "temperature": 21.5, "humidity": 40}
+
+# services polling the forecast of a city, e.g. one per sensor
+class Private(Service):
+    def on_init(self):
+        pass
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+    @cached(600)
+    def get_forecast(self, city):
+        return fetch(city)
+
+class Shared(Private):
+    @cached(600, namespace="weather")
+    def get_forecast(self, city):
+        return fetch(city)
+
+# poll the forecast from all the modules at once, the given number of times, and return the requests made to the provider and the time spent
+def run(modules, polls):
+    requests[0] = 0
+    start = time.time()
+    for i in range(polls):
+        threads = [threading.Thread(target=module.get_forecast, args=("rome",)) for module in modules]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+    return requests[0], time.time() - start
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    polls = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for base in [Private, Shared]:
+        modules = [base("service", "weather"+str(i)) for i in range(count)]
+        fetched, elapsed = run(modules, polls)
+        print "%-7s cache: %d modules polling %d times, %3d requests to the provider in %.2f s" % (base.__name__.lower(), count, polls, fetched, elapsed)
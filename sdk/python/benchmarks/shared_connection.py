@@ -0,0 +1,64 @@
+### Benchmark startup time and broker connections of N modules each with its own connection and sharing a single one
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.shared_connection [modules]
+
+import os
+import sys
+import json
+import subprocess
+import threading
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+# start the modules and print the measures as json (run in a dedicated process)
+def run(count):
+    from sdk.python.module.module import Module
+    # minimal module subscribing a few topics
+    class Benchmark(Module):
+        def on_init(self):
+            self.started = False
+            self.add_broadcast_listener("+/+", "STATUS", "#")
+            self.add_configuration_listener("house", 1)
+        def on_start(self):
+            self.started = True
+        def on_stop(self):
+            pass
+        def on_message(self, message):
+            pass
+        def on_configuration(self, message):
+            pass
+    start = time.time()
+    modules = []
+    for i in range(count):
+        module = Benchmark("service", "bench"+str(i))
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.001)
+    startup = time.time() - start
+    threads = threading.active_count()
+    # give the subscriptions the time to reach the broker
+    time.sleep(1)
+    print json.dumps({"startup": startup, "threads": threads})
+    sys.stdout.flush()
+    os._exit(0)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run(int(sys.argv[2]))
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    from sdk.python.benchmarks.broker import Broker
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    for shared in [False, True]:
+        os.environ["EGEOFFREY_SHARED_CONNECTION"] = "1" if shared else "0"
+        connections = broker.connections
+        subscribes = broker.subscribes
+        output = subprocess.check_output([sys.executable, "-m", "sdk.python.benchmarks.shared_connection", "--child", str(count)])
+        result = json.loads(output.strip().split("\n")[-1])
+        print "shared="+str(shared)+": %d modules started in %.3f s, %d broker connections, %d subscribe requests, %d threads" % (count, result["startup"], broker.connections - connections, broker.subscribes - subscribes, result["threads"])
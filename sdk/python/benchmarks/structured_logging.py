@@ -0,0 +1,48 @@
+### Benchmark the cost in the caller of logging a sensor's configuration, building the string eagerly and with the structured logger, with debug off and on
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.structured_logging [logs]
+
+import os
+import sys
+import time
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "1"
+# do not rate limit the logs so to measure all of them
+os.environ["EGEOFFREY_LOG_RATE"] = "0"
+os.environ["EGEOFFREY_LOG_FLUSH_INTERVAL"] = "3600"
+
+from sdk.python.module.module import Module
+import sdk.python.module.helpers.log_shipper as log_shipper
+
+# module just logging
+class Benchmark(Module):
+    def on_init(self):
+        pass
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# configuration of a sensor, as logged when registering it
+SCHEDULE = {"trigger": "interval", "minutes": 5}
+CONFIGURATION = {"url": "http://device.local/status", "username": "admin", "timeout": 30, "measures": dict([("measure"+str(i), {"unit": "C", "offset": i}) for i in range(20)])}
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    module = Benchmark("service", "device")
+    for debug in [False, True]:
+        module.debug = debug
+        for name, log in [["eager", lambda i: module.log_debug("Scheduling sensor"+str(i)+" polling at "+str(SCHEDULE)+" with configuration "+str(CONFIGURATION))], ["structured", lambda i: module.log.debug("Scheduling sensor polling", sensor=i, schedule=SCHEDULE, configuration=CONFIGURATION)]]:
+            start = time.time()
+            for i in range(count): log(i)
+            elapsed = time.time() - start
+            # drop the logs queued without printing them
+            log_shipper.get(module.log_buffer_size, module.log_flush_interval).buffer.clear()
+            print "debug=%-5s %-10s %6.2f us per log in the caller" % (debug, name, elapsed*1000000/count)
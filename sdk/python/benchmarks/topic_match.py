@@ -0,0 +1,32 @@
+### Benchmark matching a topic against the subscribed patterns with a linear scan and with the topic trie
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.benchmarks.topic_match [patterns] [iterations]
+
+import sys
+import time
+import paho.mqtt.client as mqtt
+
+from sdk.python.module.helpers.topic_trie import Topic_trie
+
+# return the average time (in microseconds) to find the first pattern matching each topic
+def run(function, topics, iterations):
+    start = time.time()
+    for i in range(iterations):
+        for topic in topics: function(topic)
+    return (time.time() - start)/(iterations*len(topics))*1000000
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    # patterns subscribed by a controller-type module
+    patterns = ["egeoffrey/v1/+/+/+/controller/hub/+/#"]
+    for i in range(count): patterns.append("egeoffrey/v1/+/controller/config/*/*/CONF/1/sensors/room"+str(i)+"/#")
+    topics = ["egeoffrey/v1/house/controller/config/*/*/CONF/1/sensors/room"+str(count-1)+"/temperature", "egeoffrey/v1/house/service/weather/controller/hub/IN/outdoor/temperature", "egeoffrey/v1/house/controller/config/*/*/CONF/1/house"]
+    trie = Topic_trie()
+    for pattern in patterns: trie.add(pattern)
+    def linear(topic):
+        for pattern in patterns:
+            if mqtt.topic_matches_sub(pattern, topic): return pattern
+    print str(len(patterns))+" patterns: linear scan %.2f us/message, topic trie %.2f us/message" % (run(linear, topics, iterations), run(trie.match, topics, iterations))
@@ -0,0 +1,107 @@
+### Benchmark the cost of tracing the messages and reconstruct the per-hop latency of a sensor reading going through a service, the hub and the alerter
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m sdk.python.benchmarks.tracing [messages]
+
+import os
+import sys
+import time
+import tempfile
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+os.environ["EGEOFFREY_TRACING"] = "1"
+os.environ["EGEOFFREY_TRACE_FILE"] = os.path.join(tempfile.mkdtemp(), "spans.json")
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+import sdk.python.module.helpers.tracing as tracing
+import sdk.python.tools.traces as traces
+
+# module doing some work (in seconds) for every message received, then forwarding it if a recipient is set or replying to it otherwise
+class Benchmark(Module):
+    def on_init(self):
+        self.started = False
+        self.received = 0
+        self.delay = 0
+        self.forward_to = None
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        self.received = self.received + 1
+        # the reply of the alerter ends the chain
+        if message.sender == "controller/alerter": return
+        time.sleep(self.delay)
+        if self.forward_to is not None: message.forward(self.forward_to)
+        elif self.delay > 0: message.reply()
+        else: return
+        self.send(message)
+    def on_configuration(self, message):
+        pass
+    # poll a sensor and send the value to the hub
+    def poll(self, i):
+        with self.span("poll sensor1"):
+            time.sleep(self.delay)
+            message = Message(self)
+            message.recipient = "controller/hub"
+            message.command = "IN"
+            message.args = "sensor1"
+            message.set("value", i)
+            self.send(message)
+
+# send count messages from the sensor to the hub and return the time in microseconds per message until all of them are handled
+def run(sensor, hub, count):
+    hub.received = 0
+    start = time.time()
+    for i in range(count):
+        message = Message(sensor)
+        message.recipient = hub.fullname
+        message.command = "IN"
+        message.args = "sensor1"
+        message.set("value", i)
+        sensor.send(message)
+    while hub.received < count: time.sleep(0.001)
+    return (time.time() - start) * 1000000 / count
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    broker = Broker()
+    broker.configure()
+    broker.start()
+    modules = []
+    for scope, name in [["service", "sensor"], ["controller", "hub"], ["controller", "alerter"]]:
+        module = Benchmark(scope, name)
+        module.daemon = True
+        module.start()
+        modules.append(module)
+    while len([module for module in modules if not module.started or not module.connected]) > 0: time.sleep(0.01)
+    sensor, hub, alerter = modules
+    # cost of tracing every message between two modules
+    run(sensor, hub, count)
+    for traced, sampling in [[False, 0], [True, 0], [True, 1]]:
+        for module in modules: module.tracing = traced
+        sensor.trace_sampling = sampling
+        print "tracing %-3s sampling %d: %6.1f us per message" % ("on" if traced else "off", sampling, min([run(sensor, hub, count) for i in range(3)]))
+    tracing.get_exporter().flush()
+    os.remove(os.environ["EGEOFFREY_TRACE_FILE"])
+    # trace sensor readings polled in 20ms, handled by the hub in 5ms and by the alerter in 2ms, the latter replying to the hub
+    sensor.delay = 0.02
+    hub.delay = 0.005
+    hub.forward_to = "controller/alerter"
+    alerter.delay = 0.002
+    for i in range(50):
+        sensor.poll(i)
+        time.sleep(0.05)
+    while alerter.received < 50 or hub.received < 100: time.sleep(0.01)
+    time.sleep(0.1)
+    tracing.get_exporter().flush()
+    spans = traces.load(os.environ["EGEOFFREY_TRACE_FILE"])
+    print
+    traces.print_summary(spans)
+    print
+    traces.print_trace(traces.get_traces(spans).values()[0])
+    for module in modules: module.join()
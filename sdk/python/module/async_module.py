@@ -0,0 +1,92 @@
+### AsyncModule class, a Module running on the event loop and the gateway connection shared by all the async modules of the process
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import os
+import threading
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+import sdk.python.module.helpers.event_loop as event_loop
+import sdk.python.utils.exceptions as exception
+
+# raise Return(value) to return a value from a coroutine
+Return = event_loop.Return
+
+class AsyncModule(Module):
+    # initialize the module on the shared event loop
+    def __init__(self, scope, name, **kwargs):
+        # call superclass function
+        super(AsyncModule, self).__init__(scope, name, event_loop=event_loop.get(), **kwargs)
+        # seconds to wait for on_stop() to complete before disconnecting when stopping the module
+        self.stop_timeout = float(os.getenv("EGEOFFREY_STOP_TIMEOUT", 10))
+
+    # the module's code runs on the event loop's thread
+    @property
+    def ident(self):
+        return self.event_loop.ident
+
+    # run a coroutine (e.g. returned by a callback) on the event loop, logging its errors. Return a future of its result
+    def spawn(self, coroutine, callback_name="coroutine"):
+        def done(future):
+            if future.exception() is not None: self.log_error("runtime error during "+callback_name+": "+exception.get(future.exception()))
+        future = self.event_loop.spawn(coroutine)
+        future.add_done_callback(done)
+        return future
+
+    # run callback(*args) after delay seconds, as a coroutine if it is one. Return a timer which can be cancelled
+    def call_later(self, delay, callback, *args):
+        return self.event_loop.call_later(delay, lambda: self.spawn(callback(*args), "call_later()"), on_error=self.__on_error)
+
+    # log an error raised by a callback of this module run by the event loop
+    def __on_error(self, e):
+        self.log_error("runtime error in the event loop: "+exception.get(e))
+
+    # return a future completed after the given number of seconds, to be yielded by a coroutine
+    def sleep(self, sleep_time):
+        return self.event_loop.sleep(sleep_time)
+
+    # start the module on the event loop instead of in a dedicated thread
+    def start(self):
+        self.event_loop.call_soon(self.__run, on_error=self.__on_error)
+
+    # connect and wait (without blocking the loop) for the configuration before starting
+    def __run(self):
+        self._setup()
+        self.__wait_for_configuration()
+
+    # start the module once configured
+    def __wait_for_configuration(self):
+        if self.stopping: return
+        if not self.configured:
+            self.event_loop.call_later(1, self.__wait_for_configuration, on_error=self.__on_error)
+            return
+        try:
+            self.spawn(self.on_start(), "on_start()")
+        except Exception,e:
+            self.log_error("runtime error during on_start(): "+exception.get(e))
+
+    # shut down the module
+    def join(self):
+        self.log_info("Stopping module...")
+        self.stopping = True
+        # tell everybody this module has stopped
+        message = Message(self)
+        message.recipient = "*/*"
+        message.command = "STATUS"
+        message.args = "0"
+        self.send(message)
+        try:
+            future = self.spawn(self.on_stop(), "on_stop()")
+            # wait for on_stop() to complete (e.g. to send its last messages), unless called from the event loop which would then never run it
+            if threading.current_thread() is not self.event_loop and not future.wait(self.stop_timeout): self.log_warning("on_stop() has not completed within "+str(self.stop_timeout)+" seconds")
+        except Exception,e:
+            self.log_error("runtime error during on_stop(): "+exception.get(e))
+        self.flush_logs()
+        self.flush_spans()
+        self._stop_mqtt()
+
+    # the module has no thread of its own, it is alive until stopped
+    def is_alive(self):
+        return not self.stopping
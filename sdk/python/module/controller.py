@@ -3,6 +3,6 @@ from sdk.python.module.module import Module
 # controller common functionalities
 class Controller(Module):
     # What to do when initializing
-    def __init__(self, scope, name):
+    def __init__(self, scope, name, **kwargs):
         # call superclass function
-        super(Controller, self).__init__(scope, name)
+        super(Controller, self).__init__(scope, name, **kwargs)
@@ -1,27 +1,135 @@
 ### In memory cache helper class
 ## DEPENDENCIES:
 # OS:
-# Python: 
+# Python:
 
+import functools
+import heapq
+import itertools
+import threading
 import time
 
+import sdk.python.module.helpers.event_loop as event_loop
+
 class Cache():
-    def __init__(self):
+    # keep up to max_size entries (unbounded if 0), evicting the least recently used. Expired entries are dropped when looked up and by a sweep every sweep_interval seconds
+    def __init__(self, max_size=1000, sweep_interval=60):
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        # map key with [value, expiration time or None if never expiring, last time used]. Time of use is a counter, cheaper than keeping the entries sorted at every lookup
         self.__cache = {}
-        
-    # add key=value in the cache and set expiration time in seconds
+        self.__clock = itertools.count()
+        self.__next_sweep = time.time() + sweep_interval
+        # map the keys being computed by get_or_compute() with the future the other callers wait on
+        self.__computing = {}
+        self.__lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    # return the entry of a key if not expired, marking it as the most recently used (the lock must be held)
+    def __lookup(self, key, now):
+        entry = self.__cache.get(key)
+        if entry is None:
+            self.stats["misses"] = self.stats["misses"] + 1
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.__cache[key]
+            self.stats["expirations"] = self.stats["expirations"] + 1
+            self.stats["misses"] = self.stats["misses"] + 1
+            return None
+        entry[2] = next(self.__clock)
+        self.stats["hits"] = self.stats["hits"] + 1
+        return entry
+
+    # store an entry, evicting the least recently used ones when full and dropping the expired ones from time to time (the lock must be held)
+    def __store(self, key, value, expire, now):
+        self.__cache[key] = [value, now + expire if expire is not None else None, next(self.__clock)]
+        if now >= self.__next_sweep:
+            for expired_key in [cached_key for cached_key, entry in self.__cache.iteritems() if entry[1] is not None and entry[1] <= now]:
+                del self.__cache[expired_key]
+                self.stats["expirations"] = self.stats["expirations"] + 1
+            self.__next_sweep = now + self.sweep_interval
+        # when full, evict a tenth of the entries at once so to not look for the least recently used at every addition
+        if self.max_size > 0 and len(self.__cache) > self.max_size:
+            for evicted_key in heapq.nsmallest(len(self.__cache) - self.max_size + self.max_size/10, self.__cache, key=lambda cached_key: self.__cache[cached_key][2]):
+                del self.__cache[evicted_key]
+                self.stats["evictions"] = self.stats["evictions"] + 1
+
+    # add key=value in the cache and set expiration time in seconds (never expiring if None)
     def add(self, key, value, expire=60):
-        self.__cache[key] = {}
-        self.__cache[key]["timestamp"] = int(time.time())
-        self.__cache[key]["expire"] = expire
-        self.__cache[key]["value"] = value
-    
+        with self.__lock:
+            self.__store(key, value, expire, time.time())
+
     # check if key is in the cache and not expired
     def find(self, key):
-        if key in self.__cache and int(time.time()) - self.__cache[key]["timestamp"] < self.__cache[key]["expire"]: 
-            return True
-        return False
-    
-    # get value associated to key from the cache
-    def get(self, key):
-        if key in self.__cache: return self.__cache[key]["value"]
\ No newline at end of file
+        with self.__lock:
+            return self.__lookup(key, time.time()) is not None
+
+    # get value associated to key from the cache, default if not there or expired
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__lookup(key, time.time())
+        return entry[0] if entry is not None else default
+
+    # remove a key from the cache
+    def remove(self, key):
+        with self.__lock:
+            self.__cache.pop(key, None)
+
+    # get value associated to key or, if not there or expired, add the value returned by function() with the given expiration time. Concurrent callers missing the same key wait for a single call and get its result (or exception)
+    def get_or_compute(self, key, function, expire=60):
+        with self.__lock:
+            entry = self.__lookup(key, time.time())
+            if entry is not None: return entry[0]
+            future = self.__computing.get(key)
+            computing = future is None
+            if computing:
+                future = event_loop.Future()
+                self.__computing[key] = future
+        if not computing:
+            future.wait()
+            if future.exception() is not None: raise future.exception()
+            return future.result()
+        try:
+            value = function()
+        except Exception,e:
+            with self.__lock:
+                del self.__computing[key]
+            future.set_exception(e)
+            raise
+        with self.__lock:
+            self.__store(key, value, expire, time.time())
+            del self.__computing[key]
+        future.set_result(value)
+        return value
+
+    # return the number of hits, misses, entries evicted and expired so far and the number of entries
+    def get_stats(self):
+        with self.__lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.__cache)
+            return stats
+
+# the caches shared by the modules of this process (e.g. those started by the same watchdog) by name
+shared_caches = {}
+shared_caches_lock = threading.Lock()
+
+# return the cache of this process with the given name, creating it with the given maximum size on first use
+def get_shared(name, max_size=1000):
+    with shared_caches_lock:
+        if name not in shared_caches: shared_caches[name] = Cache(max_size)
+        return shared_caches[name]
+
+# decorate a method of a module, e.g. a service reading from a device, so its results are kept in the module's cache for expire seconds for the same arguments (which must be hashable or have a stable repr). With a namespace, results are kept in the shared cache of that name instead, so the modules of the process calling the same method with the same arguments cause a single call
+def cached(expire=60, namespace=None):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            key = (function.__name__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                key = (function.__name__, repr(args), repr(sorted(kwargs.items())))
+            cache = self.cache if namespace is None else get_shared(namespace, self.cache.max_size)
+            return cache.get_or_compute(key, lambda: function(self, *args, **kwargs), expire)
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+### Registry of codecs for serializing payloads on the bus
+## DEPENDENCIES:
+# OS:
+# Python: msgpack (optional)
+
+import json
+import zlib
+
+import sdk.python.module.helpers.readonly as readonly
+
+# binary payloads start with a marker followed by the codec id. JSON never starts with it so plain JSON stays compatible with any peer
+MARKER = "\x00"
+# the default codec, used as a fallback when the requested one is not available
+DEFAULT = "json"
+
+# map codec name with [id, encode function, decode function]
+codecs = {}
+# map codec id with codec name
+ids = {}
+
+# register a new codec. id must be in the range 1-255 and unique
+def register(name, id, encode, decode):
+    codecs[name] = [id, encode, decode]
+    ids[id] = name
+
+# return true if the given codec is registered
+def is_available(name):
+    return name == DEFAULT or name in codecs
+
+# serialize the payload with the given codec (or with json if not available)
+def encode(payload, name=DEFAULT):
+    if name == DEFAULT or name not in codecs:
+        return json.dumps(payload, default=readonly.unwrap)
+    id, encode_function, decode_function = codecs[name]
+    return MARKER+chr(id)+encode_function(payload)
+
+# return the name of the codec the raw payload has been serialized with
+def get_name(raw):
+    if len(raw) < 2 or raw[0] != MARKER: return DEFAULT
+    id = ord(raw[1])
+    if id not in ids: raise Exception("unsupported payload codec "+str(id))
+    return ids[id]
+
+# deserialize a raw payload by detecting its codec
+def decode(raw):
+    name = get_name(raw)
+    if name == DEFAULT:
+        return json.loads(raw)
+    id, encode_function, decode_function = codecs[name]
+    return decode_function(raw[2:])
+
+# compressed json
+def zlib_encode(payload):
+    return zlib.compress(json.dumps(payload, default=readonly.unwrap), 6)
+def zlib_decode(raw):
+    return json.loads(zlib.decompress(raw))
+register("zlib", 1, zlib_encode, zlib_decode)
+
+# msgpack, only if the library is installed
+try:
+    import msgpack
+    def msgpack_encode(payload):
+        return msgpack.packb(payload, use_bin_type=True, default=readonly.unwrap)
+    def msgpack_decode(raw):
+        return msgpack.unpackb(raw, raw=False)
+    register("msgpack", 2, msgpack_encode, msgpack_decode)
+except ImportError:
+    pass
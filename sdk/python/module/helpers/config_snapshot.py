@@ -0,0 +1,86 @@
+### On-disk snapshot of the last configurations accepted by a module, so it can start without waiting for controller/config
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import os
+import json
+import threading
+
+import sdk.python.utils.exceptions as exception
+import sdk.python.module.helpers.readonly as readonly
+
+class Config_snapshot():
+    def __init__(self, module, directory):
+        self.module = module
+        self.filename = os.path.join(directory, module.fullname.replace("/", "_")+".json")
+        # map the topic of each configuration (which includes house_id, config_schema and filename) with [config_schema, payload]
+        self.entries = {}
+        # topics delivered from the snapshot whose live configuration has not been received yet
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    # load the snapshot from disk and return a list of [topic, payload] of the configurations
+    def load(self):
+        try:
+            with open(self.filename) as f: entries = json.load(f)
+        except IOError:
+            return []
+        except Exception,e:
+            self.module.log_warning("unable to load the configuration snapshot "+self.filename+": "+exception.get(e))
+            return []
+        with self.lock:
+            self.entries = entries
+        return [[topic, entry[1]] for topic, entry in sorted(entries.items())]
+
+    # keep track of the topics delivered from the snapshot so the live configuration can be reconciled
+    def set_pending(self, topics):
+        with self.lock:
+            self.pending = set(topics)
+
+    # return true if there are topics delivered from the snapshot whose live configuration has not been received yet
+    def has_pending(self):
+        with self.lock:
+            return len(self.pending) > 0
+
+    # forget the configurations delivered from the snapshot but never received from the bus, which have been deleted while offline. Return their topics
+    def expire_pending(self):
+        with self.lock:
+            topics = sorted(self.pending)
+            self.pending = set()
+            if len(topics) == 0: return topics
+            for topic in topics: self.entries.pop(topic, None)
+            self.__save()
+        return topics
+
+    # return true if the configuration received from the bus is identical to the one already delivered from the snapshot
+    def is_replayed(self, message):
+        with self.lock:
+            if message.topic not in self.pending: return False
+            self.pending.discard(message.topic)
+            entry = self.entries.get(message.topic)
+        if entry is None or message.is_null: return False
+        return entry[1].get("data") == message.get_payload().get("data")
+
+    # keep track of a configuration accepted by the module, saving the snapshot if changed
+    def update(self, message):
+        with self.lock:
+            if message.is_null:
+                if message.topic not in self.entries: return
+                del self.entries[message.topic]
+            else:
+                payload = {"data": message.get_payload().get("data")}
+                entry = self.entries.get(message.topic)
+                if entry is not None and entry[1] == payload: return
+                self.entries[message.topic] = [message.config_schema, payload]
+            self.__save()
+
+    # write the snapshot to disk, replacing the previous one at once (the lock must be held)
+    def __save(self):
+        try:
+            directory = os.path.dirname(self.filename)
+            if directory != "" and not os.path.isdir(directory): os.makedirs(directory)
+            with open(self.filename+".tmp", "w") as f: f.write(json.dumps(self.entries, default=readonly.unwrap))
+            os.rename(self.filename+".tmp", self.filename)
+        except Exception,e:
+            self.module.log_warning("unable to save the configuration snapshot "+self.filename+": "+exception.get(e))
@@ -0,0 +1,212 @@
+### Event loop running callbacks, timers and generator based coroutines of many modules in a single thread
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import collections
+import heapq
+import itertools
+import sys
+import threading
+import time
+import types
+
+import sdk.python.utils.exceptions as exception
+
+# raised by a coroutine to return a value (generators cannot return values in python 2)
+class Return(Exception):
+    def __init__(self, value=None):
+        super(Return, self).__init__()
+        self.value = value
+
+# result of an asynchronous operation. A coroutine yielding it is resumed once done
+class Future():
+    def __init__(self):
+        self.__done = False
+        self.__result = None
+        self.__exception = None
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+
+    # return true if the operation has completed
+    def done(self):
+        return self.__done
+
+    # return the result of the operation or raise its exception
+    def result(self):
+        if self.__exception is not None: raise self.__exception
+        return self.__result
+
+    # return the exception raised by the operation, if any
+    def exception(self):
+        return self.__exception
+
+    # block the calling thread until the operation completes or the timeout expires and return true if completed. Never call it from the thread supposed to complete it (e.g. the event loop or the consumer receiving a reply)
+    def wait(self, timeout=None):
+        event = threading.Event()
+        self.add_done_callback(lambda future: event.set())
+        event.wait(timeout)
+        return self.__done
+
+    # complete the operation with the given result
+    def set_result(self, result):
+        self.__complete(result, None)
+
+    # complete the operation with the given exception
+    def set_exception(self, e):
+        self.__complete(None, e)
+
+    # call function(future) once done (immediately if already done), from the thread completing the operation
+    def add_done_callback(self, function):
+        with self.__lock:
+            if not self.__done:
+                self.__callbacks.append(function)
+                return
+        function(self)
+
+    def __complete(self, result, e):
+        with self.__lock:
+            if self.__done: return
+            self.__result = result
+            self.__exception = e
+            self.__done = True
+            callbacks = self.__callbacks
+            self.__callbacks = []
+        for function in callbacks: function(self)
+
+# a callback scheduled by call_later()
+class Timer():
+    def __init__(self, callback, args, on_error):
+        self.callback = callback
+        self.args = args
+        self.on_error = on_error
+        self.cancelled = False
+
+    # do not run the callback
+    def cancel(self):
+        self.cancelled = True
+
+class Event_loop(threading.Thread):
+    def __init__(self):
+        super(Event_loop, self).__init__()
+        self.daemon = True
+        # callbacks ready to run as [callback, args, function called with the exception raised, if any]
+        self.__ready = collections.deque()
+        # heap of [when, sequence, timer], the sequence keeps timers expiring at the same time in order
+        self.__timers = []
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.running = False
+
+    # run callback(*args) as soon as possible. If on_error is given, it is called with the exception raised by the callback, e.g. to log it with the owning module. Can be called from any thread
+    def call_soon(self, callback, *args, **kwargs):
+        with self.__condition:
+            self.__ready.append([callback, args, kwargs.get("on_error")])
+            self.__condition.notify()
+
+    # run callback(*args) after delay seconds and return a timer which can be cancelled. on_error is as for call_soon(). Can be called from any thread
+    def call_later(self, delay, callback, *args, **kwargs):
+        timer = Timer(callback, args, kwargs.get("on_error"))
+        with self.__condition:
+            heapq.heappush(self.__timers, [time.time()+delay, next(self.__sequence), timer])
+            self.__condition.notify()
+        return timer
+
+    # return a future completed after the given number of seconds
+    def sleep(self, seconds):
+        future = Future()
+        self.call_later(seconds, future.set_result, None)
+        return future
+
+    # run a coroutine and return a future of its result. Anything else is considered the result of an already completed coroutine
+    def spawn(self, coroutine):
+        future = Future()
+        if not isinstance(coroutine, types.GeneratorType):
+            future.set_result(coroutine)
+            return future
+        self.call_soon(self.__step, coroutine, future, None, None)
+        return future
+
+    # resume a coroutine sending it a value or throwing an exception, until it yields something to wait for
+    def __step(self, coroutine, future, value, e):
+        try:
+            if e is not None: waiting_for = coroutine.throw(e)
+            else: waiting_for = coroutine.send(value)
+        except StopIteration:
+            future.set_result(None)
+            return
+        except Return,r:
+            future.set_result(r.value)
+            return
+        except Exception,e:
+            future.set_exception(e)
+            return
+        # a nested coroutine is spawned and waited for
+        if isinstance(waiting_for, types.GeneratorType): waiting_for = self.spawn(waiting_for)
+        # resume the coroutine on this loop once the future is done
+        if isinstance(waiting_for, Future):
+            waiting_for.add_done_callback(lambda done: self.call_soon(self.__resume, coroutine, future, done))
+        # anything else just lets the other callbacks run first
+        else:
+            self.call_soon(self.__step, coroutine, future, waiting_for, None)
+
+    # resume a coroutine with the outcome of the future it was waiting for
+    def __resume(self, coroutine, future, done):
+        if done.exception() is not None: self.__step(coroutine, future, None, done.exception())
+        else: self.__step(coroutine, future, done.result(), None)
+
+    # run the loop until stopped
+    def run(self):
+        self.running = True
+        while self.running:
+            with self.__condition:
+                # wait for a callback to be ready or the next timer to expire
+                while len(self.__ready) == 0 and self.running:
+                    if len(self.__timers) == 0:
+                        self.__condition.wait()
+                        continue
+                    timeout = self.__timers[0][0] - time.time()
+                    if timeout <= 0: break
+                    self.__condition.wait(timeout)
+                # move the expired timers to the ready callbacks
+                now = time.time()
+                while len(self.__timers) > 0 and self.__timers[0][0] <= now:
+                    timer = heapq.heappop(self.__timers)[2]
+                    if not timer.cancelled: self.__ready.append([timer.callback, timer.args, timer.on_error])
+                # callbacks added while running these will run in the next iteration
+                ready = self.__ready
+                self.__ready = collections.deque()
+            for callback, args, on_error in ready:
+                try:
+                    callback(*args)
+                except Exception,e:
+                    self.__on_error(on_error, e)
+
+    # hand an exception raised by a callback over to its error handler. Coroutines report their errors through their futures, so only callbacks scheduled directly without a handler end up on stderr
+    def __on_error(self, on_error, e):
+        if on_error is not None:
+            try:
+                on_error(e)
+                return
+            except Exception,handler_e:
+                e = handler_e
+        sys.stderr.write("runtime error in the event loop: "+exception.get(e)+"\n")
+
+    # stop the loop
+    def stop(self):
+        with self.__condition:
+            self.running = False
+            self.__condition.notify()
+
+# the event loop shared by all the async modules of this process
+shared_loop = None
+shared_loop_lock = threading.Lock()
+
+# return the shared event loop, starting it on first use
+def get():
+    global shared_loop
+    with shared_loop_lock:
+        if shared_loop is None or not shared_loop.is_alive():
+            shared_loop = Event_loop()
+            shared_loop.start()
+        return shared_loop
@@ -0,0 +1,71 @@
+### Queue made of lanes of different priority, served with a weighted round robin
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import collections
+import Queue
+
+class Lane_queue(Queue.Queue):
+    # lanes is a list of [name, weight] from the highest to the lowest priority, get_lane a function returning the name of the lane of a given item
+    def __init__(self, lanes, get_lane, maxsize=0):
+        self.lanes = [name for name, weight in lanes]
+        # every lane must be served at least once per round
+        self.weights = dict([[name, max(1, int(weight))] for name, weight in lanes])
+        self.get_lane = get_lane
+        Queue.Queue.__init__(self, maxsize)
+
+    # return the number of items waiting in the given lane
+    def lane_size(self, lane):
+        with self.mutex:
+            return len(self.queues[lane])
+
+    # remove and return the oldest item of the given lane, None if empty
+    def drop_oldest(self, lane):
+        with self.mutex:
+            if len(self.queues[lane]) == 0: return None
+            item = self.queues[lane].popleft()
+            self.__task_dropped()
+            return item
+
+    # replace the most recent item of the given lane with the same key of the new item, keeping its position. Return the replaced item, None if not found
+    def replace(self, lane, item, get_key):
+        key = get_key(item)
+        with self.mutex:
+            queue = self.queues[lane]
+            for i in range(len(queue)-1, -1, -1):
+                if get_key(queue[i]) == key:
+                    replaced = queue[i]
+                    queue[i] = item
+                    return replaced
+        return None
+
+    # mark a dropped item as done so join() does not wait for it (the mutex must be held)
+    def __task_dropped(self):
+        self.unfinished_tasks = self.unfinished_tasks - 1
+        if self.unfinished_tasks == 0: self.all_tasks_done.notify_all()
+        self.not_full.notify()
+
+    # initialize the lanes (called by Queue's constructor)
+    def _init(self, maxsize):
+        self.queues = dict([[lane, collections.deque()] for lane in self.lanes])
+        # number of items each lane can still be served with in the current round
+        self.credits = dict(self.weights)
+
+    def _qsize(self, len=len):
+        return sum([len(queue) for queue in self.queues.itervalues()])
+
+    # add the item to its lane (the lowest priority one if unknown). None, used to wake up the consumer, goes to the highest priority one
+    def _put(self, item):
+        lane = self.get_lane(item) if item is not None else self.lanes[0]
+        if lane not in self.queues: lane = self.lanes[-1]
+        self.queues[lane].append(item)
+
+    # serve the highest priority lane with items and credits left, start a new round when none is left
+    def _get(self):
+        while True:
+            for lane in self.lanes:
+                if len(self.queues[lane]) > 0 and self.credits[lane] > 0:
+                    self.credits[lane] = self.credits[lane] - 1
+                    return self.queues[lane].popleft()
+            self.credits = dict(self.weights)
@@ -0,0 +1,121 @@
+### Pipeline printing and shipping the logs of the modules of this process to the logger from a dedicated thread, in batches and rate limited, so that logging never blocks the caller
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import collections
+import random
+import threading
+import time
+
+import sdk.python.module.helpers.logger as logger
+import sdk.python.utils.exceptions as exception
+import sdk.python.utils.strings
+
+class Log_shipper(threading.Thread):
+    # keep up to buffer_size logs (the oldest are dropped when full), shipped every flush_interval seconds
+    def __init__(self, buffer_size, flush_interval):
+        super(Log_shipper, self).__init__()
+        self.daemon = True
+        self.flush_interval = flush_interval
+        # logs waiting to be shipped as [module, severity, text, allow_remote_logging, timestamp]
+        self.buffer = collections.deque(maxlen=buffer_size)
+        # map the modules' fullname with their rate limiting state as [module, tokens, last refill time, logs suppressed since the last summary]
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {"shipped": 0, "dropped": 0, "suppressed": 0, "sampled": 0}
+
+    # queue a log of the given module, unless sampled out or above the module's rate
+    def put(self, module, severity, text, allow_remote_logging):
+        sampling = module.log_sampling.get(severity, 1)
+        if sampling < 1 and random.random() >= sampling:
+            self.stats["sampled"] = self.stats["sampled"] + 1
+            return
+        now = time.time()
+        with self.lock:
+            # token bucket refilled at log_rate tokens per second up to log_burst
+            if module.log_rate > 0:
+                bucket = self.buckets.get(module.fullname)
+                if bucket is None or bucket[0] is not module:
+                    bucket = [module, module.log_burst, now, 0]
+                    self.buckets[module.fullname] = bucket
+                bucket[1] = min(module.log_burst, bucket[1] + (now - bucket[2]) * module.log_rate)
+                bucket[2] = now
+                if bucket[1] < 1:
+                    bucket[3] = bucket[3] + 1
+                    self.stats["suppressed"] = self.stats["suppressed"] + 1
+                    return
+                bucket[1] = bucket[1] - 1
+            if len(self.buffer) == self.buffer.maxlen: self.stats["dropped"] = self.stats["dropped"] + 1
+            self.buffer.append([module, severity, text, allow_remote_logging, now])
+
+    # return the logs queued (of the given module only, if any) followed by a summary of the logs suppressed since the last one (the lock must be held)
+    def __take(self, module):
+        if module is None:
+            entries = list(self.buffer)
+            self.buffer.clear()
+        else:
+            entries = [entry for entry in self.buffer if entry[0] is module]
+            if len(entries) > 0:
+                left = [entry for entry in self.buffer if entry[0] is not module]
+                self.buffer.clear()
+                self.buffer.extend(left)
+        now = time.time()
+        for bucket in self.buckets.values():
+            if bucket[3] == 0 or (module is not None and bucket[0] is not module): continue
+            entries.append([bucket[0], "warning", str(bucket[3])+" log messages suppressed by the rate limit of "+str(bucket[0].log_rate)+" messages per second", True, now])
+            bucket[3] = 0
+        return entries
+
+    # print and ship the given logs, each as its own LOG message or, if enabled by the module, packing those of the same module into a single BATCH message
+    def __ship(self, entries):
+        messages = collections.OrderedDict()
+        for module, severity, text, allow_remote_logging, timestamp in entries:
+            if module.logging_local:
+                print sdk.python.utils.strings.format_log_line(severity, module.fullname, text, timestamp)
+            if module.logging_remote and allow_remote_logging:
+                if module not in messages: messages[module] = []
+                messages[module].append(logger.get_message(module, severity, text))
+        for module, batch in messages.iteritems():
+            try:
+                if module.log_batch: module.send_batch(batch)
+                else:
+                    for message in batch: module.send(message)
+                self.stats["shipped"] = self.stats["shipped"] + len(batch)
+            except Exception,e:
+                print "unable to ship the logs of "+module.fullname+": "+exception.get(e)
+
+    # ship at once the logs queued by the given module (e.g. before stopping it) and forget its rate limiting state
+    def flush(self, module):
+        with self.lock:
+            entries = self.__take(module)
+            bucket = self.buckets.get(module.fullname)
+            if bucket is not None and bucket[0] is module: del self.buckets[module.fullname]
+        self.__ship(entries)
+
+    # return the number of logs shipped, dropped because the buffer was full, suppressed by the rate limit, sampled out and queued so far
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["queued"] = len(self.buffer)
+            return stats
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self.lock:
+                entries = self.__take(None)
+            if len(entries) > 0: self.__ship(entries)
+
+# the log shipper of this process
+shared_shipper = None
+shared_shipper_lock = threading.Lock()
+
+# return the log shipper of this process, starting it with the given settings on first use
+def get(buffer_size, flush_interval):
+    global shared_shipper
+    with shared_shipper_lock:
+        if shared_shipper is None:
+            shared_shipper = Log_shipper(buffer_size, flush_interval)
+            shared_shipper.start()
+        return shared_shipper
@@ -0,0 +1,87 @@
+### Structured logging with numeric levels and per-logger thresholds, formatting the logs only when printed or shipped
+## DEPENDENCIES:
+# OS:
+# Python:
+
+from sdk.python.module.helpers.message import Message
+
+# numeric levels, the same of python's logging module
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+# threshold of a logger logging nothing
+SILENT = 50
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "critical": ERROR}
+
+# return the numeric level of a level name (e.g. "debug"), a number or a debug flag (1 or True for debug, 0 or False for info)
+def get_level(level):
+    if isinstance(level, basestring):
+        level = level.strip().lower()
+        if level in LEVELS: return LEVELS[level]
+        if not level.isdigit(): raise Exception("invalid log level "+level)
+    level = int(level)
+    if level in (0, 1): return DEBUG if level == 1 else INFO
+    return level
+
+# return the severity of a numeric level
+def get_severity(level):
+    if level >= ERROR: return "error"
+    if level >= WARNING: return "warning"
+    if level >= INFO: return "info"
+    return "debug"
+
+# a log whose text is formatted with its arguments and fields only when rendered
+class Log_record():
+    def __init__(self, text, args, fields):
+        self.text = text
+        self.args = args
+        self.fields = fields
+
+    # return the fields in a format which can be serialized
+    def get_fields(self):
+        return dict([(key, value if isinstance(value, (basestring, int, long, float, bool, type(None), list, dict)) else str(value)) for key, value in self.fields.iteritems()])
+
+    def __str__(self):
+        text = self.text % self.args if len(self.args) > 0 else self.text
+        if len(self.fields) == 0: return str(text)
+        return str(text)+" "+" ".join([str(key)+"="+str(self.fields[key]) for key in sorted(self.fields)])
+
+# return the message shipping a log to the logger, with the fields of a structured log in the "fields" header
+def get_message(module, severity, text):
+    message = Message(module)
+    message.recipient = "controller/logger"
+    message.command = "LOG"
+    message.args = severity
+    message.set_data(str(text))
+    if isinstance(text, Log_record) and len(text.fields) > 0: message.set_header("fields", text.get_fields())
+    return message
+
+class Logger():
+    # logger of the given module with the given name ("" for the module's own logs), whose threshold defaults to the module's one
+    def __init__(self, module, name=""):
+        self.module = module
+        self.name = name
+
+    # return true if a log of the given level would be logged
+    def is_enabled_for(self, level):
+        return level >= self.module.get_log_level(self.name)
+
+    # log text % args with the given key=value fields, if above the threshold
+    def log(self, level, text, *args, **fields):
+        if level < self.module.get_log_level(self.name): return
+        allow_remote_logging = fields.pop("allow_remote_logging", True)
+        if self.name != "": fields["logger"] = self.name
+        self.module._log(get_severity(level), Log_record(text, args, fields), allow_remote_logging)
+
+    def debug(self, text, *args, **fields):
+        self.log(DEBUG, text, *args, **fields)
+
+    def info(self, text, *args, **fields):
+        self.log(INFO, text, *args, **fields)
+
+    def warning(self, text, *args, **fields):
+        self.log(WARNING, text, *args, **fields)
+
+    def error(self, text, *args, **fields):
+        self.log(ERROR, text, *args, **fields)
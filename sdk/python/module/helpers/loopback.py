@@ -0,0 +1,29 @@
+### Registry of the modules running in this process, so messages between them can be delivered without going through the gateway
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import threading
+
+# map the fullname of each running module with its mqtt client
+clients = {}
+lock = threading.Lock()
+
+# add the mqtt client of a module which has started
+def register(mqtt_client):
+    with lock:
+        clients[mqtt_client.module.fullname] = mqtt_client
+
+# remove the mqtt client of a module which has stopped (unless already replaced, e.g. by a restart)
+def unregister(mqtt_client):
+    with lock:
+        if clients.get(mqtt_client.module.fullname) is mqtt_client: del clients[mqtt_client.module.fullname]
+
+# return the mqtt client of the given module if running in this process, None otherwise
+def get(fullname):
+    return clients.get(fullname)
+
+# return the mqtt clients of all the modules running in this process
+def get_all():
+    with lock:
+        return clients.values()
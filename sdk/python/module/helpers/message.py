@@ -3,17 +3,33 @@
 # OS:
 # Python: 
 
-import json
 import os
 import struct
 import copy
 import re
 import time
+import itertools
 
 import sdk.python.constants as constants
 import sdk.python.utils.exceptions as exception
+import sdk.python.module.helpers.readonly as readonly
+import sdk.python.module.helpers.codec as codec
 
-class Message():
+# request_ids are made of a random per-process prefix and a counter, kept within 53 bits so to be safe for javascript peers
+REQUEST_ID_PREFIX = (struct.unpack("<L", os.urandom(4))[0] & 0x1FFFFF) << 32
+REQUEST_ID_COUNTER = itertools.count(1)
+
+# intern a string so that repeated topic sections share the same object (unicode topics are converted first)
+def intern_string(string):
+    try:
+        return intern(str(string))
+    except (TypeError, UnicodeError):
+        return string
+
+class Message(object):
+    # no per-instance dictionary, messages are created for every log line, ping and publish
+    __slots__ = ["topic", "house_id", "sender", "recipient", "command", "args", "config_schema", "__payload", "__raw", "is_null", "retain", "qos", "codec", "received_at", "__shared"]
+    
     def __init__(self, module=None):
         self.reset()
         # if module is given, set module name as sender and associated house_id
@@ -21,12 +37,13 @@ class Message():
             self.sender = module.fullname
             self.house_id = module.house_id
             
-    # generate and set a request_id
+    # generate and set a request_id (next() on the counter is atomic)
     def __add_request_id(self):
-        self.__payload["request_id"] = struct.unpack("<L", os.urandom(4))[0]
+        self.__payload["request_id"] = REQUEST_ID_PREFIX | (next(REQUEST_ID_COUNTER) & 0xFFFFFFFF)
     
-    # clone an object
-    def __clone(self, object):
+    # clone an object or, if no copy is requested, return a read-only view of it
+    def __clone(self, object, copy_object=True):
+        if not copy_object: return readonly.wrap(object)
         return copy.deepcopy(object)
             
     # reset the message
@@ -45,25 +62,53 @@ class Message():
         self.args = ""
         # version of the configuration file
         self.config_schema = None
-        # setup the payload (not directly accessible by the user)
-        self.__payload = {}
+        # setup the payload (not directly accessible by the user) and the raw payload as received from the bus, decoded on first access when lazily parsed
         self.clear()
         # set to true when payload is null
         self.is_null = False
         # retain the message in the mqtt bus
         self.retain = False
+        # QoS level to publish the message with (None for the default one of the command)
+        self.qos = None
+        # codec used to serialize the payload (None for the module's default). Set to the codec of the message when parsing
+        self.codec = None
+        # time the message has been queued for the consumers, populated only for incoming messages
+        self.received_at = None
         
     # clear the payload only
     def clear(self):
+        # discard the raw payload if not yet decoded
+        self.__raw = None
         # content of the message made up of a unique request_id and user's data
         self.__payload = {
             "request_id": 0,
             "data": {}
         }
+        # true if the payload is shared with another message and has to be copied before being modified
+        self.__shared = False
         self.__add_request_id()
 
-    # parse a MQTT message (topic and payload)
-    def parse(self, topic, payload, retain):
+    # copy the payload if shared with another message, before modifying it
+    def __own(self):
+        if not self.__shared: return
+        self.__payload = copy.deepcopy(self.__payload)
+        self.__shared = False
+
+    # decode the raw payload if the message was lazily parsed
+    def __load(self):
+        if self.__raw is None: return
+        try: 
+            self.__payload = codec.decode(self.__raw)
+        except Exception,e:
+            raise Exception("payload in an invalid "+str(self.codec)+" format: "+exception.get(e)+" - "+repr(self.__raw))
+        self.__raw = None
+    
+    # return true if the payload has not been decoded yet
+    def is_lazy(self):
+        return self.__raw is not None
+
+    # parse a MQTT message (topic and payload). If lazy, the payload will be decoded only when accessed
+    def parse(self, topic, payload, retain, lazy=False):
         # split the topic
         topics = topic.split("/")
         # sanity check
@@ -74,10 +119,10 @@ class Message():
         # store original topic (mainly used by mqtt_client to dispatch the message)
         self.topic = topic
         # store individual topic sections into internal variables
-        self.house_id = topics[2]
-        self.sender = topics[3]+"/"+topics[4]
-        self.recipient = topics[5]+"/"+topics[6]
-        self.command = topics[7]
+        self.house_id = intern_string(topics[2])
+        self.sender = intern_string(topics[3]+"/"+topics[4])
+        self.recipient = intern_string(topics[5]+"/"+topics[6])
+        self.command = intern_string(topics[7])
         self.args = "/".join(topics[8:])
         self.retain = retain
         # parse configuration version if any
@@ -91,18 +136,21 @@ class Message():
         if payload is None or payload == "":
             self.is_null = True
         else:
-            # expecting a json payload
-            try: 
-                self.__payload = json.loads(payload)
-            except Exception,e:
-                raise Exception("payload in an invalid JSON format: "+exception.get(e)+" - "+str(payload))
+            # detect the codec of the payload and keep it raw until requested if lazy
+            self.codec = codec.get_name(payload)
+            self.__raw = payload
+            if not lazy: self.__load()
 
     # set the payload to value
     def set_data(self, value):
+        self.__load()
+        self.__own()
         self.__payload["data"] = value
                 
     # set key of the payload to value
     def set(self, key, value):
+        self.__load()
+        self.__own()
         if not isinstance(self.__payload["data"], dict): self.__payload["data"] = {}
         self.__payload["data"][key] = value
         # if this is a value coming from a service add a timestamp if not already provided
@@ -112,33 +160,72 @@ class Message():
     # set the payload to null
     def set_null(self):
         self.is_null = True
+        self.__raw = None
         self.__payload = None
+        self.__shared = False
 
-    # get the value of key of the payload
-    def get(self, key):
+    # get the value of key of the payload. If copy is False, a read-only view is returned instead of a copy
+    def get(self, key, copy=True):
         if self.is_null: return None
+        self.__load()
         if not isinstance(self.__payload["data"], dict): return None
         if "data" not in self.__payload: return None
         if key not in self.__payload["data"]: return None
-        return self.__clone(self.__payload["data"][key])
+        return self.__clone(self.__payload["data"][key], copy)
     
     # return true if payload has the given key
     def has(self, key):
-        if self.get(key) is None: return False
+        if self.get(key, copy=False) is None: return False
         return True
         
-    # get the value of the payload
-    def get_data(self):
+    # get the value of the payload. If copy is False, a read-only view is returned instead of a copy
+    def get_data(self, copy=True):
+        self.__load()
         if "data" not in self.__payload: return None
-        return self.__clone(self.__payload["data"])
+        return self.__clone(self.__payload["data"], copy)
         
+    # set a header, i.e. an entry of the payload besides data and request_id (e.g. the fields of a structured log)
+    def set_header(self, key, value):
+        self.__load()
+        self.__own()
+        self.__payload[key] = value
+
+    # get a header, default if not set
+    def get_header(self, key, default=None):
+        self.__load()
+        if self.__payload is None or key not in self.__payload: return default
+        return self.__payload[key]
+
+    # return false if the payload surely does not contain the given string (e.g. the name of a header), without decoding it
+    def may_contain(self, string):
+        if self.__raw is None: return True
+        return string in self.__raw
+
     # get the request_id
     def get_request_id(self):
+        self.__load()
         if "request_id" not in self.__payload: return None
         return self.__payload["request_id"]
         
+    # set the whole payload, e.g. when unpacked from a batch (not supposed to be called by users)
+    def set_payload(self, payload):
+        self.__raw = None
+        self.__payload = payload
+        self.__shared = False
+        self.is_null = payload is None
+
+    # make the given message share the payload of this message without copying it, the first of them modifying it will get a copy (not supposed to be called by users)
+    def share_payload(self, message):
+        self.__load()
+        message.set_payload(self.__payload)
+        message.codec = self.codec
+        if self.__payload is None: return
+        message.__shared = True
+        self.__shared = True
+        
     # get the payload (not supposed to be called by users
     def get_payload(self):
+        self.__load()
         return self.__payload
         
     # reply to this message
@@ -149,6 +236,8 @@ class Message():
         self.recipient = tmp
         # clear the content (while keeping original command and args)
         self.topic = "" 
+        self.__load()
+        self.__own()
         self.__payload["data"] = {}
     
     # forward this message to another module
@@ -162,6 +251,7 @@ class Message():
     # dump the content of this message
     def dump(self):
         if self.is_null: content = "null"
+        elif self.is_lazy(): content = str(self.__raw) if self.codec == codec.DEFAULT else "<"+self.codec+" payload, "+str(len(self.__raw))+" bytes>"
         else: content = str(self.__payload["data"])+" ["+str(self.__payload["request_id"])+"]"
         version = "v"+str(self.config_schema) if self.config_schema is not None else ""
         return "Message("+self.sender+" -> "+self.recipient+": "+self.command+" "+self.args+" "+version+": "+content+")"
\ No newline at end of file
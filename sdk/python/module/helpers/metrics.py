@@ -0,0 +1,145 @@
+### Registry of the counters, gauges and latency histograms of a module, cheap enough to be updated for every message
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import threading
+from bisect import bisect_left
+
+# upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# metrics are updated without locking so to keep them cheap, relying on the interpreter lock (an update concurrent to another one may be rarely lost)
+class Counter():
+    # if a function is given, the value is what it returns instead
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def inc(self, value=1):
+        self.value += value
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+class Gauge(Counter):
+    def set(self, value):
+        self.value = value
+
+    def dec(self, value=1):
+        self.value -= value
+
+class Histogram():
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # number of observations in each bucket, the last one for those above the highest bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    # return the number of observations, their sum and the cumulative count of each bucket by upper bound
+    def get(self):
+        counts = list(self.counts)
+        cumulative = 0
+        buckets = []
+        for i in range(len(self.buckets)):
+            cumulative = cumulative + counts[i]
+            buckets.append([self.buckets[i], cumulative])
+        return {"count": cumulative + counts[-1], "sum": self.sum, "buckets": buckets}
+
+class Metrics():
+    def __init__(self):
+        # map [name, labels] with [type, labels, metric]
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    # return the metric with the given name and labels, creating it on first use. Callers updating it often should keep it instead of looking it up every time
+    def __get(self, metric_type, name, labels, create):
+        key = (name, tuple(sorted(labels.items())))
+        entry = self.metrics.get(key)
+        if entry is None:
+            with self.lock:
+                entry = self.metrics.get(key)
+                if entry is None:
+                    entry = [metric_type, labels, create()]
+                    self.metrics[key] = entry
+        return entry[2]
+
+    # return a counter (e.g. messages received), whose value is returned by function if given
+    def counter(self, name, function=None, **labels):
+        return self.__get("counter", name, labels, lambda: Counter(function))
+
+    # return a gauge (e.g. messages queued), whose value is returned by function if given
+    def gauge(self, name, function=None, **labels):
+        return self.__get("gauge", name, labels, lambda: Gauge(function))
+
+    # return a histogram (e.g. time spent in a handler) with the given buckets
+    def histogram(self, name, buckets=LATENCY_BUCKETS, **labels):
+        return self.__get("histogram", name, labels, lambda: Histogram(buckets))
+
+    # return the current value of all the metrics as a list of {name, type, labels, value}
+    def snapshot(self):
+        with self.lock:
+            entries = sorted(self.metrics.items())
+        snapshot = []
+        for (name, key_labels), (metric_type, labels, metric) in entries:
+            try:
+                value = metric.get()
+            except Exception:
+                continue
+            snapshot.append({"name": name, "type": metric_type, "labels": dict(labels), "value": value})
+        return snapshot
+
+# return the counters and histograms of the given snapshots (a list of [module's fullname, snapshot]) summed by name and labels across the modules, in the format of a snapshot. Gauges are not summed since not all of them add up (e.g. a ratio)
+def aggregate(snapshots):
+    totals = {}
+    for fullname, snapshot in snapshots:
+        for entry in snapshot:
+            if entry["type"] not in ["counter", "histogram"]: continue
+            key = (entry["name"], entry["type"], tuple(sorted(entry["labels"].items())))
+            total = totals.get(key)
+            if total is None:
+                value = entry["value"]
+                if entry["type"] == "histogram": value = {"count": value["count"], "sum": value["sum"], "buckets": [list(bucket) for bucket in value["buckets"]]}
+                totals[key] = {"name": entry["name"], "type": entry["type"], "labels": dict(entry["labels"]), "value": value}
+            elif entry["type"] == "counter":
+                total["value"] = total["value"] + entry["value"]
+            # histograms with different buckets cannot be summed, the first one is kept
+            elif [bound for bound, count in total["value"]["buckets"]] == [bound for bound, count in entry["value"]["buckets"]]:
+                total["value"]["count"] = total["value"]["count"] + entry["value"]["count"]
+                total["value"]["sum"] = total["value"]["sum"] + entry["value"]["sum"]
+                for bucket, (bound, count) in zip(total["value"]["buckets"], entry["value"]["buckets"]): bucket[1] = bucket[1] + count
+    return [totals[key] for key in sorted(totals)]
+
+# return the given labels in the text exposition format
+def format_labels(labels):
+    if len(labels) == 0: return ""
+    return "{"+",".join([key+"=\""+str(labels[key]).replace("\\", "\\\\").replace("\"", "\\\"")+"\"" for key in sorted(labels)])+"}"
+
+# return the snapshots of the given modules (a list of [module's fullname, snapshot]) in the text exposition format of prometheus
+def get_text(snapshots, prefix="egeoffrey_"):
+    lines = []
+    types = {}
+    samples = {}
+    for fullname, snapshot in snapshots:
+        for entry in snapshot:
+            name = prefix+entry["name"]
+            types[name] = entry["type"]
+            labels = dict(entry["labels"])
+            labels["module"] = fullname
+            if name not in samples: samples[name] = []
+            if entry["type"] == "histogram":
+                for bound, count in entry["value"]["buckets"]:
+                    samples[name].append(name+"_bucket"+format_labels(dict(labels, le=bound))+" "+str(count))
+                samples[name].append(name+"_bucket"+format_labels(dict(labels, le="+Inf"))+" "+str(entry["value"]["count"]))
+                samples[name].append(name+"_sum"+format_labels(labels)+" "+repr(entry["value"]["sum"]))
+                samples[name].append(name+"_count"+format_labels(labels)+" "+str(entry["value"]["count"]))
+            else:
+                samples[name].append(name+format_labels(labels)+" "+str(entry["value"]))
+    for name in sorted(samples):
+        lines.append("# TYPE "+name+" "+types[name])
+        lines.extend(samples[name])
+    return "\n".join(lines)+"\n"
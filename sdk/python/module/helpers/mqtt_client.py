@@ -1,40 +1,90 @@
 import os
 import collections
 import time
-import json
+import threading
 import paho.mqtt.client as mqtt
 import ssl
-import Queue
 
 import sdk.python.constants as constants
 import sdk.python.utils.exceptions as exception
 from sdk.python.module.helpers.message import Message
+import sdk.python.module.helpers.codec as codec
 from sdk.python.module.helpers.mqtt_consumer import Mqtt_consumer
+from sdk.python.module.helpers.lane_queue import Lane_queue
+from sdk.python.module.helpers.config_snapshot import Config_snapshot
+from sdk.python.module.helpers.publish_spool import Publish_spool
+from sdk.python.module.helpers.topic_trie import Topic_trie
+from sdk.python.module.helpers.mqtt_publisher import Mqtt_publisher
+from sdk.python.module.helpers.mqtt_network import Mqtt_network
+import sdk.python.module.helpers.mqtt_connection as mqtt_connection
+import sdk.python.module.helpers.loopback as loopback
 
 class Mqtt_client():
-    def __init__(self, module):
+    def __init__(self, module, consumer_threads=1, shard_by="topic", control_weight=10, data_weight=1, event_loop=None):
         # we need the module's object to call its methods
         self.module = module
         # mqtt object
         self.gateway = None
-        # track the topics subscribed
-        self.topics_to_subscribe = []
-        self.topics_subscribed = []
-        self.topics_to_wait = []
-        # queue messages while offline
+        # pipeline publishing the outgoing messages from a dedicated thread, if used
+        self.publisher = None
+        # thread running the network loop and reconnecting when needed
+        self.network = None
+        # if an event loop is given, messages are consumed by the loop instead of by consumer threads
+        self.event_loop = event_loop
+        # connection shared with the other modules of the process, if used
+        self.connection = None
+        # serialize subscribing new topics and subscribing all of them once connected
+        self.lock = threading.RLock()
+        # track the topics to subscribe upon (re)connecting and those subscribed, each associated with the listener's settings
+        self.topics_to_subscribe = collections.OrderedDict()
+        self.topics_subscribed = Topic_trie()
+        self.topics_to_wait = Topic_trie()
+        # queue messages while offline, in memory or on disk if a spool is configured
         self.publish_queue = collections.deque(maxlen=300)
+        self.spool = None
+        if module.spool_dir != "":
+            try:
+                # the messages spooled by a previous run will be replayed once connected
+                self.spool = Publish_spool(module, module.spool_dir, module.spool_max_bytes)
+                self.spool.load()
+            except Exception,e:
+                # the module is not ready to send messages yet, log locally only
+                module.log_warning("unable to load the publish spool from "+module.spool_dir+": "+exception.get(e), False)
+                self.spool = None
+        # thread replaying the spooled messages once connected
+        self.replay_thread = None
         # queue configuration messages while not configured
         self.configuration_queue = collections.deque(maxlen=500)
-        # use a queue for exchanging incoming messages with consumer threads
-        self.consumer_queue = Queue.Queue(maxsize=0)
+        # last accepted configurations saved on disk, if enabled
+        self.snapshot = Config_snapshot(module, module.config_snapshot_dir) if module.config_snapshot_dir != "" else None
         # number of consumer threads to create
-        self.consumer_threads = 1
-        # initialize consumer threads
+        self.consumer_threads = max(1, consumer_threads)
+        # how to assign messages to consumers: "topic", "sender", "args" or a function returning a key for a given message. Messages with the same key are consumed in order
+        self.shard_by = shard_by
+        # commands served by the consumers before any data message so to not wait behind a backlog
+        self.control_commands = ["CONF", "PING", "PONG", "STATUS", "METRICS"]
+        # QoS level of the commands not using the module's default one
+        self.default_qos = {"LOG": 0, "PING": 0, "PONG": 0, "METRICS": 0, "CONF": 2, "SAVE": 2, "DELETE": 2}
+        # lanes of the consumer queues from the highest priority with the number of messages served in each round
+        self.lanes = [["control", control_weight], ["data", data_weight]]
+        # keep track of the incoming messages shed by the overload policies
+        self.overload_stats = {"dropped_oldest": 0, "dropped_newest": 0, "coalesced": 0, "paused": 0, "paused_time": 0.0, "restarts": 0}
+        # true when the incoming queue is above the low watermark
+        self.overloaded = False
+        # topics unsubscribed by the "pause" overload policy with [the time they have been paused, topics subscribed in their place for control messages], subscribed again once the queue drains
+        self.paused_topics = {}
+        # initialize consumer threads, each with its own queue for exchanging incoming messages
         self.consumers = []
         for i in range(0, self.consumer_threads):
-            self.consumers.append(Mqtt_consumer(i, self))
+            self.consumers.append(Mqtt_consumer(i, self, Lane_queue(self.lanes, self.get_lane)))
+        # counters of the messages received and sent by command, kept so not to look them up in the registry for every message
+        self.messages_in = {}
+        self.messages_out = {}
+        self.connects = module.metrics.counter("connects")
+        module.metrics.gauge("queue_size", self.get_queue_size)
+        module.metrics.gauge("publish_queue_size", self.get_publish_queue_size)
         
-    # connect to the MQTT broker
+    # connect to the MQTT broker in background, reconnecting with exponential backoff whenever disconnected
     def __connect(self):
         # setup TLS for tcp transport if needed
         if self.module.gateway_ssl and self.module.gateway_transport == "tcp": 
@@ -44,52 +94,449 @@ class Mqtt_client():
         # setup SSL for websocket transport if needed
         elif self.module.gateway_ssl and self.module.gateway_transport == "websockets":
             self.gateway.tls_set(cert_reqs=ssl.CERT_NONE)
-        # try to connect to the gateway until succeeding
-        while self.module.connected == False:
-            try:
-                self.module.log_debug("Connecting to "+self.module.gateway_hostname+":"+str(self.module.gateway_port)+" ("+self.module.gateway_transport+", ssl="+str(self.module.gateway_ssl)+")")
-                self.gateway.connect(self.module.gateway_hostname, self.module.gateway_port)
-                # TODO: this has to be moved into on_connect but is never called if moved
-                self.module.connected = True
-                # TODO: last will? e.g. log a disconnecting message
-            except Exception,e:
-                self.module.log_warning("Unable to connect to "+self.module.gateway_hostname+":"+str(self.module.gateway_port)+" - "+exception.get(e))
-                self.module.sleep(10)
-
-    # subscribe to a given topic
-    def __subscribe(self, topic):
-        self.module.log_debug("Subscribing topic "+topic)
-        self.gateway.unsubscribe(topic)
-        self.gateway.subscribe(topic, qos=2)
+        self.module.log_debug("Connecting to "+self.module.gateway_hostname+":"+str(self.module.gateway_port)+" ("+self.module.gateway_transport+", ssl="+str(self.module.gateway_ssl)+")")
+        self.network = Mqtt_network(self.gateway, self.module.gateway_hostname, self.module.gateway_port, self.module.reconnect_min_delay, self.module.reconnect_max_delay, lambda severity, text: getattr(self.module, "log_"+severity)(text))
+        self.network.start()
+
+    # subscribe to the given [topic, qos] with a single request
+    def __subscribe(self, topics):
+        if len(topics) == 0: return
+        self.module.log_debug("Subscribing "+", ".join([topic+" (qos "+str(qos)+")" for topic, qos in topics]))
+        if self.connection is not None: self.connection.subscribe(self, topics)
+        else: self.gateway.subscribe(topics)
+
+    # send a topic and its payload to the gateway
+    def __send(self, topic, payload, retain, qos):
+        if self.connection is not None: self.connection.publish(topic, payload, retain, qos)
+        elif self.publisher is not None: self.publisher.put(topic, payload, retain, qos)
+        else: self.gateway.publish(topic, payload, retain=retain, qos=qos)
+
+    # return the QoS level of the given command
+    def get_qos(self, command):
+        return self.default_qos.get(command, self.module.qos)
         
     # Build the full topic (e.g. egeoffrey/v1/<house_id>/<from_module>/<to_module>/<command>/<args>)
     def __build_topic(self, house_id, from_module, to_module, command, args):
         if args == "": args = "null"
         return "/".join(["egeoffrey", constants.API_VERSION, house_id, from_module, to_module, command, args])
 
-    # publish a given topic 
-    def publish(self, house_id, to_module, command, args, payload_data, retain=False):
-        # serialize the payload in a json format
+    # publish a given topic. If qos is not given, the default one of the command is used
+    def publish(self, house_id, to_module, command, args, payload_data, retain=False, payload_codec=codec.DEFAULT, qos=None):
+        if qos is None: qos = self.get_qos(command)
+        self.__count(self.messages_out, "messages_out", command)
+        # serialize the payload with the requested codec (json by default)
         payload = payload_data
-        if payload is not None: payload = json.dumps(payload)
+        if payload is not None: payload = codec.encode(payload, payload_codec)
         # build the topic to publish to
         topic = self.__build_topic(house_id, self.module.fullname, to_module, command, args)
+        # spool the message if offline or while older spooled messages are being replayed
+        if self.spool is not None:
+            try:
+                if self.spool.put(topic, payload, retain, qos, not self.module.connected): return
+            except Exception,e:
+                self.module.log_error("unable to spool the message published on "+topic+": "+exception.get(e), False)
         # publish if connected
         if self.module.connected:
-            info = self.gateway.publish(topic, payload, retain=retain, qos=2)
+            self.__send(topic, payload, retain, qos)
         # queue the message if offline
         else:
-            self.publish_queue.append([topic, payload, retain])
+            self.publish_queue.append([topic, payload, retain, qos])
             
+    # increase the counter of the messages of the given command
+    def __count(self, counters, name, command):
+        counter = counters.get(command)
+        if counter is None:
+            counter = self.module.metrics.counter(name, command=command)
+            counters[command] = counter
+        counter.value += 1
+
+    # handle a message received from the bus (called by the mqtt network thread)
+    def receive(self, topic, payload, retain):
+        try:
+            # parse the incoming request into a message data structure (payload will be decoded by the consumer only if needed)
+            message = Message()
+            message.parse(topic, payload, retain, lazy=self.module.lazy_payload)
+            if self.module.verbose: self.module.log_debug("Received message "+message.dump(), False)
+        except Exception,e:
+            self.module.log_error("Invalid message received on "+topic+" - "+str(payload)+": "+exception.get(e))
+            return
+        # ensure this message is for this house
+        if message.house_id != "*" and message.house_id != self.module.house_id:
+            self.module.log_debug("received message for the wrong house "+message.house_id+": "+message.dump())
+            return
+        # a message of this process delivered locally and mirrored to the gateway has been received already
+        if self.__is_mirrored(message): return
+        # unpack a batch of messages and queue each of them
+        if message.command == "BATCH":
+            try:
+                for item in message.get_payload()["data"]:
+                    command, args, payload = item
+                    entry = Message()
+                    entry.parse(self.__build_topic(message.house_id, message.sender, message.recipient, str(command), str(args)), None, message.retain)
+                    entry.set_payload(payload)
+                    entry.codec = message.codec
+                    self.__queue(entry)
+            except Exception,e:
+                self.module.log_error("Invalid batch received on "+topic+": "+exception.get(e))
+            return
+        self.__queue(message)
+
+    # deliver a message sent by this module directly to the modules of this process subscribing it. Return False if it has to go through the gateway instead
+    def send_local(self, message, args):
+        # retained messages, broadcasts and messages for other modules have to go through the gateway
+        if message.retain or message.recipient == "*/*" or message.house_id != self.module.house_id: return False
+        if loopback.get(message.recipient) is None: return False
+        topic = self.__build_topic(message.house_id, self.module.fullname, message.recipient, message.command, args)
+        # every local module subscribing the topic (e.g. the recipient and any inspection listener) gets a message sharing the same payload
+        for mqtt_client in loopback.get_all():
+            if len(mqtt_client.topics_subscribed.match(topic)) == 0: continue
+            entry = Message()
+            entry.parse(topic, None, False)
+            message.share_payload(entry)
+            mqtt_client.receive_local(entry)
+        # if mirrored, the message is counted when published
+        if not self.module.loopback_mirror: self.__count(self.messages_out, "messages_out", message.command)
+        return True
+
+    # return true if the given message, received from the gateway, has been sent by a module of this process and delivered locally already (see send_local())
+    def __is_mirrored(self, message):
+        if message.retain or message.recipient == "*/*" or message.command == "BATCH" or message.house_id != self.module.house_id: return False
+        sender = loopback.get(message.sender)
+        if sender is None or not sender.module.loopback or not sender.module.loopback_mirror: return False
+        return loopback.get(message.recipient) is not None
+
+    # receive a message from a module of this process
+    def receive_local(self, message):
+        if self.module.verbose: self.module.log_debug("Received local message "+message.dump(), False)
+        self.__queue(message)
+
+    # return the number of messages waiting to be consumed
+    def get_queue_size(self):
+        return sum([consumer.queue.qsize() for consumer in self.consumers])
+
+    # return the idents of the consumer threads running
+    def get_consumer_thread_ids(self):
+        return [consumer.ident for consumer in self.consumers if consumer.is_alive()]
+
+    # return the number of outgoing messages waiting to be published, while offline or in the publishing pipeline
+    def get_publish_queue_size(self):
+        stats = self.get_publish_stats()
+        return len(self.publish_queue) + (sum(stats["queued"]) if stats is not None else 0)
+
+    # return the number of outgoing messages published for each QoS level, dropped because the pipeline was full, queued and in flight
+    def get_publish_stats(self):
+        if self.connection is not None: return self.connection.get_publish_stats()
+        if self.publisher is not None: return self.publisher.get_stats()
+        return None
+
+    # return the number of messages spooled, replayed and dropped, and the messages and bytes waiting on disk
+    def get_spool_stats(self):
+        if self.spool is None: return None
+        return self.spool.get_stats()
+
+    # return the lane of the consumer queues the given message belongs to
+    def get_lane(self, message):
+        return "control" if message.command in self.control_commands else "data"
+
+    # return for each lane the number of messages consumed and waiting, the time spent in the queue and in the handler
+    def get_stats(self):
+        stats = {}
+        for lane, weight in self.lanes:
+            entry = {"consumed": 0, "queued": 0, "queue_wait_avg": 0.0, "queue_wait_max": 0.0, "handler_time_avg": 0.0}
+            queue_wait = handler_time = 0.0
+            for consumer in self.consumers:
+                consumed, consumer_queue_wait, consumer_queue_wait_max, consumer_handler_time = consumer.stats[lane]
+                entry["consumed"] = entry["consumed"] + consumed
+                entry["queued"] = entry["queued"] + consumer.queue.lane_size(lane)
+                entry["queue_wait_max"] = max(entry["queue_wait_max"], consumer_queue_wait_max)
+                queue_wait = queue_wait + consumer_queue_wait
+                handler_time = handler_time + consumer_handler_time
+            if entry["consumed"] > 0:
+                entry["queue_wait_avg"] = queue_wait/entry["consumed"]
+                entry["handler_time_avg"] = handler_time/entry["consumed"]
+            stats[lane] = entry
+        return stats
+
+    # return the consumer in charge of the given message
+    def __get_consumer(self, message):
+        if len(self.consumers) == 1: return self.consumers[0]
+        # configuration messages are consumed by the same consumer so to keep the configuration handshake sequential
+        if message.sender == "controller/config" and message.command == "CONF": return self.consumers[0]
+        if callable(self.shard_by): key = self.shard_by(message)
+        elif self.shard_by == "sender": key = message.sender
+        elif self.shard_by == "args": key = message.args
+        else: key = message.topic
+        return self.consumers[hash(key) % len(self.consumers)]
+
+    # return the overload policy of the first matching listener which has one or the module's one
+    def __get_overload_policy(self, message):
+        for pattern, listener in self.topics_subscribed.match(message.topic):
+            if listener is not None and listener.get("overload_policy") is not None: return listener["overload_policy"]
+        return self.module.overload_policy
+
+    # restart the module, asking the watchdog
+    def __restart(self):
+        if self.module.watchdog is None: return
+        self.module.log_error("the incoming message queue is too big, requesting our watchdog to restart the module")
+        self.overload_stats["restarts"] = self.overload_stats["restarts"] + 1
+        self.module.watchdog.restart_module(self.module.fullname)
+
+    # unsubscribe the given topics from the gateway
+    def __unsubscribe(self, topics):
+        for topic in topics:
+            if self.connection is not None: self.connection.unsubscribe(self, topic)
+            elif self.gateway is not None: self.gateway.unsubscribe(topic)
+
+    # return the topics to subscribe in place of the given pattern while paused so control messages (e.g. configurations and pings) keep flowing, None if it cannot be paused
+    def __get_pause_topics(self, pattern):
+        levels = pattern.split("/")
+        # the command is the 8th level (egeoffrey/v1/<house_id>/<from_module>/<to_module>/<command>/<args>)
+        if len(levels) < 9 or "#" in levels[:8] or levels[7] in self.control_commands: return None
+        if levels[7] != "+": return []
+        # topics subscribed by the module's own listeners must not be unsubscribed on resume
+        topics = ["/".join(levels[:7]+[command]+levels[8:]) for command in self.control_commands]
+        return [topic for topic in topics if topic not in self.topics_to_subscribe]
+
+    # unsubscribe the topics the given message has been received on so the module stops receiving them until the incoming queue drains, without blocking the network thread. Return False if there was nothing to pause
+    def __pause(self, message):
+        paused = []
+        in_flight = False
+        with self.lock:
+            for pattern, listener in self.topics_subscribed.match(message.topic):
+                # the message was already on its way when the topic was paused
+                if pattern in self.paused_topics:
+                    in_flight = True
+                    continue
+                pause_topics = self.__get_pause_topics(pattern)
+                if pause_topics is None: continue
+                self.paused_topics[pattern] = [time.time(), pause_topics]
+                paused.append([pattern, self.topics_to_subscribe[pattern]["qos"], pause_topics])
+            self.overload_stats["paused"] = self.overload_stats["paused"] + len(paused)
+            connected = self.module.connected
+        if len(paused) == 0: return in_flight
+        self.module.log_warning("the incoming message queue is too big, pausing "+", ".join([pattern for pattern, qos, pause_topics in paused]))
+        # if not connected, all the topics will be subscribed again once connected
+        if not connected: return True
+        # the patterns stay in topics_subscribed so the messages already queued are still dispatched. Subscribe the control topics before unsubscribing the pattern so not to miss any
+        self.__subscribe([(topic, qos) for pattern, qos, pause_topics in paused for topic in pause_topics])
+        self.__unsubscribe([pattern for pattern, qos, pause_topics in paused])
+        return True
+
+    # subscribe again the paused topics once the incoming queue is back below the low watermark or they have been paused for too long
+    def resume(self):
+        if len(self.paused_topics) == 0: return
+        queue_drained = self.get_queue_size() <= self.module.queue_low_watermark
+        now = time.time()
+        with self.lock:
+            resumed = [[pattern, pause_topics] for pattern, (paused_at, pause_topics) in self.paused_topics.items() if queue_drained or now - paused_at >= self.module.queue_pause_timeout]
+            if len(resumed) == 0: return
+            for pattern, pause_topics in resumed:
+                self.overload_stats["paused_time"] = self.overload_stats["paused_time"] + now - self.paused_topics.pop(pattern)[0]
+            # patterns unsubscribed in the meantime are not subscribed again
+            topics = [(pattern, self.topics_to_subscribe[pattern]["qos"]) for pattern, pause_topics in resumed if pattern in self.topics_to_subscribe]
+            connected = self.module.connected
+        if len(topics) > 0: self.module.log_info("the incoming message queue has drained, resuming "+", ".join([topic for topic, qos in topics]))
+        # if not connected, the patterns will be subscribed once connected
+        if not connected: return
+        self.__subscribe(topics)
+        self.__unsubscribe([topic for pattern, pause_topics in resumed for topic in pause_topics])
+
+    # apply the overload policy to an incoming data message. Return True if the message has still to be queued
+    def __shed(self, message, consumer):
+        policy = self.__get_overload_policy(message)
+        if policy == "drop_newest":
+            self.overload_stats["dropped_newest"] = self.overload_stats["dropped_newest"] + 1
+            return False
+        elif policy == "coalesce":
+            # latest value wins: take the place of a message on the same topic still waiting in the queue
+            message.received_at = time.time()
+            if consumer.queue.replace("data", message, lambda queued: queued.topic) is None: return True
+            self.overload_stats["coalesced"] = self.overload_stats["coalesced"] + 1
+            return False
+        elif policy == "pause":
+            # queue the message which triggered the pause, it has been received already
+            if self.__pause(message): return True
+        elif policy == "restart":
+            self.__restart()
+            return False
+        # drop the oldest message by default (or when there is nothing left to pause), from the biggest backlog since the watermark applies to all of them
+        if len(self.consumers) > 1: consumer = max(self.consumers, key=lambda entry: entry.queue.lane_size("data"))
+        if consumer.queue.drop_oldest("data") is not None:
+            self.overload_stats["dropped_oldest"] = self.overload_stats["dropped_oldest"] + 1
+        return True
+
+    # log an error raised while consuming a message on the event loop
+    def __on_loop_error(self, e):
+        self.module.log_error("runtime error in the event loop: "+exception.get(e))
+
+    # queue an incoming message for the consumer threads
+    def __queue(self, message):
+        self.__count(self.messages_in, "messages_in", message.command)
+        try:
+            queue_size = self.get_queue_size()
+            # print a warning when the incoming queue starts getting too big and when it is back to normal
+            if queue_size > self.module.queue_low_watermark and not self.overloaded:
+                self.overloaded = True
+                self.module.log_warning("the incoming message queue is getting too big ("+str(queue_size)+" messages)")
+            elif queue_size <= self.module.queue_low_watermark and self.overloaded:
+                self.overloaded = False
+                self.module.log_info("the incoming message queue is back to normal ("+str(queue_size)+" messages), shed so far: "+str(self.overload_stats))
+            # subscribe again the paused topics if the consumers have been stuck for too long
+            if len(self.paused_topics) > 0: self.resume()
+            # if really too big despite the overload policy, there is something wrong happening, restart the module as a last resort
+            if self.module.queue_restart_watermark > 0 and queue_size > self.module.queue_restart_watermark and self.module.watchdog is not None:
+                self.__restart()
+                return
+            consumer = self.__get_consumer(message)
+            # above the high watermark apply the overload policy to data messages, control messages are never shed
+            if queue_size >= self.module.queue_high_watermark and self.get_lane(message) == "data":
+                if not self.__shed(message, consumer): return
+            # queue the message, keeping track of when so to measure the time spent in the queue
+            message.received_at = time.time()
+            consumer.queue.put_nowait(message)
+            # when running on an event loop, the message is consumed there
+            if self.event_loop is not None: self.event_loop.call_soon(consumer.consume_next, on_error=self.__on_loop_error)
+        except Exception,e:
+            self.module.log_error("Unable to queue incoming message: "+exception.get(e))
+
     # unsubscribe from a topic
     def unsubscribe(self, topic):
+        if topic in self.topics_to_subscribe: del self.topics_to_subscribe[topic]
         if topic not in self.topics_subscribed: return
         self.module.log_debug("Unsubscribing from "+topic)
         self.topics_subscribed.remove(topic)
-        self.gateway.unsubscribe(topic)
+        # a paused topic has been unsubscribed already, only the control topics subscribed in its place are left
+        with self.lock:
+            paused = self.paused_topics.pop(topic, None)
+        if paused is not None:
+            self.__unsubscribe(paused[1])
+            return
+        if self.connection is not None: self.connection.unsubscribe(self, topic)
+        else: self.gateway.unsubscribe(topic)
     
+    # deliver the configurations saved in the snapshot, so the module can start on the last known configuration without waiting for the gateway
+    def load_snapshot(self):
+        if self.snapshot is None: return
+        entries = self.snapshot.load()
+        if len(entries) == 0: return
+        # the topics will be subscribed once connected, but the listeners are needed now to dispatch the configurations
+        for topic, listener in self.topics_to_subscribe.items():
+            if topic not in self.topics_subscribed: self.topics_subscribed.add(topic, listener)
+        # consumers are not running yet, deliver the configurations directly and in order
+        for topic, payload in entries:
+            message = Message()
+            message.parse(topic, None, True)
+            message.set_payload(payload)
+            if message.house_id != self.module.house_id: continue
+            self.consumers[0].on_message_consume(message)
+        # live configurations identical to those just delivered will be ignored
+        self.snapshot.set_pending([topic for topic, payload in entries])
+        self.module.log_debug("loaded "+str(len(entries))+" configurations from the snapshot "+self.snapshot.filename)
+
+    # called once connected to the gateway (by the mqtt network thread)
+    def on_connect(self):
+        self.module.log_debug("Connected to "+self.module.gateway_hostname+":"+str(self.module.gateway_port))
+        self.connects.inc()
+        # call user's callback
+        self.module.on_connect()
+        # subscribe to the requested topics
+        with self.lock:
+            self.module.connected = True
+            # all the topics are subscribed again, including the paused ones
+            now = time.time()
+            pause_topics = []
+            for pattern, (paused_at, topics) in self.paused_topics.items():
+                self.overload_stats["paused_time"] = self.overload_stats["paused_time"] + now - paused_at
+                pause_topics.extend(topics)
+            self.paused_topics.clear()
+            topics = self.topics_to_subscribe.items()
+            for topic, listener in topics:
+                self.topics_subscribed.add(topic, listener)
+        # paho holds its own lock while calling us and takes it when subscribing, so never subscribe while holding ours
+        self.__subscribe([(topic, listener["qos"]) for topic, listener in topics])
+        # the control topics subscribed while paused may be still there (shared connections and persistent sessions)
+        self.__unsubscribe(pause_topics)
+        # if there are message in the queue, send them
+        while True:
+            try:
+                entry = self.publish_queue.popleft()
+                self.__send(entry[0], entry[1], entry[2], entry[3])
+            except IndexError:
+                break
+        # replay the spooled messages in background
+        if self.spool is not None and (self.replay_thread is None or not self.replay_thread.is_alive()):
+            self.replay_thread = threading.Thread(target=self.__replay)
+            self.replay_thread.daemon = True
+            self.replay_thread.start()
+        # the retained configurations are sent right after subscribing, give them some time before reconciling the snapshot
+        if self.snapshot is not None and self.snapshot.has_pending():
+            timer = threading.Timer(self.module.config_snapshot_timeout, self.reconcile_snapshot, [self.connects.value])
+            timer.daemon = True
+            timer.start()
+
+    # deliver a null configuration for each configuration delivered from the snapshot but not sent again by the gateway since connecting, i.e. deleted while offline
+    def reconcile_snapshot(self, connects=None):
+        # if disconnected in the meantime, will be reconciled once connected again
+        if not self.module.connected or (connects is not None and connects != self.connects.value): return
+        topics = self.snapshot.expire_pending()
+        if len(topics) == 0: return
+        self.module.log_info("removing "+str(len(topics))+" configurations deleted while offline: "+", ".join(topics))
+        for topic in topics:
+            message = Message()
+            message.parse(topic, None, True)
+            self.__queue(message)
+
+    # publish the spooled messages in order while connected, at most spool_replay_rate per second so not to flood the gateway (run in a dedicated thread)
+    def __replay(self):
+        interval = 0.1
+        count = max(1, int(self.module.spool_replay_rate*interval))
+        replayed = 0
+        while self.module.connected and not self.module.stopping:
+            started = time.time()
+            try:
+                entries, position = self.spool.peek(count)
+                if len(entries) == 0: break
+                for topic, payload, retain, qos in entries:
+                    self.__send(topic, payload, retain, qos)
+                self.spool.commit(position)
+            except Exception,e:
+                self.module.log_error("unable to replay the spooled messages: "+exception.get(e))
+                break
+            replayed = replayed + len(entries)
+            elapsed = time.time() - started
+            if elapsed < interval: time.sleep(interval - elapsed)
+        if replayed > 0: self.module.log_info("replayed "+str(replayed)+" messages spooled while offline, "+str(self.spool.get_stats()))
+
+    # called once disconnected from the gateway (by the mqtt network thread)
+    def on_disconnect(self, rc):
+        self.module.connected = False
+        # call user's callback
+        try: 
+            self.module.on_disconnect()
+        except Exception,e: 
+            self.module.log_error("runtime error during on_disconnect(): "+exception.get(e))
+        if rc == 0:
+            self.module.log_debug("Disconnected from "+self.module.gateway_hostname+":"+str(self.module.gateway_port))
+        else:
+            self.module.log_warning("Unexpected disconnection, reconnecting...")
+
     # called from module. Connect to the MQTT broker and subscribe to the requested topics
     def start(self):
+        # make this module reachable by the other modules of this process
+        loopback.register(self)
+        # share the connection with the other modules of the process (always when running on an event loop, persistent clients need their own session)
+        if self.event_loop is not None or (self.module.shared_connection and not self.module.persistent_client):
+            try:
+                self.load_snapshot()
+            except Exception,e:
+                self.module.log_warning("unable to load the configuration snapshot: "+exception.get(e))
+            # start message consumer threads, unless consuming on the event loop
+            if self.event_loop is None:
+                for consumer in self.consumers:
+                    consumer.start()
+            self.connection = mqtt_connection.get()
+            self.connection.add_client(self)
+            return
         # set client id. Format: egeoffrey-<house_id>-<scope>-<name>
         self.__client_id = "-".join(["egeoffrey", self.module.house_id, self.module.scope, self.module.name])
         # get an instance of the MQTT client object
@@ -100,120 +547,85 @@ class Mqtt_client():
         def __on_connect(client, userdata, flags, rc):
             try:
                 if rc == 0:
-                    self.module.log_debug("Connected to "+self.module.gateway_hostname+":"+str(self.module.gateway_port))
-                    # call user's callback
-                    self.module.on_connect()
-                    # subscribe to the requested topics
-                    for topic in self.topics_to_subscribe: 
-                        self.__subscribe(topic)
-                        self.topics_subscribed.append(topic)
-                    # if there are message in the queue, send them
-                    while True:
-                        try:
-                            entry = self.publish_queue.popleft()
-                            self.gateway.publish(entry[0], entry[1], retain=entry[2], qos=2)
-                        except IndexError:
-                            break
+                    if self.publisher is not None: self.publisher.reset()
+                    self.on_connect()
                 else:
-                    # unable to connect, retry
+                    # unable to connect, the network thread will retry
                     self.module.log_error("Cannot connect: " + mqtt.connack_string(rc))
                     self.module.connected = False
-                    self.__connect()
             except Exception,e:
                 self.module.log_error("runtime error in __on_connect(): "+exception.get(e))
             
         # what to do when receiving a message
         def __on_message(client, userdata, msg):
-            try:
-                # parse the incoming request into a message data structure
-                message = Message()
-                message.parse(msg.topic, msg.payload, msg.retain)
-                if self.module.verbose: self.module.log_debug("Received message "+message.dump(), False)
-            except Exception,e:
-                self.module.log_error("Invalid message received on "+msg.topic+" - "+msg.payload+": "+exception.get(e))
-                return
-            # ensure this message is for this house
-            if message.house_id != "*" and message.house_id != self.module.house_id:
-                self.module.log_debug("received message for the wrong house "+message.house_id+": "+message.dump())
-                return
-            # queue the message
-            try:
-                queue_size = self.consumer_queue.qsize()
-                # print a warning if the incoming queue is getting too big
-                if queue_size > 100:
-                    self.module.log_warning("the incoming message queue is getting too big ("+str(queue_size)+" messages)")
-                # if really too big, there is something wrong happening, ask the watchdog to restart our module
-                if queue_size > 500 and self.module.watchdog is not None:
-                    self.module.log_error("the incoming message queue is too big, requesting our watchdog to restart the module")
-                    self.module.watchdog.restart_module(self.module.fullname)
-                    return
-                # queue the message
-                self.consumer_queue.put_nowait(message)
-            except Exception,e:
-                self.module.log_error("Unable to queue incoming message: "+exception.get(e))
+            self.receive(msg.topic, msg.payload, msg.retain)
 
         # what to do upon disconnect
         def __on_disconnect(client, userdata, rc):
-            self.module.connected = False
-            # call user's callback
-            try: 
-                self.module.on_disconnect()
-            except Exception,e: 
-                self.module.log_error("runtime error during on_disconnect(): "+exception.get(e))
-            if rc == 0:
-                self.module.log_debug("Disconnected from "+self.module.gateway_hostname+":"+str(self.module.gateway_port))
-            else:
-                self.module.log_warning("Unexpected disconnection, reconnecting...")
-                self.__connect()
+            self.on_disconnect(rc)
             
         # set callbacks for mqtt
         self.gateway.on_connect = __on_connect
         self.gateway.on_message = __on_message
         self.gateway.on_disconnect = __on_disconnect
-        # connect to the gateway
+        # deliver the last known configuration before connecting, so not to wait for the gateway
+        try:
+            self.load_snapshot()
+        except Exception,e:
+            self.module.log_warning("unable to load the configuration snapshot: "+exception.get(e))
+        # publish from a dedicated thread if requested
+        if self.module.async_publish:
+            self.publisher = Mqtt_publisher(self.gateway, self.module.publish_windows, self.module.publish_queue_size, self.module.log_error)
+            self.publisher.start()
         self.gateway.username_pw_set(self.module.house_id, password=self.module.house_passcode)
-        self.__connect()
-        # start loop 
         try: 
             # start message consumer threads
             for consumer in self.consumers:
                 consumer.start()
-            # start mqtt network thread
-            self.gateway.loop_start()
+            # connect to the gateway and start mqtt network thread
+            self.__connect()
         except Exception,e: 
             self.module.log_error("Unexpected runtime error: "+exception.get(e))
 
-    # add a listener for the given request
-    def add_listener(self, from_module, to_module, command, args, wait_for_it):
+    # add a listener for the given request. If a handler is provided, it will be called instead of the module's callback. If qos is not given, the default one of the command is used
+    def add_listener(self, from_module, to_module, command, args, wait_for_it, handler=None, overload_policy=None, qos=None):
         topic = self.__build_topic("+", from_module, to_module, command, args)
+        if qos is None: qos = self.get_qos(command)
+        listener = {"handler": handler, "overload_policy": overload_policy, "qos": qos}
         if wait_for_it:
             # if this is mandatory topic, unconfigure the module and add it to the list of topics to wait for
-            self.topics_to_wait.append(topic)
+            self.topics_to_wait.add(topic)
             self.module.configured = False
             self.module.log_debug("will wait for configuration on "+topic)
-        # if connected, subscribe the topic and keep track of it
-        if self.module.connected: 
-            if topic in self.topics_subscribed: return topic
-            self.__subscribe(topic)
-            self.topics_subscribed.append(topic)
-        # if not connected, will subscribe once connected
-        else:
-            if topic in self.topics_to_subscribe: return topic
-            self.topics_to_subscribe.append(topic)
+        with self.lock:
+            # keep track of the topic so to subscribe it again upon reconnecting
+            self.topics_to_subscribe[topic] = listener
+            # if connected, subscribe the topic now (if already subscribed, just update the handler), otherwise will subscribe once connected
+            subscribe = self.module.connected and topic not in self.topics_subscribed
+            if self.module.connected: self.topics_subscribed.add(topic, listener)
+        # subscribe outside of the lock, see on_connect()
+        if subscribe: self.__subscribe([(topic, qos)])
         # return the topic so the user can unsubscribe from it if needed
         return topic
             
     # disconnect from the MQTT broker
     def stop(self):
+        loopback.unregister(self)
         # stop all message consumer threads
         for consumer in self.consumers:
             consumer.join()
+        # leave the shared connection
+        if self.connection is not None:
+            self.connection.remove_client(self)
+            self.connection = None
+            self.on_disconnect(0)
+            return
         # do nothing if not connected to the gateway
         if self.gateway == None: return
-        # stop the mqtt network thread
-        self.gateway.loop_stop()
-        # disconnect from the gateway
-        self.gateway.disconnect()
+        # hand the pending messages over to paho
+        if self.publisher is not None: self.publisher.stop()
+        # disconnect from the gateway and stop the mqtt network thread
+        if self.network is not None: self.network.stop()
         try:
             self.module.on_disconnect()
         except Exception,e: 
@@ -0,0 +1,189 @@
+### Connection to the gateway shared by the modules of the same process. Subscriptions are reference counted and incoming messages fanned out to the modules locally
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+
+import ssl
+import threading
+import uuid
+import paho.mqtt.client as mqtt
+
+import sdk.python.utils.exceptions as exception
+from sdk.python.module.helpers.topic_trie import Topic_trie
+from sdk.python.module.helpers.mqtt_publisher import Mqtt_publisher
+from sdk.python.module.helpers.mqtt_network import Mqtt_network
+
+class Mqtt_connection():
+    def __init__(self):
+        # mqtt object
+        self.gateway = None
+        self.connected = False
+        # pipeline publishing the outgoing messages from a dedicated thread, if used
+        self.publisher = None
+        # thread running the network loop and reconnecting when needed
+        self.network = None
+        # the mqtt clients of the modules sharing this connection
+        self.clients = []
+        # map each subscribed topic with the list of clients subscribing it
+        self.subscriptions = Topic_trie()
+        # highest QoS level requested for each subscribed topic
+        self.subscriptions_qos = {}
+        self.lock = threading.RLock()
+
+    # log a message through the first client's module
+    def __log(self, severity, text):
+        clients = self.clients
+        if len(clients) == 0: return
+        getattr(clients[0].module, "log_"+severity)(text)
+
+    # connect to the gateway with the settings of the given module. The network thread will keep reconnecting by itself
+    def __connect(self, module):
+        # set client id. Format: egeoffrey-<house_id>-shared-<process_id>
+        client_id = "-".join(["egeoffrey", module.house_id, "shared", process_id])
+        self.gateway = mqtt.Client(client_id=client_id, clean_session=True, userdata=None, transport=module.gateway_transport)
+        # setup TLS for tcp transport if needed
+        if module.gateway_ssl and module.gateway_transport == "tcp":
+            self.gateway.tls_set(ca_certs=module.gateway_ca_cert, certfile=module.gateway_certfile, keyfile=module.gateway_keyfile)
+            # do not check for certificate validity
+            self.gateway.tls_insecure_set(True)
+        # setup SSL for websocket transport if needed
+        elif module.gateway_ssl and module.gateway_transport == "websockets":
+            self.gateway.tls_set(cert_reqs=ssl.CERT_NONE)
+        self.gateway.username_pw_set(module.house_id, password=module.house_passcode)
+        self.gateway.on_connect = self.__on_connect
+        self.gateway.on_message = self.__on_message
+        self.gateway.on_disconnect = self.__on_disconnect
+        # publish from a dedicated thread if requested
+        if module.async_publish:
+            self.publisher = Mqtt_publisher(self.gateway, module.publish_windows, module.publish_queue_size, lambda text: self.__log("error", text))
+            self.publisher.start()
+        module.log_debug("Connecting to "+module.gateway_hostname+":"+str(module.gateway_port)+" ("+module.gateway_transport+", ssl="+str(module.gateway_ssl)+", shared)")
+        self.network = Mqtt_network(self.gateway, module.gateway_hostname, module.gateway_port, module.reconnect_min_delay, module.reconnect_max_delay, self.__log)
+        self.network.start()
+
+    # what to do upon connect (called by the network thread)
+    def __on_connect(self, client, userdata, flags, rc):
+        try:
+            if rc != 0:
+                self.__log("error", "Cannot connect: "+mqtt.connack_string(rc))
+                return
+            with self.lock:
+                self.connected = True
+                if self.publisher is not None: self.publisher.reset()
+                topics = [(topic, self.subscriptions_qos[topic]) for topic in self.subscriptions.patterns()]
+                clients = list(self.clients)
+            # subscribe again all the topics at once. paho holds its own lock while calling us and takes it when subscribing, so never subscribe while holding ours
+            if len(topics) > 0: self.gateway.subscribe(topics)
+            # notify the clients, which will subscribe their new topics
+            for mqtt_client in clients: mqtt_client.on_connect()
+        except Exception,e:
+            self.__log("error", "runtime error in __on_connect(): "+exception.get(e))
+
+    # deliver an incoming message to each client subscribing it, once (called by the network thread)
+    def __on_message(self, client, userdata, msg):
+        delivered = []
+        for topic, clients in self.subscriptions.match(msg.topic):
+            for mqtt_client in clients:
+                if mqtt_client in delivered: continue
+                delivered.append(mqtt_client)
+                mqtt_client.receive(msg.topic, msg.payload, msg.retain)
+
+    # what to do upon disconnect (called by the network thread)
+    def __on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        for mqtt_client in list(self.clients): mqtt_client.on_disconnect(rc)
+
+    # add a client to the connection, connecting on first use
+    def add_client(self, mqtt_client):
+        with self.lock:
+            if mqtt_client not in self.clients: self.clients.append(mqtt_client)
+            if self.gateway is None: self.__connect(mqtt_client.module)
+            connected = self.connected
+        # if already connected, there will be no connect event for this client
+        if connected: mqtt_client.on_connect()
+
+    # remove a client from the connection with its subscriptions, disconnecting when the last one leaves
+    def remove_client(self, mqtt_client):
+        with self.lock:
+            if mqtt_client in self.clients: self.clients.remove(mqtt_client)
+            topics = [topic for topic in self.subscriptions.patterns() if self.__remove_subscription(mqtt_client, topic)]
+            if self.gateway is None: return
+            gateway = self.gateway
+            connected = self.connected
+            last = len(self.clients) == 0
+            if last:
+                publisher = self.publisher
+                network = self.network
+                self.gateway = None
+                self.publisher = None
+                self.network = None
+                self.connected = False
+        # unsubscribe the topics nobody else is interested in (outside of the lock, see __on_connect())
+        if not last:
+            if connected and len(topics) > 0: gateway.unsubscribe(topics)
+            return
+        # hand the pending messages over to paho
+        if publisher is not None: publisher.stop()
+        network.stop()
+
+    # subscribe the given [topic, qos] on behalf of a client, only the first subscriber and those requesting a higher QoS level reach the gateway, with a single request
+    def subscribe(self, mqtt_client, topics):
+        to_subscribe = []
+        with self.lock:
+            for topic, qos in topics:
+                clients = self.subscriptions.get(topic)
+                if clients is None: clients = []
+                if mqtt_client in clients: continue
+                # lists are replaced and never modified so the network thread can iterate them without locking
+                self.subscriptions.add(topic, clients+[mqtt_client])
+                if topic in self.subscriptions_qos and self.subscriptions_qos[topic] >= qos: continue
+                self.subscriptions_qos[topic] = qos
+                to_subscribe.append((topic, qos))
+            gateway = self.gateway if self.connected else None
+        # if not connected, will be subscribed once connected
+        if gateway is not None and len(to_subscribe) > 0: gateway.subscribe(to_subscribe)
+
+    # remove a client from the subscribers of a topic (the lock must be held). Return True if it was the last one
+    def __remove_subscription(self, mqtt_client, topic):
+        clients = self.subscriptions.get(topic)
+        if clients is None or mqtt_client not in clients: return False
+        clients = [entry for entry in clients if entry is not mqtt_client]
+        if len(clients) > 0:
+            self.subscriptions.add(topic, clients)
+            return False
+        self.subscriptions.remove(topic)
+        del self.subscriptions_qos[topic]
+        return True
+
+    # unsubscribe a topic on behalf of a client, only the last subscriber reaches the gateway
+    def unsubscribe(self, mqtt_client, topic):
+        with self.lock:
+            if not self.__remove_subscription(mqtt_client, topic) or not self.connected: return
+            gateway = self.gateway
+        gateway.unsubscribe(topic)
+
+    # publish a message on behalf of a client
+    def publish(self, topic, payload, retain, qos):
+        publisher = self.publisher
+        if publisher is not None: publisher.put(topic, payload, retain, qos)
+        else: self.gateway.publish(topic, payload, retain=retain, qos=qos)
+
+    # return the statistics of the publishing pipeline, if used
+    def get_publish_stats(self):
+        publisher = self.publisher
+        if publisher is None: return None
+        return publisher.get_stats()
+
+# identifier of this process, unique across the installation (the pid is not, e.g. every container runs its package as pid 1)
+process_id = uuid.uuid4().hex[:12]
+
+# the connection shared by the modules of this process
+shared_connection = None
+shared_connection_lock = threading.Lock()
+
+# return the shared connection
+def get():
+    global shared_connection
+    with shared_connection_lock:
+        if shared_connection is None: shared_connection = Mqtt_connection()
+        return shared_connection
@@ -1,105 +1,192 @@
 import collections
-import paho.mqtt.client as mqtt
 import Queue
 import threading
+import time
+import types
 
 import sdk.python.utils.exceptions as exception
 from sdk.python.module.helpers.message import Message
+import sdk.python.module.helpers.tracing as tracing
 
 # consumer thread which consume incoming mqtt messages
 class Mqtt_consumer(threading.Thread):
-    def __init__(self, index, mqtt_client):
+    def __init__(self, index, mqtt_client, queue):
         # call threading superclass
         super(Mqtt_consumer, self).__init__()
-        # keep track of this thread index and the mqtt client
+        # keep track of this thread index, the mqtt client and the queue to consume
         self.index = index
         self.mqtt_client = mqtt_client
+        self.queue = queue
         self.running = False
+        # for each lane of the queue keep track of [messages consumed, total time spent in the queue, max time spent in the queue, total time spent in the handler]
+        self.stats = dict([[lane, [0, 0.0, 0.0, 0.0]] for lane, weight in self.mqtt_client.lanes])
+        # histograms of the time spent in the queue by lane and in the handlers
+        metrics = self.mqtt_client.module.metrics
+        self.queue_wait = dict([[lane, metrics.histogram("queue_wait_seconds", lane=lane)] for lane, weight in self.mqtt_client.lanes])
+        self.handler_time = {"on_message": metrics.histogram("handler_seconds", handler="on_message"), "on_configuration": metrics.histogram("handler_seconds", handler="on_configuration")}
 
     # start the consumer thread
     def run(self):
-        queue = self.mqtt_client.consumer_queue
+        queue = self.queue
         self.running = True
         # run forever
         while self.running:
-            message = None
-            try:
-                # get a message from the queue, waiting for maximum 1 second if empty
-                message = queue.get(True, 1)
-            except Exception,e: 
-                # timeout exceeded, start over 
+            # get a message from the queue, waiting until available. Waiting with a timeout would poll the queue, delaying the messages
+            message = queue.get()
+            # None is queued by join() to wake the thread up
+            if message is None:
+                queue.task_done()
                 continue
-            if message is None: continue
-            # consume the message
-            try:
-                self.on_message_consume(message)
-            except Exception,e: 
-                self.mqtt_client.module.log_error("runtime error during on_message_consume() - "+message.dump()+": "+exception.get(e))
-            # commit message consumed
-            queue.task_done()
+            self.consume(message)
+
+    # consume a message taken from the queue
+    def consume(self, message):
+        # messages sent while handling a traced message are part of its trace
+        span = tracing.extract(self.mqtt_client.module, message) if self.mqtt_client.module.tracing else None
+        started = time.time()
+        try:
+            self.on_message_consume(message)
+        except Exception,e: 
+            self.mqtt_client.module.log_error("runtime error during on_message_consume() - "+message.dump()+": "+exception.get(e))
+        # keep track separately of the time spent in the queue and in the handler
+        lane = self.mqtt_client.get_lane(message)
+        stats = self.stats[lane]
+        queue_wait = started - message.received_at if message.received_at is not None else 0.0
+        handler_time = time.time() - started
+        if span is not None: tracing.finish(self.mqtt_client.module, span, started, started + handler_time)
+        stats[0] = stats[0] + 1
+        stats[1] = stats[1] + queue_wait
+        stats[2] = max(stats[2], queue_wait)
+        stats[3] = stats[3] + handler_time
+        self.queue_wait[lane].observe(queue_wait)
+        self.handler_time["on_configuration" if message.command == "CONF" else "on_message"].observe(handler_time)
+        # commit message consumed
+        self.queue.task_done()
+        # subscribe again the topics paused by the overload policy once the queue has drained
+        if len(self.mqtt_client.paused_topics) > 0: self.mqtt_client.resume()
+
+    # consume the next message in the queue, if any (called by the event loop instead of running the thread)
+    def consume_next(self):
+        try:
+            message = self.queue.get_nowait()
+        except Queue.Empty:
+            return
+        if message is None:
+            self.queue.task_done()
+            return
+        self.consume(message)
     
     # stop the thread
     def join(self):
         self.running = False
+        self.queue.put(None)
+
+    # when a callback returns a coroutine, run it on the event loop logging its errors. Otherwise return the callback's result
+    def __spawn(self, result, callback_name):
+        if self.mqtt_client.event_loop is None or not isinstance(result, types.GeneratorType): return result
+        def done(future):
+            if future.exception() is not None: self.mqtt_client.module.log_error("runtime error during "+callback_name+": "+exception.get(future.exception()))
+        self.mqtt_client.event_loop.spawn(result).add_done_callback(done)
+        return None
+
+    # return the handler of the first matching listener which has one, if any. This way a message is delivered only once even with overlapping subscribers
+    def __get_handler(self, matches):
+        for pattern, listener in matches:
+            if listener is not None and listener["handler"] is not None: return listener["handler"]
+        return None
+
+    # deliver a configuration to the given handler or the module and call accepted(message) unless rejected (returning False). A coroutine is run on the event loop and accepted() called once completed, based on its result
+    def __deliver_configuration(self, message, handler, accepted):
+        on_configuration = handler if handler is not None else self.mqtt_client.module.on_configuration
+        try:
+            result = on_configuration(message)
+        except Exception,e: 
+            self.mqtt_client.module.log_error("runtime error during on_configuration() - "+message.dump()+": "+exception.get(e))
+            return
+        if self.mqtt_client.event_loop is None or not isinstance(result, types.GeneratorType):
+            if result is None or result: accepted(message)
+            return
+        def done(future):
+            if future.exception() is not None:
+                self.mqtt_client.module.log_error("runtime error during on_configuration() - "+message.dump()+": "+exception.get(future.exception()))
+                return
+            if future.result() is not None and not future.result(): return
+            try:
+                accepted(message)
+            except Exception,e:
+                self.mqtt_client.module.log_error("Cannot handle configuration "+message.topic+": "+exception.get(e))
+        self.mqtt_client.event_loop.spawn(result).add_done_callback(done)
+
+    # keep track of a configuration accepted by the module in the snapshot
+    def __update_snapshot(self, message):
+        if self.mqtt_client.snapshot is not None: self.mqtt_client.snapshot.update(message)
+
+    # keep track of a configuration accepted by the module and start the module once all those to wait for have been received
+    def __on_configuration_accepted(self, message):
+        self.__update_snapshot(message)
+        # check if we had to wait for this message to start the module
+        configuration_consumed = False
+        if len(self.mqtt_client.topics_to_wait) > 0:
+            for req_pattern, value in self.mqtt_client.topics_to_wait.match(message.topic):
+                self.mqtt_client.module.log_debug("received configuration "+message.topic)
+                configuration_consumed = True
+                self.mqtt_client.topics_to_wait.remove(req_pattern)
+                # if there are no more topics to wait for, this service is now configured
+                if len(self.mqtt_client.topics_to_wait) == 0: 
+                    self.mqtt_client.module.log_info("Configuration completed")
+                    # set the configured flag to true, this will cause the service to start (on_start() is in the main thread)
+                    self.mqtt_client.module.configured = True
+                    # now that is configured, if there are configuration messages waiting in the queue, deliver them
+                    while True:
+                        try:
+                            queued_message = self.mqtt_client.configuration_queue.popleft()
+                        except IndexError:
+                            break
+                        queued_handler = self.__get_handler(self.mqtt_client.topics_subscribed.match(queued_message.topic))
+                        self.__deliver_configuration(queued_message, queued_handler, self.__update_snapshot)
+            else:
+                self.mqtt_client.module.log_debug("still waiting for configuration on "+str(self.mqtt_client.topics_to_wait))
+        # if this message was not consumed and the module is still unconfigured, queue it, will be delivered once configured
+        if not configuration_consumed and not self.mqtt_client.module.configured:
+            self.mqtt_client.configuration_queue.append(message)
 
     # dispatch a new incoming message        
     def on_message_consume(self, message):
         try:
-            # identify the subscribed topic which caused this message to get here
-            for pattern in self.mqtt_client.topics_subscribed:
-                if mqtt.topic_matches_sub(pattern, message.topic):
-                    # if the message is a configuration
-                    if message.sender == "controller/config" and message.command == "CONF":
-                        # TODO: this is all executed by mqtt network thread so it is blocking. Move it
-                        # notify the module about the configuration just received
-                        try:
-                            is_valid_configuration = self.mqtt_client.module.on_configuration(message)
-                        except Exception,e: 
-                            self.mqtt_client.module.log_error("runtime error during on_configuration() - "+message.dump()+": "+exception.get(e))
-                            return
-                        # if the configuration has not been accepted by the module (returned False), ignore it
-                        if is_valid_configuration is not None and not is_valid_configuration: return
-                        # check if we had to wait for this message to start the module
-                        configuration_consumed = False
-                        if len(self.mqtt_client.topics_to_wait) > 0:
-                            for req_pattern in self.mqtt_client.topics_to_wait:
-                                if mqtt.topic_matches_sub(req_pattern, message.topic):
-                                    self.mqtt_client.module.log_debug("received configuration "+message.topic)
-                                    configuration_consumed = True
-                                    self.mqtt_client.topics_to_wait.remove(req_pattern)
-                                    # if there are no more topics to wait for, this service is now configured
-                                    if len(self.mqtt_client.topics_to_wait) == 0: 
-                                        self.mqtt_client.module.log_info("Configuration completed")
-                                        # set the configured flag to true, this will cause the service to start (on_start() is in the main thread)
-                                        self.mqtt_client.module.configured = True
-                                        # now that is configured, if there are configuration messages waiting in the queue, deliver them
-                                        while True:
-                                            try:
-                                                queued_message = self.mqtt_client.configuration_queue.popleft()
-                                                try:
-                                                    self.mqtt_client.module.on_configuration(queued_message)
-                                                except Exception,e: 
-                                                    self.mqtt_client.module.log_error("runtime error during on_configuration() - "+queued_message.dump()+": "+exception.get(e))
-                                            except IndexError:
-                                                break
-                                    else:
-                                        self.mqtt_client.module.log_debug("still waiting for configuration on "+str(self.mqtt_client.topics_to_wait))
-                        # if this message was not consumed and the module is still unconfigured, queue it, will be delivered once configured
-                        if not configuration_consumed and not self.mqtt_client.module.configured:
-                            self.mqtt_client.configuration_queue.append(message)
-                    # handle internal messages
-                    elif message.command == "PING":
-                        message.reply()
-                        message.command = "PONG"
-                        self.mqtt_client.module.send(message)
-                    # notify the module about this message (only if fully configured)
-                    else:
-                        if self.mqtt_client.module.configured: 
-                            try: 
-                                self.mqtt_client.module.on_message(message)
-                            except Exception,e: 
-                                self.mqtt_client.module.log_error("runtime error during on_message(): "+exception.get(e))
-                    # avoid delivering the same message multiple times for overlapping subscribers
-                    return 
+            # identify the subscribed topics which caused this message to get here
+            matches = self.mqtt_client.topics_subscribed.match(message.topic)
+            if len(matches) == 0: return
+            handler = self.__get_handler(matches)
+            # if the message is a configuration
+            if message.sender == "controller/config" and message.command == "CONF":
+                # ignore the configuration if identical to the one already delivered from the snapshot
+                if self.mqtt_client.snapshot is not None and self.mqtt_client.snapshot.is_replayed(message): return
+                # TODO: this is all executed by mqtt network thread so it is blocking. Move it
+                # notify the module about the configuration just received
+                self.__deliver_configuration(message, handler, self.__on_configuration_accepted)
+            # handle internal messages
+            elif message.command == "PING":
+                # report how long the ping has been waiting in the queue so the watchdog can tell it apart from the network roundtrip
+                queue_wait = time.time() - message.received_at if message.received_at is not None else 0.0
+                message.reply()
+                message.command = "PONG"
+                message.set("queue_wait", round(queue_wait, 3))
+                self.mqtt_client.module.send(message)
+            # deliver the replies to the requests waiting for them instead of the module
+            elif self.mqtt_client.module.sessions.resolve(message):
+                return
+            # report the module's metrics. Replies carry the metrics and are delivered to the module as any other message
+            elif message.command == "METRICS" and message.get_data(copy=False) == {}:
+                message.reply()
+                message.set_data(self.mqtt_client.module.metrics.snapshot())
+                self.mqtt_client.module.send(message)
+            # notify the module about this message (only if fully configured)
+            else:
+                if self.mqtt_client.module.configured: 
+                    on_message = handler if handler is not None else self.mqtt_client.module.on_message
+                    try: 
+                        self.__spawn(on_message(message), "on_message()")
+                    except Exception,e: 
+                        self.mqtt_client.module.log_error("runtime error during on_message(): "+exception.get(e))
         except Exception,e:
             self.mqtt_client.module.log_error("Cannot handle request: "+exception.get(e))
\ No newline at end of file
@@ -0,0 +1,70 @@
+### Network thread of a paho client, connecting to the gateway and reconnecting with exponential backoff and jitter so that paho's callbacks are never blocked and the clients do not reconnect all at once
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+
+import random
+import threading
+import paho.mqtt.client as mqtt
+
+import sdk.python.utils.exceptions as exception
+
+class Mqtt_network(threading.Thread):
+    # wait between min_delay and max_delay seconds between two attempts. log(severity, text) is used for reporting connection errors
+    def __init__(self, gateway, hostname, port, min_delay, max_delay, log):
+        super(Mqtt_network, self).__init__()
+        self.daemon = True
+        self.gateway = gateway
+        self.hostname = hostname
+        self.port = port
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.log = log
+        # "connecting", "connected", "waiting" (before trying again) or "stopped"
+        self.state = "connecting"
+        # failed attempts since the last time connected
+        self.attempts = 0
+        # number of connections established and failed attempts so far
+        self.stats = {"connects": 0, "failures": 0}
+        self.stopping = threading.Event()
+        self.gateway.connect_async(hostname, port)
+
+    # wait before trying again, longer after each failed attempt
+    def __wait(self, text):
+        self.attempts = self.attempts + 1
+        self.stats["failures"] = self.stats["failures"] + 1
+        delay = min(self.max_delay, self.min_delay * 2 ** (self.attempts - 1))
+        # the jitter spreads the clients disconnected at the same time (e.g. by a gateway restart)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.state = "waiting"
+        self.log("warning", text+", retrying in "+str(round(delay, 1))+" seconds")
+        self.stopping.wait(delay)
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.state = "connecting"
+            try:
+                self.gateway.reconnect()
+            except Exception,e:
+                self.__wait("Unable to connect to "+self.hostname+":"+str(self.port)+" - "+exception.get(e))
+                continue
+            # run the network loop (which calls the callbacks) until the connection is lost or closed by stop()
+            rc = mqtt.MQTT_ERR_SUCCESS
+            while rc == mqtt.MQTT_ERR_SUCCESS:
+                rc = self.gateway.loop(1)
+                if self.state == "connecting" and self.gateway.is_connected():
+                    self.state = "connected"
+                    self.attempts = 0
+                    self.stats["connects"] = self.stats["connects"] + 1
+            if self.stopping.is_set(): break
+            self.__wait("Connection to "+self.hostname+":"+str(self.port)+" lost ("+mqtt.error_string(rc)+")")
+        self.state = "stopped"
+
+    # disconnect (once the queued packets are written) and stop the thread
+    def stop(self):
+        self.stopping.set()
+        try:
+            self.gateway.disconnect()
+        except Exception:
+            pass
+        if self.is_alive() and threading.current_thread() is not self: self.join(5)
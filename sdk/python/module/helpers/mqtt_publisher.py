@@ -0,0 +1,116 @@
+### Outbound pipeline publishing the messages of one or more modules from a dedicated thread, with a bounded number of messages in flight for each QoS level
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+
+import collections
+import threading
+import paho.mqtt.client as mqtt
+
+import sdk.python.utils.exceptions as exception
+
+class Mqtt_publisher(threading.Thread):
+    # windows are the maximum number of messages in flight (not yet acknowledged or, for QoS 0, not yet written) for each QoS level. Errors are reported to on_error(text)
+    def __init__(self, gateway, windows, queue_size, on_error):
+        super(Mqtt_publisher, self).__init__()
+        self.daemon = True
+        self.gateway = gateway
+        self.windows = windows
+        self.on_error = on_error
+        # messages waiting to be published for each QoS level, the oldest are dropped when full
+        self.queues = [collections.deque(maxlen=queue_size) for qos in range(0, 3)]
+        # number of messages in flight for each QoS level and QoS level of each of them by message id
+        self.in_flight = [0, 0, 0]
+        self.pending = {}
+        # ids of the messages completed before publish() returned
+        self.completed = set()
+        self.condition = threading.Condition()
+        self.running = True
+        # number of messages published for each QoS level and dropped because the queue was full
+        self.stats = {"published": [0, 0, 0], "dropped": 0}
+        # paho has to keep in flight as many messages as allowed here
+        self.gateway.max_inflight_messages_set(windows[1]+windows[2])
+        self.gateway.on_publish = self.__on_publish
+
+    # queue a message to be published. Can be called from any thread, never blocks
+    def put(self, topic, payload, retain, qos):
+        with self.condition:
+            queue = self.queues[qos]
+            if len(queue) == queue.maxlen: self.stats["dropped"] = self.stats["dropped"] + 1
+            queue.append([topic, payload, retain])
+            self.condition.notify()
+
+    # return the number of messages which can be taken from the queues right now
+    def __get_ready(self):
+        ready = 0
+        for qos in range(0, 3):
+            ready = ready + min(len(self.queues[qos]), self.windows[qos] - self.in_flight[qos])
+        return ready
+
+    # a message has been written (QoS 0) or acknowledged (QoS 1 and 2) (called by the network thread)
+    def __on_publish(self, client, userdata, mid):
+        with self.condition:
+            qos = self.pending.pop(mid, None)
+            if qos is None:
+                self.completed.add(mid)
+                return
+            self.in_flight[qos] = self.in_flight[qos] - 1
+            self.condition.notify()
+
+    # hand a message over to paho, keeping track of it until completed
+    def __publish(self, qos, topic, payload, retain):
+        try:
+            info = self.gateway.publish(topic, payload, retain=retain, qos=qos)
+        except Exception,e:
+            self.on_error("unable to publish on "+topic+": "+exception.get(e))
+            with self.condition:
+                self.in_flight[qos] = self.in_flight[qos] - 1
+            return
+        with self.condition:
+            self.stats["published"][qos] = self.stats["published"][qos] + 1
+            # QoS 0 messages are discarded by paho when not connected, they will never complete
+            if info.mid in self.completed or (qos == 0 and info.rc != mqtt.MQTT_ERR_SUCCESS):
+                self.completed.discard(info.mid)
+                self.in_flight[qos] = self.in_flight[qos] - 1
+            else:
+                self.pending[info.mid] = qos
+
+    # forget the QoS 0 messages in flight, discarded by paho upon reconnecting. QoS 1 and 2 messages are sent again by paho
+    def reset(self):
+        with self.condition:
+            for mid, qos in self.pending.items():
+                if qos == 0: del self.pending[mid]
+            self.in_flight[0] = 0
+            self.completed.clear()
+            self.condition.notify()
+
+    # return the number of messages published, dropped, queued and in flight
+    def get_stats(self):
+        with self.condition:
+            return {"published": list(self.stats["published"]), "dropped": self.stats["dropped"], "queued": [len(queue) for queue in self.queues], "in_flight": list(self.in_flight)}
+
+    def run(self):
+        while True:
+            batch = []
+            with self.condition:
+                # wait for a message to publish with room in the window of its QoS level
+                while self.running and self.__get_ready() == 0: self.condition.wait()
+                for qos in range(0, 3):
+                    queue = self.queues[qos]
+                    # once stopping, hand everything left over to paho
+                    room = self.windows[qos] - self.in_flight[qos] if self.running else len(queue)
+                    while room > 0 and len(queue) > 0:
+                        batch.append([qos]+queue.popleft())
+                        self.in_flight[qos] = self.in_flight[qos] + 1
+                        room = room - 1
+                running = self.running
+            for qos, topic, payload, retain in batch:
+                self.__publish(qos, topic, payload, retain)
+            if not running: break
+
+    # hand the queued messages over to paho and stop the thread
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive(): self.join(5)
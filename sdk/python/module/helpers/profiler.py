@@ -0,0 +1,94 @@
+### Sampling profiler of the threads of a module, cheap enough to be started at runtime in production
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import os
+import sys
+import threading
+import time
+import collections
+
+# return the name of the function the given code object belongs to, as "function (file:line)"
+def get_function(code):
+    return code.co_name+" ("+os.path.basename(code.co_filename)+":"+str(code.co_firstlineno)+")"
+
+# return true if the given code object, the innermost of a stack, is of a thread waiting, e.g. for a message to consume or sleeping in module.sleep()
+def is_idle(code):
+    return (code.co_name == "wait" and os.path.basename(code.co_filename).startswith("threading.py")) or code.co_name == "sleep"
+
+class Profiler(threading.Thread):
+    # sample every interval seconds for duration seconds the stacks of the threads whose idents are returned by get_threads, then call on_done with the stats
+    def __init__(self, get_threads, duration, interval=0.01, on_done=None):
+        super(Profiler, self).__init__()
+        self.daemon = True
+        self.get_threads = get_threads
+        self.duration = duration
+        self.interval = interval
+        self.on_done = on_done
+        # map stacks (tuples of code objects from the outermost frame) with the number of samples
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.threads = set()
+        self.running = False
+
+    # take a sample of the stacks of the profiled threads
+    def sample(self):
+        frames = sys._current_frames()
+        for ident in self.get_threads():
+            frame = frames.get(ident)
+            if frame is None: continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples = self.samples + 1
+            self.threads.add(ident)
+
+    # return the top functions by self and cumulative samples and, if requested, the stacks in the collapsed format of flame graphs. Samples of waiting threads are skipped unless idle is true
+    def get_stats(self, top=20, collapsed=False, idle=False):
+        self_samples = collections.Counter()
+        cumulative_samples = collections.Counter()
+        stacks = collections.Counter()
+        samples = 0
+        idle_samples = 0
+        for stack, count in self.stacks.items():
+            if not idle and is_idle(stack[-1]):
+                idle_samples = idle_samples + count
+                continue
+            samples = samples + count
+            functions = [get_function(code) for code in stack]
+            self_samples[functions[-1]] += count
+            # recursive functions are counted once per sample
+            for function in set(functions):
+                cumulative_samples[function] += count
+            if collapsed: stacks[";".join(functions)] += count
+        # return the given samples as [function, samples, percentage of the samples]
+        def get_top(counter):
+            return [[function, count, round(100.0 * count / samples, 1)] for function, count in counter.most_common(top)]
+        stats = {
+            "duration": self.duration,
+            "interval": self.interval,
+            "threads": len(self.threads),
+            "samples": samples,
+            "idle_samples": idle_samples,
+            "top_self": get_top(self_samples),
+            "top_cumulative": get_top(cumulative_samples),
+        }
+        if collapsed: stats["collapsed"] = "\n".join([stack+" "+str(count) for stack, count in sorted(stacks.items())])
+        return stats
+
+    # stop sampling before the duration has elapsed
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        end = time.time() + self.duration
+        while self.running and time.time() < end:
+            self.sample()
+            time.sleep(self.interval)
+        self.running = False
+        if self.on_done is not None: self.on_done(self)
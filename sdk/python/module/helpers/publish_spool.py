@@ -0,0 +1,159 @@
+### Durable spool of the messages published while offline, kept on disk in append-only segments so to be replayed in order once connected, even after a restart
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import os
+import struct
+import threading
+import zlib
+
+import sdk.python.utils.exceptions as exception
+
+# header of each record: crc32 of the rest of the record, length of the topic, length of the payload (NULL_PAYLOAD if null), retain flag and qos
+HEADER = struct.Struct("!IHIBB")
+NULL_PAYLOAD = 0xFFFFFFFF
+
+class Publish_spool():
+    def __init__(self, module, directory, max_bytes):
+        self.module = module
+        self.directory = os.path.join(directory, module.fullname.replace("/", "_"))
+        # maximum size of the spool on disk, the oldest segment is dropped once exceeded
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(4096, max_bytes/10)
+        # segments from the oldest as [sequence, size in bytes, number of messages]
+        self.segments = []
+        # segment the messages are appended to and its sequence number, never reused so to not mistake a new segment for an old one
+        self.file = None
+        self.sequence = 0
+        # position of the replay in the oldest segment as [offset, number of messages]
+        self.position = [0, 0]
+        self.lock = threading.RLock()
+        self.stats = {"spooled": 0, "replayed": 0, "dropped": 0}
+
+    # return the path of the given segment
+    def __get_path(self, sequence):
+        return os.path.join(self.directory, "%012d.log" % sequence)
+
+    # read the records of a segment from the given offset, at most count of them (all if None). Return a list of [offset after the record, topic, payload, retain, qos]
+    def __read(self, sequence, offset, count):
+        records = []
+        with open(self.__get_path(sequence), "rb") as f:
+            f.seek(offset)
+            while count is None or len(records) < count:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size: break
+                crc, topic_length, payload_length, retain, qos = HEADER.unpack(header)
+                data = f.read(topic_length + (payload_length if payload_length != NULL_PAYLOAD else 0))
+                # stop at a record partially written or corrupted (e.g. the process died while writing it)
+                if len(data) < topic_length or zlib.crc32(header[4:]+data) & 0xFFFFFFFF != crc: break
+                offset = offset + HEADER.size + len(data)
+                payload = data[topic_length:] if payload_length != NULL_PAYLOAD else None
+                records.append([offset, data[:topic_length], payload, retain == 1, qos])
+        return records
+
+    # load the segments left on disk by a previous run
+    def load(self):
+        with self.lock:
+            if not os.path.isdir(self.directory): os.makedirs(self.directory)
+            sequences = sorted([int(filename[:-4]) for filename in os.listdir(self.directory) if filename.endswith(".log")])
+            for sequence in sequences:
+                records = self.__read(sequence, 0, None)
+                size = records[-1][0] if len(records) > 0 else 0
+                # drop what follows the last valid record
+                if os.path.getsize(self.__get_path(sequence)) != size:
+                    with open(self.__get_path(sequence), "r+b") as f: f.truncate(size)
+                self.segments.append([sequence, size, len(records)])
+                self.sequence = sequence
+            # resume the replay where it was left
+            try:
+                with open(os.path.join(self.directory, "cursor")) as f: sequence, offset, count = [int(value) for value in f.read().split()]
+                if len(self.segments) > 0 and self.segments[0][0] == sequence: self.position = [offset, count]
+                self.sequence = max(self.sequence, sequence)
+            except (IOError, ValueError):
+                pass
+            return self.get_size()
+
+    # return the number of messages waiting to be replayed (the lock must be held)
+    def get_size(self):
+        return sum([segment[2] for segment in self.segments]) - self.position[1]
+
+    # spool a message if offline or if older messages are still waiting to be replayed, so to keep them in order. Return True if spooled
+    def put(self, topic, payload, retain, qos, offline):
+        if isinstance(topic, unicode): topic = topic.encode("utf-8")
+        if isinstance(payload, unicode): payload = payload.encode("utf-8")
+        body = struct.pack("!HIBB", len(topic), len(payload) if payload is not None else NULL_PAYLOAD, 1 if retain else 0, qos) + topic + (payload if payload is not None else "")
+        record = struct.pack("!I", zlib.crc32(body) & 0xFFFFFFFF) + body
+        with self.lock:
+            if not offline and self.get_size() == 0: return False
+            # start a new segment when the current one is full
+            if self.file is None or self.segments[-1][1] + len(record) > self.segment_bytes:
+                if self.file is not None: self.file.close()
+                self.sequence = self.sequence + 1
+                self.file = open(self.__get_path(self.sequence), "ab")
+                self.segments.append([self.sequence, 0, 0])
+            # flushed at every message so to survive the process dying
+            self.file.write(record)
+            self.file.flush()
+            self.segments[-1][1] = self.segments[-1][1] + len(record)
+            self.segments[-1][2] = self.segments[-1][2] + 1
+            self.stats["spooled"] = self.stats["spooled"] + 1
+            # drop the oldest messages once too big
+            while sum([segment[1] for segment in self.segments]) > self.max_bytes and len(self.segments) > 1:
+                self.stats["dropped"] = self.stats["dropped"] + self.segments[0][2] - self.position[1]
+                self.__remove_oldest()
+            return True
+
+    # delete the oldest segment (the lock must be held)
+    def __remove_oldest(self):
+        sequence = self.segments.pop(0)[0]
+        self.position = [0, 0]
+        if len(self.segments) == 0 and self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.__get_path(sequence))
+        except OSError,e:
+            self.module.log_warning("unable to remove the spool segment "+self.__get_path(sequence)+": "+exception.get(e), False)
+
+    # return the next messages to replay as [topic, payload, retain, qos] and the position to commit once published
+    def peek(self, count):
+        with self.lock:
+            while len(self.segments) > 0:
+                sequence = self.segments[0][0]
+                records = self.__read(sequence, self.position[0], count) if self.position[1] < self.segments[0][2] else []
+                if len(records) > 0: return [record[1:] for record in records], [sequence, records[-1][0], self.position[1]+len(records)]
+                # the oldest segment has been replayed entirely, delete it unless still written
+                if len(self.segments) == 1 and self.file is not None and self.position[1] < self.segments[0][2]: break
+                self.__remove_oldest()
+            return [], None
+
+    # mark the messages returned by peek() as replayed
+    def commit(self, position):
+        with self.lock:
+            sequence, offset, count = position
+            # the segment has been dropped in the meantime
+            if len(self.segments) == 0 or self.segments[0][0] != sequence: return
+            self.stats["replayed"] = self.stats["replayed"] + count - self.position[1]
+            self.position = [offset, count]
+            # the last segment replayed entirely, start from scratch
+            if len(self.segments) == 1 and count == self.segments[0][2]: self.__remove_oldest()
+            self.__save_cursor()
+
+    # save the position of the replay, replacing the previous one at once (the lock must be held)
+    def __save_cursor(self):
+        filename = os.path.join(self.directory, "cursor")
+        try:
+            sequence = self.segments[0][0] if len(self.segments) > 0 else self.sequence
+            with open(filename+".tmp", "w") as f: f.write(" ".join([str(sequence), str(self.position[0]), str(self.position[1])]))
+            os.rename(filename+".tmp", filename)
+        except Exception,e:
+            self.module.log_warning("unable to save the spool cursor "+filename+": "+exception.get(e), False)
+
+    # return the number of messages spooled, replayed and dropped so far, and the messages and bytes waiting on disk
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["queued"] = self.get_size()
+            stats["bytes"] = sum([segment[1] for segment in self.segments])
+            return stats
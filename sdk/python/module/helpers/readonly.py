@@ -0,0 +1,68 @@
+### Read-only views on payload data, allowing reading nested content without copying it
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import collections
+import copy
+
+# read-only view of a dictionary. Nested dictionaries and lists are returned as read-only views as well
+class ReadOnlyDict(collections.Mapping):
+    def __init__(self, data):
+        self.__data = data
+
+    def __getitem__(self, key):
+        return wrap(self.__data[key])
+
+    def __iter__(self):
+        return iter(self.__data)
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def __repr__(self):
+        return repr(self.__data)
+
+    # return a mutable deep copy of the underlying data
+    def copy(self):
+        return copy.deepcopy(self.__data)
+
+# read-only view of a list. Nested dictionaries and lists are returned as read-only views as well
+class ReadOnlyList(collections.Sequence):
+    def __init__(self, data):
+        self.__data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice): return ReadOnlyList(self.__data[index])
+        return wrap(self.__data[index])
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __repr__(self):
+        return repr(self.__data)
+
+    def __eq__(self, other):
+        if isinstance(other, ReadOnlyList): other = other.copy()
+        return self.__data == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    # return a mutable deep copy of the underlying data
+    def copy(self):
+        return copy.deepcopy(self.__data)
+
+# return a read-only view of the given value (scalars are immutable and returned as they are)
+def wrap(value):
+    if isinstance(value, dict): return ReadOnlyDict(value)
+    if isinstance(value, list): return ReadOnlyList(value)
+    return value
+
+# return a mutable copy of the given value if it is a read-only view (can be used as default function of json.dumps)
+def unwrap(value):
+    if isinstance(value, (ReadOnlyDict, ReadOnlyList)): return value.copy()
+    raise TypeError(repr(value)+" is not JSON serializable")
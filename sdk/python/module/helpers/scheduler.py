@@ -4,22 +4,23 @@
 # Python: APScheduler
 
 import logging
+import threading
+import time
 import apscheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.util import get_callable_name
 
 # TODO: use this class for all modules
 # log to MQTT
 class MQTTLogHandler(logging.StreamHandler):
     def __init__(self, module):
         super(MQTTLogHandler,self).__init__()
-        self.__module = module
+        # python's numeric levels are the same of the module's structured logger
+        self.__logger = module.get_logger("scheduler")
     def emit(self, record):
-        if record.levelname.lower() == "debug": self.__module.log_debug(self.format(record))
-        if record.levelname.lower() == "info": self.__module.log_info(self.format(record))
-        if record.levelname.lower() == "warning": self.__module.log_warning(self.format(record))
-        if record.levelname.lower() == "error": self.__module.log_error(self.format(record))
-        if record.levelname.lower() == "critical": self.__module.log_error(self.format(record))
+        if not self.__logger.is_enabled_for(record.levelno): return
+        self.__logger.log(record.levelno, "%s", self.format(record))
 
 class Scheduler():
     def __init__(self, module, size="small"):
@@ -42,12 +43,12 @@ class Scheduler():
         self.__setup_logger("apscheduler.executors.default")
         self.__setup_logger("apscheduler.scheduler")
 
-    # setup the given scheduler logger
+    # setup the given scheduler logger. Every record reaches the handler, which filters it by the module's "scheduler" threshold so it can be lowered at runtime
     def __setup_logger(self, logger):
         logger = logging.getLogger(logger)
-        logger.setLevel(logging.CRITICAL)
+        logger.setLevel(logging.DEBUG)
         handler = MQTTLogHandler(self.__module)
-        handler.setLevel(logging.CRITICAL)
+        handler.setLevel(logging.DEBUG)
         handler.setFormatter(logging.Formatter("%(message)s"))
         logger.addHandler(handler)
         
@@ -76,7 +77,7 @@ class Scheduler():
     # return well formatted log scheduler errors
     def __handle_error(self, code,event):
         job = self.__scheduler.get_job(event.job_id)
-        job_text = str(job.func_ref)+str(job.args) if job is not None else ""
+        job_text = str(job.func_ref if job.func_ref is not None else job.name)+str(job.args) if job is not None else ""
         msg = self.__get_event_name(code)+" for scheduled task "+job_text+": "
         if event.exception:
             msg = msg + "Exception "
@@ -113,8 +114,27 @@ class Scheduler():
     def add_job(self, job):
         # start the scheduler if not running
         self.start()
+        # keep track of how long the job runs
+        job = dict(job)
+        if "name" not in job: job["name"] = get_callable_name(job["func"])
+        job["func"] = self.__time(job["func"])
         # add the new job
         return self.__scheduler.add_job(**job)
+
+    # return the given function observing its run times in the module's metrics and keeping track of the thread running it, so to be profiled
+    def __time(self, function):
+        histogram = self.__module.metrics.histogram("scheduler_job_seconds")
+        job_threads = self.__module.job_threads
+        def timed(*args, **kwargs):
+            started = time.time()
+            ident = threading.current_thread().ident
+            job_threads.add(ident)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                job_threads.discard(ident)
+                histogram.observe(time.time() - started)
+        return timed
         
     # remove a job (by id) from the scheduler
     def remove_job(self, id):
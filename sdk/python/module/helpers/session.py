@@ -3,36 +3,145 @@
 # OS: 
 # Python: 
 
+import collections
+import threading
+import time
+
+import sdk.python.module.helpers.event_loop as event_loop
+import sdk.python.utils.exceptions as exception
+
 class Session():
-    def __init__(self, module):
+    # sessions are dropped if not restored within ttl seconds (never if 0) and the oldest are evicted above max_size sessions (unbounded if 0)
+    def __init__(self, module, ttl=0, max_size=0):
         self.__module = module
-        # map request_id with session content
-        self.__sessions = {}
+        self.__ttl = ttl
+        self.__max_size = max_size
+        # map request_id with [session content, expiration time, callback], from the oldest. Since all the sessions live for the same ttl, the oldest is also the first to expire
+        self.__sessions = collections.OrderedDict()
+        # timer of the next sweep of the expired sessions, if scheduled
+        self.__timer = None
+        self.__stats = {"expired": 0, "evicted": 0}
+        # map the request_id of the requests waiting for a reply with [future, replies by sender, recipients, True if expecting many replies]
+        self.__pending = {}
+        self.__lock = threading.Lock()
     
     # return session's content of a given request_id
     def restore(self, message):
         request_id = message.get_request_id()
         if request_id is None: return None
-        if request_id in self.__sessions:
-            session = self.__sessions[request_id]
-            del self.__sessions[request_id]
-            return session
-        else:
-            self.__module.log_warning("invalid session requested "+str(request_id)+": "+message.dump())
-            return None
+        with self.__lock:
+            entry = self.__sessions.pop(request_id, None)
+        if entry is not None: return entry[0]
+        self.__module.log_warning("invalid or expired session requested "+str(request_id)+": "+message.dump())
+        return None
     
-    # associate the request_id of a message with a session content
-    def register(self, message, session):
+    # associate the request_id of a message with a session content. on_expire(request_id, session) is called if the session is expired or evicted before being restored, e.g. to handle a missing reply
+    def register(self, message, session, on_expire=None):
         request_id = message.get_request_id()
         if request_id is None: return
-        self.__module.log_debug("Created session "+str(request_id)+" -> "+str(session))
-        self.__sessions[request_id] = session
+        self.__module.log.debug("Created session", request_id=request_id, session=session)
+        now = time.time()
+        with self.__lock:
+            expired = self.__remove_expired(now)
+            evicted = []
+            self.__sessions.pop(request_id, None)
+            self.__sessions[request_id] = [session, now + self.__ttl if self.__ttl > 0 else None, on_expire]
+            # evict the oldest sessions when full
+            while self.__max_size > 0 and len(self.__sessions) > self.__max_size:
+                evicted.append(self.__sessions.popitem(last=False))
+                self.__stats["evicted"] = self.__stats["evicted"] + 1
+            if self.__ttl > 0 and self.__timer is None: self.__timer = event_loop.get().call_later(self.__ttl, self.__sweep, on_error=self.__on_error)
+        self.__notify(expired, "expired")
+        self.__notify(evicted, "evicted")
         return request_id
         
     # return true if this is a registered session, false otherwise
     def is_registered(self, message):
         request_id = message.get_request_id()
         if request_id is None: return False
-        if request_id in self.__sessions: return True
+        with self.__lock:
+            return request_id in self.__sessions
+
+    # remove and return the sessions expired at the given time, from the oldest (the lock must be held)
+    def __remove_expired(self, now):
+        expired = []
+        while self.__ttl > 0 and len(self.__sessions) > 0 and next(self.__sessions.itervalues())[1] <= now:
+            expired.append(self.__sessions.popitem(last=False))
+            self.__stats["expired"] = self.__stats["expired"] + 1
+        return expired
+
+    # drop the expired sessions and schedule the next sweep when the oldest session left will expire (called by the event loop)
+    def __sweep(self):
+        now = time.time()
+        with self.__lock:
+            expired = self.__remove_expired(now)
+            if len(self.__sessions) > 0: self.__timer = event_loop.get().call_later(next(self.__sessions.itervalues())[1] - now, self.__sweep, on_error=self.__on_error)
+            else: self.__timer = None
+        self.__notify(expired, "expired")
+
+    # call the callbacks of the given sessions dropped before being restored
+    def __notify(self, dropped, reason):
+        for request_id, entry in dropped:
+            if entry[2] is None: continue
+            try:
+                entry[2](request_id, entry[0])
+            except Exception,e:
+                self.__module.log_error("runtime error in the callback of the "+reason+" session "+str(request_id)+": "+exception.get(e))
+
+    # log an error raised by the timers of the sessions and requests (called by the event loop)
+    def __on_error(self, e):
+        self.__module.log_error("runtime error in a session timer: "+exception.get(e))
+
+    # return the number of sessions active and those expired and evicted before being restored so far
+    def get_stats(self):
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats["active"] = len(self.__sessions)
+            return stats
+
+    # wait for the replies to a message sent to the given recipients. Return a future completed with the reply or, if expecting many, with the replies by sender (those received so far upon timeout)
+    def expect(self, message, recipients, timeout, many=False):
+        request_id = message.get_request_id()
+        future = event_loop.Future()
+        with self.__lock:
+            self.__pending[request_id] = [future, {}, set(recipients), many, message.command]
+        if timeout is not None:
+            # timeouts are tracked by the event loop of the process
+            timer = event_loop.get().call_later(timeout, self.__expire, request_id, timeout, on_error=self.__on_error)
+            future.add_done_callback(lambda done: timer.cancel())
+        return future
+
+    # return true if the given module is one of the recipients, each of them either a module or a wildcard (e.g. "*/*" or "controller/*")
+    def __is_recipient(self, sender, recipients):
+        if sender in recipients: return True
+        scope, name = sender.split("/", 1) if "/" in sender else [sender, ""]
+        for recipient in recipients:
+            if "*" not in recipient: continue
+            recipient_scope, recipient_name = recipient.split("/", 1) if "/" in recipient else [recipient, "*"]
+            if recipient_scope in ("*", scope) and recipient_name in ("*", name): return True
         return False
 
+    # complete the request the given message is a reply to. Return True if it was, so the message is not delivered to the module
+    def resolve(self, message):
+        if len(self.__pending) == 0 or message.is_null or message.sender == self.__module.fullname or message.recipient != self.__module.fullname: return False
+        request_id = message.get_request_id()
+        with self.__lock:
+            if request_id not in self.__pending: return False
+            future, replies, recipients, many, command = self.__pending[request_id]
+            # a reply keeps the command of the request and comes from one of its recipients, anything else carrying the same request id is not
+            if message.command != command or not self.__is_recipient(message.sender, recipients): return False
+            replies[message.sender] = message
+            # keep waiting for the other recipients
+            if many and not recipients.issubset(replies): return True
+            del self.__pending[request_id]
+        future.set_result(replies if many else message)
+        return True
+
+    # give up waiting for the replies to a request (called by the event loop)
+    def __expire(self, request_id, timeout):
+        with self.__lock:
+            pending = self.__pending.pop(request_id, None)
+        if pending is None: return
+        future, replies, recipients, many, command = pending
+        if many: future.set_result(replies)
+        else: future.set_exception(Exception("no reply received to request "+str(request_id)+" within "+str(timeout)+" seconds"))
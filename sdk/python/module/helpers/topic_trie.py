@@ -0,0 +1,91 @@
+### Index of MQTT subscription patterns, matching a topic in O(topic depth)
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import threading
+
+class Topic_trie():
+    def __init__(self):
+        # each node is made of [children by topic level, {pattern: entry} of the patterns ending here]
+        self.__root = [{}, {}]
+        # map pattern with its entry [sequence, value], the sequence is used to return matches in the order patterns were added
+        self.__patterns = {}
+        self.__sequence = 0
+        self.__lock = threading.Lock()
+
+    # add a pattern (supporting + and # wildcards) associating a value to it. Replace the value if already there
+    def add(self, pattern, value=None):
+        with self.__lock:
+            node = self.__root
+            for level in pattern.split("/"):
+                if level not in node[0]: node[0][level] = [{}, {}]
+                node = node[0][level]
+            if pattern in self.__patterns:
+                self.__patterns[pattern][1] = value
+            else:
+                self.__sequence = self.__sequence + 1
+                self.__patterns[pattern] = [self.__sequence, value]
+            node[1][pattern] = self.__patterns[pattern]
+
+    # remove a pattern
+    def remove(self, pattern):
+        with self.__lock:
+            if pattern not in self.__patterns: return
+            del self.__patterns[pattern]
+            # walk down to the node keeping track of the path so to prune empty nodes
+            path = []
+            node = self.__root
+            for level in pattern.split("/"):
+                path.append([node, level])
+                node = node[0][level]
+            del node[1][pattern]
+            for parent, level in reversed(path):
+                child = parent[0][level]
+                if len(child[0]) > 0 or len(child[1]) > 0: break
+                del parent[0][level]
+
+    # return the value associated to a pattern
+    def get(self, pattern):
+        entry = self.__patterns.get(pattern)
+        return entry[1] if entry is not None else None
+
+    # return a list of [pattern, value] of all the patterns matching the topic, in the order they were added
+    def match(self, topic):
+        levels = topic.split("/")
+        found = []
+        with self.__lock:
+            nodes = [self.__root]
+            for level in levels:
+                next_nodes = []
+                for node in nodes:
+                    children = node[0]
+                    # multi-level wildcard matches whatever follows
+                    if "#" in children: found.extend(children["#"][1].items())
+                    if level in children: next_nodes.append(children[level])
+                    if "+" in children: next_nodes.append(children["+"])
+                nodes = next_nodes
+                if len(nodes) == 0: break
+            for node in nodes:
+                found.extend(node[1].items())
+                # multi-level wildcard matches the parent level as well
+                if "#" in node[0]: found.extend(node[0]["#"][1].items())
+        found.sort(key=lambda item: item[1][0])
+        return [[pattern, entry[1]] for pattern, entry in found]
+
+    # return the list of patterns, in the order they were added
+    def patterns(self):
+        with self.__lock:
+            return sorted(self.__patterns.keys(), key=lambda pattern: self.__patterns[pattern][0])
+
+    def __contains__(self, pattern):
+        return pattern in self.__patterns
+
+    def __len__(self):
+        return len(self.__patterns)
+
+    def __iter__(self):
+        return iter(self.patterns())
+
+    def __repr__(self):
+        return str(self.patterns())
@@ -0,0 +1,150 @@
+### Trace context propagated along the messages, recording for each hop when it has been sent, received, started and finished, and exported to a file or a collector module
+## DEPENDENCIES:
+# OS:
+# Python:
+
+import collections
+import json
+import random
+import threading
+import time
+
+from sdk.python.module.helpers.message import Message
+import sdk.python.utils.exceptions as exception
+
+# commands never traced (SPAN messages would otherwise be traced themselves)
+UNTRACED = ["LOG", "SPAN", "PING", "PONG", "STATUS", "METRICS"]
+
+# span the current thread is in as [trace_id, span_id], set while handling a traced message or within module.span()
+context = threading.local()
+
+# return a new random trace or span id
+def new_id():
+    return "%016x" % random.getrandbits(64)
+
+# return the span the current thread is in, if any
+def get_current():
+    return getattr(context, "span", None)
+
+# add the trace context to a message about to be sent by the given module: a child of the current span, of the message being replied or forwarded or a new trace if sampled
+def inject(module, message):
+    if message.command in UNTRACED: return
+    current = get_current()
+    if current is None:
+        trace = message.get_header("trace")
+        # a message received by this module is being replied or forwarded outside of its handler
+        if isinstance(trace, dict) and trace.get("to") == message.sender: current = [trace["trace_id"], trace["span_id"]]
+        elif module.trace_sampling > 0 and random.random() < module.trace_sampling: current = [new_id(), None]
+        else: return
+    message.set_header("trace", {"trace_id": current[0], "span_id": new_id(), "parent_id": current[1], "from": message.sender, "to": message.recipient, "sent": time.time()})
+
+# return the span of a message about to be handled by the given module and make it the current span, None if not traced. A context not set by the sender (e.g. forwarded by a module not tracing) is ignored
+def extract(module, message):
+    # do not decode the payload of a message not traced
+    if not message.may_contain("trace"): return None
+    try:
+        trace = message.get_header("trace")
+    except Exception:
+        return None
+    if not isinstance(trace, dict) or trace.get("from") != message.sender: return None
+    context.span = [trace["trace_id"], trace["span_id"]]
+    # the message may be replied or forwarded by the handler, keep track of it as received
+    return {"trace_id": trace["trace_id"], "span_id": trace["span_id"], "parent_id": trace["parent_id"], "name": message.command+" "+message.args, "module": module.fullname, "sender": message.sender, "sent": trace["sent"], "received": message.received_at}
+
+# leave the span of a message just handled by the given module and export it
+def finish(module, span, started, finished):
+    context.span = None
+    span["started"] = started
+    span["finished"] = finished
+    get_exporter().put(module, span)
+
+# start a local span of the given module (e.g. polling a sensor) within the current one or, if sampled, as a new trace, and make it the current span. Return it with the previous one or None if not traced
+def start_span(module, name):
+    current = get_current()
+    if current is None and (module.trace_sampling <= 0 or random.random() >= module.trace_sampling): return None
+    span = {"trace_id": current[0] if current is not None else new_id(), "span_id": new_id(), "parent_id": current[1] if current is not None else None, "name": name, "module": module.fullname, "started": time.time()}
+    context.span = [span["trace_id"], span["span_id"]]
+    return [span, current]
+
+# finish a span started by start_span() and export it, restoring the previous span
+def finish_span(module, entry):
+    span, previous = entry
+    context.span = previous
+    span["finished"] = time.time()
+    get_exporter().put(module, span)
+
+class Span_exporter(threading.Thread):
+    # keep up to buffer_size spans (the oldest are dropped when full), exported every flush_interval seconds
+    def __init__(self, buffer_size, flush_interval):
+        super(Span_exporter, self).__init__()
+        self.daemon = True
+        self.flush_interval = flush_interval
+        # spans waiting to be exported as [module, span]
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.lock = threading.Lock()
+        self.stats = {"exported": 0, "dropped": 0}
+
+    # queue a span of the given module
+    def put(self, module, span):
+        with self.lock:
+            if len(self.buffer) == self.buffer.maxlen: self.stats["dropped"] = self.stats["dropped"] + 1
+            self.buffer.append([module, span])
+
+    # append the given spans to the trace file of their module, if any, and send them to its collector, if any, in a single SPAN message for each module
+    def __export(self, entries):
+        files = collections.OrderedDict()
+        collected = collections.OrderedDict()
+        for module, span in entries:
+            if module.trace_file != "": files.setdefault(module.trace_file, []).append(span)
+            if module.trace_collector != "": collected.setdefault(module, []).append(span)
+        for filename, spans in files.iteritems():
+            try:
+                with open(filename, "a") as f: f.write("".join([json.dumps(span)+"\n" for span in spans]))
+            except Exception,e:
+                print "unable to write the spans to "+filename+": "+exception.get(e)
+        for module, spans in collected.iteritems():
+            message = Message(module)
+            message.recipient = module.trace_collector
+            message.command = "SPAN"
+            message.set_data(spans)
+            try:
+                module.send(message)
+            except Exception,e:
+                print "unable to send the spans of "+module.fullname+" to "+module.trace_collector+": "+exception.get(e)
+        self.stats["exported"] = self.stats["exported"] + len(entries)
+
+    # export at once the spans queued (of the given module only, if any), e.g. before stopping it
+    def flush(self, module=None):
+        with self.lock:
+            entries = [entry for entry in self.buffer if module is None or entry[0] is module]
+            left = [entry for entry in self.buffer if module is not None and entry[0] is not module]
+            self.buffer.clear()
+            self.buffer.extend(left)
+        if len(entries) > 0: self.__export(entries)
+
+    # return the number of spans exported, dropped because the buffer was full and queued so far
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["queued"] = len(self.buffer)
+            return stats
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+# the span exporter of this process
+shared_exporter = None
+shared_exporter_lock = threading.Lock()
+
+# return the span exporter of this process, starting it on first use
+def get_exporter():
+    global shared_exporter
+    if shared_exporter is not None: return shared_exporter
+    with shared_exporter_lock:
+        if shared_exporter is None:
+            exporter = Span_exporter(10000, 1)
+            exporter.start()
+            shared_exporter = exporter
+        return shared_exporter
@@ -3,6 +3,6 @@ from sdk.python.module.module import Module
 # interaction common functionalities
 class Interaction(Module):
     # What to do when initializing
-    def __init__(self, scope, name):
+    def __init__(self, scope, name, **kwargs):
         # call superclass function
-        super(Interaction, self).__init__(scope, name)
+        super(Interaction, self).__init__(scope, name, **kwargs)
@@ -9,12 +9,20 @@ sys.setdefaultencoding('utf8')
 
 import os
 import time
+import collections
+import contextlib
+import copy
 import threading
 from abc import ABCMeta, abstractmethod
 
 from sdk.python.module.helpers.message import Message
 from sdk.python.module.helpers.mqtt_client import Mqtt_client
 from sdk.python.module.helpers.session import Session
+from sdk.python.module.helpers.metrics import Metrics
+import sdk.python.module.helpers.log_shipper as log_shipper
+import sdk.python.module.helpers.logger as logger
+import sdk.python.module.helpers.tracing as tracing
+import sdk.python.module.helpers.codec as codec
 import sdk.python.utils.exceptions as exception
 import sdk.python.constants as constants
 import sdk.python.utils.strings
@@ -23,8 +31,8 @@ class Module(threading.Thread):
     # used for enforcing abstract methods
     __metaclass__ = ABCMeta 
     
-    # initialize the class and set the variables
-    def __init__(self, scope, name):
+    # initialize the class and set the variables. consumer_threads and shard_by override the environment settings. If event_loop is given, callbacks run there instead of in the module's threads
+    def __init__(self, scope, name, consumer_threads=None, shard_by=None, event_loop=None):
         # thread init
         super(Module, self).__init__()
         # set name of this module
@@ -46,22 +54,101 @@ class Module(threading.Thread):
         # house settings
         self.house_id = os.getenv("EGEOFFREY_ID", "house")
         self.house_passcode = os.getenv("EGEOFFREY_PASSCODE", "")
-        # debug
-        self.debug = bool(int(os.getenv("EGEOFFREY_DEBUG", False)))
+        # log thresholds by logger name, "" for the module's own logs (debug if EGEOFFREY_DEBUG is set), e.g. EGEOFFREY_LOG_LEVELS="scheduler=debug"
+        self.log_levels = {"": logger.DEBUG if bool(int(os.getenv("EGEOFFREY_DEBUG", False))) else logger.get_level(os.getenv("EGEOFFREY_LOG_LEVEL", "info"))}
+        for name, level in [entry.split("=") for entry in os.getenv("EGEOFFREY_LOG_LEVELS", "").split(",") if "=" in entry]: self.log_levels[name.strip()] = logger.get_level(level)
+        # the scheduler's own logs are silenced unless requested, since the errors of the jobs are already logged by the module
+        if "scheduler" not in self.log_levels: self.log_levels["scheduler"] = logger.SILENT
+        # structured logger of the module, e.g. self.log.debug("message", key=value)
+        self.log = logger.Logger(self)
         self.verbose = bool(int(os.getenv("EGEOFFREY_VERBOSE", False)))
+        # codec used for serializing outgoing payloads, unless set in the message
+        self.codec = os.getenv("EGEOFFREY_CODEC", codec.DEFAULT)
+        # number of threads consuming incoming messages and how to distribute messages among them (by "topic", "sender", "args" or a function returning a key)
+        self.consumer_threads = consumer_threads if consumer_threads is not None else int(os.getenv("EGEOFFREY_CONSUMER_THREADS", 1))
+        self.shard_by = shard_by if shard_by is not None else os.getenv("EGEOFFREY_CONSUMER_SHARD_BY", "topic")
+        # number of control (CONF, PING, PONG, STATUS) and data messages served in each round by the consumers, control messages are served first
+        self.consumer_control_weight = int(os.getenv("EGEOFFREY_CONSUMER_CONTROL_WEIGHT", 10))
+        self.consumer_data_weight = int(os.getenv("EGEOFFREY_CONSUMER_DATA_WEIGHT", 1))
+        # incoming queue watermarks: warn above the low one, apply the overload policy above the high one, restart the module as a last resort above the restart one (0 to never restart)
+        self.queue_low_watermark = int(os.getenv("EGEOFFREY_QUEUE_LOW_WATERMARK", 100))
+        self.queue_high_watermark = int(os.getenv("EGEOFFREY_QUEUE_HIGH_WATERMARK", 500))
+        self.queue_restart_watermark = int(os.getenv("EGEOFFREY_QUEUE_RESTART_WATERMARK", 5000))
+        # what to do with incoming data messages above the high watermark, unless set by the listener: "drop_oldest", "drop_newest", "coalesce" (latest value wins for each topic), "pause" (unsubscribe the topic until below the low watermark) or "restart"
+        self.overload_policy = os.getenv("EGEOFFREY_OVERLOAD_POLICY", "drop_oldest")
+        # maximum time (in seconds) a topic can be paused by the "pause" policy
+        self.queue_pause_timeout = float(os.getenv("EGEOFFREY_QUEUE_PAUSE_TIMEOUT", 30))
+        # directory where to save the last accepted configurations so to start on them without waiting for the gateway (disabled if empty)
+        self.config_snapshot_dir = os.getenv("EGEOFFREY_CONFIG_SNAPSHOT_DIR", "")
+        # time (in seconds) to wait once connected for the gateway to send again the configurations delivered from the snapshot, those not received are considered deleted
+        self.config_snapshot_timeout = float(os.getenv("EGEOFFREY_CONFIG_SNAPSHOT_TIMEOUT", 10))
+        # QoS level of the messages and listeners of the commands without a default one (LOG, PING and PONG use 0, CONF, SAVE and DELETE use 2), unless set in the message or listener
+        self.qos = int(os.getenv("EGEOFFREY_QOS", 2))
+        # publish from a dedicated thread, with at most the given number of messages in flight for each QoS level and queueing up to publish_queue_size messages
+        self.async_publish = bool(int(os.getenv("EGEOFFREY_ASYNC_PUBLISH", True)))
+        self.publish_windows = [max(1, int(os.getenv("EGEOFFREY_PUBLISH_WINDOW_QOS"+str(qos), 1000 if qos == 0 else 100))) for qos in range(0, 3)]
+        self.publish_queue_size = int(os.getenv("EGEOFFREY_PUBLISH_QUEUE_SIZE", 10000))
+        # directory where to spool the messages published while offline so to replay them once connected, even after a restart (in memory, up to 300 messages, if empty), maximum size of the spool in bytes and messages replayed per second
+        self.spool_dir = os.getenv("EGEOFFREY_SPOOL_DIR", "")
+        self.spool_max_bytes = int(os.getenv("EGEOFFREY_SPOOL_MAX_BYTES", 10*1024*1024))
+        self.spool_replay_rate = float(os.getenv("EGEOFFREY_SPOOL_REPLAY_RATE", 100))
+        # seconds to wait before reconnecting to the gateway, doubling at every failed attempt up to the maximum (with a random jitter)
+        self.reconnect_min_delay = float(os.getenv("EGEOFFREY_RECONNECT_MIN_DELAY", 1))
+        self.reconnect_max_delay = float(os.getenv("EGEOFFREY_RECONNECT_MAX_DELAY", 60))
+        # drop the sessions not restored within this number of seconds (0 to keep them forever, the default) and the oldest ones above this number of sessions (0 for no limit)
+        self.session_ttl = float(os.getenv("EGEOFFREY_SESSION_TTL", 0))
+        self.session_max_size = int(os.getenv("EGEOFFREY_SESSION_MAX_SIZE", 10000))
+        # decode incoming payloads only when accessed
+        self.lazy_payload = bool(int(os.getenv("EGEOFFREY_LAZY_PAYLOAD", True)))
         # logging
         self.logging_remote = bool(int(os.getenv("EGEOFFREY_LOGGING_REMOTE", True)))
         self.logging_local = bool(int(os.getenv("EGEOFFREY_LOGGING_LOCAL", True)))
+        # print and ship the logs from a dedicated thread, in batches every log_flush_interval seconds, keeping up to log_buffer_size logs of the process
+        self.async_logging = bool(int(os.getenv("EGEOFFREY_ASYNC_LOGGING", True)))
+        self.log_buffer_size = int(os.getenv("EGEOFFREY_LOG_BUFFER_SIZE", 1000))
+        self.log_flush_interval = float(os.getenv("EGEOFFREY_LOG_FLUSH_INTERVAL", 0.5))
+        # pack the logs shipped together into a single BATCH message, only for loggers able to unpack it
+        self.log_batch = bool(int(os.getenv("EGEOFFREY_LOG_BATCH", False)))
+        # log at most log_rate messages per second (0 for no limit, the default) with bursts of up to log_burst messages
+        self.log_rate = float(os.getenv("EGEOFFREY_LOG_RATE", 0))
+        self.log_burst = int(os.getenv("EGEOFFREY_LOG_BURST", 100))
+        # keep only a fraction of the logs of the given severities, e.g. "debug=0.1,info=0.5"
+        self.log_sampling = dict([(severity.strip(), float(fraction)) for severity, fraction in [entry.split("=") for entry in os.getenv("EGEOFFREY_LOG_SAMPLING", "").split(",") if "=" in entry]])
+        self.__log_shipper = log_shipper.get(self.log_buffer_size, self.log_flush_interval) if self.async_logging else None
+        # start a new trace for this fraction of the messages sent and spans opened outside of a trace (0 to only continue the traces started by others)
+        self.trace_sampling = float(os.getenv("EGEOFFREY_TRACE_SAMPLING", 0))
+        # propagate the trace context of the messages and export the spans of those handled as json lines to trace_file and/or in SPAN messages to the trace_collector module
+        self.tracing = bool(int(os.getenv("EGEOFFREY_TRACING", False))) or self.trace_sampling > 0
+        self.trace_file = os.getenv("EGEOFFREY_TRACE_FILE", "")
+        self.trace_collector = os.getenv("EGEOFFREY_TRACE_COLLECTOR", "")
         # status
         self.connected = False
         self.configured = True # by default no configuration is required to start
         self.stopping = False
+        # keep track of the messages being batched by each thread
+        self.__batch = threading.local()
+        # event loop running the module's callbacks, if any
+        self.event_loop = event_loop
+        # counters, gauges and histograms of the module, reported upon a METRICS request
+        self.metrics = Metrics()
+        # idents of the threads running a scheduled job of the module, so to profile them
+        self.job_threads = set()
         # initialize mqtt client for connecting to the bus
-        self.__mqtt = Mqtt_client(self)
+        self.__mqtt = Mqtt_client(self, self.consumer_threads, self.shard_by, self.consumer_control_weight, self.consumer_data_weight, self.event_loop)
         # make the mqtt client persistent (will buffer messages when offline)
         self.persistent_client = bool(int(os.getenv("EGEOFFREY_PERSISTENT_CLIENT", False)))
+        # share a single connection to the gateway among all the modules of the process (persistent clients always use their own)
+        self.shared_connection = bool(int(os.getenv("EGEOFFREY_SHARED_CONNECTION", True)))
+        # deliver messages to the modules of this process directly, without going through the gateway
+        self.loopback = bool(int(os.getenv("EGEOFFREY_LOOPBACK", False)))
+        # publish the messages delivered locally to the gateway as well, so the modules of other processes inspecting them (e.g. the web interface) still see them
+        self.loopback_mirror = bool(int(os.getenv("EGEOFFREY_LOOPBACK_MIRROR", True)))
         # initialize session manager
-        self.sessions = Session(self)
+        self.sessions = Session(self, self.session_ttl, self.session_max_size)
+        # fall back to json if the requested codec is not available
+        if not codec.is_available(self.codec):
+            self.log_warning("codec "+self.codec+" is not available, falling back to "+codec.DEFAULT)
+            self.codec = codec.DEFAULT
         # call module implementation of init
         try:
             self.log_debug("Initializing module...")
@@ -69,82 +156,242 @@ class Module(threading.Thread):
         except Exception,e: 
             self.log_error("runtime error during on_init(): "+exception.get(e))
 
-    # Add a listener for the given configuration request (will call on_configuration())
-    def add_configuration_listener(self, args, version=None, wait_for_it=False):
+    # Add a listener for the given configuration request (will call on_configuration() or the given handler)
+    def add_configuration_listener(self, args, version=None, wait_for_it=False, handler=None):
         filename = args if version is None else str(version)+"/"+args
-        return self.__mqtt.add_listener("controller/config", "*/*", "CONF", filename, wait_for_it)
+        return self.__mqtt.add_listener("controller/config", "*/*", "CONF", filename, wait_for_it, handler)
 
-    # add a listener for the messages addressed to this module (will call on_message())
-    def add_request_listener(self, from_module, command, args):
-        return self.__mqtt.add_listener(from_module, self.fullname, command, args, False)
+    # add a listener for the messages addressed to this module (will call on_message() or the given handler). overload_policy and qos override the module's ones for these messages
+    def add_request_listener(self, from_module, command, args, handler=None, overload_policy=None, qos=None):
+        return self.__mqtt.add_listener(from_module, self.fullname, command, args, False, handler, overload_policy, qos)
     
-    # add a listener for broadcasted messages from the given module (will call on_message())
-    def add_broadcast_listener(self, from_module, command, args):
-        return self.__mqtt.add_listener(from_module, "*/*", command, args, False)
+    # add a listener for broadcasted messages from the given module (will call on_message() or the given handler). overload_policy and qos override the module's ones for these messages
+    def add_broadcast_listener(self, from_module, command, args, handler=None, overload_policy=None, qos=None):
+        return self.__mqtt.add_listener(from_module, "*/*", command, args, False, handler, overload_policy, qos)
 
-    # add a listener for intercepting messages from a given module to a given module (will call on_message())
-    def add_inspection_listener(self, from_module, to_module, command, args):
-        return self.__mqtt.add_listener(from_module, to_module, command, args, False)
+    # add a listener for intercepting messages from a given module to a given module (will call on_message() or the given handler). overload_policy and qos override the module's ones for these messages
+    def add_inspection_listener(self, from_module, to_module, command, args, handler=None, overload_policy=None, qos=None):
+        return self.__mqtt.add_listener(from_module, to_module, command, args, False, handler, overload_policy, qos)
     
     # remove a topic previously subscribed
     def remove_listener(self, topic):
         self.__mqtt.unsubscribe(topic)
         
-    # send a message to another module
-    def send(self, message):
+    # validate a message and prepare it for publishing. Return args, payload and codec or None if invalid
+    def __prepare(self, message):
         if self.verbose: self.log_debug("Publishing message "+message.dump(), False)
         # ensure message is valid
         if message.sender == "" or message.sender == "*/*" or message.recipient == "" or message.command == "" or message.house_id == "":
             self.log_warning("invalid message to send: "+message.dump(), False)
-            return
+            return None
         # prepare config version if any
         if message.config_schema is not None:
             message.args = str(message.config_schema)+"/"+message.args
+        # add the trace context, if tracing
+        if self.tracing and not message.is_null: tracing.inject(self, message)
         # prepare payload
         if message.is_null: payload = None 
         else: payload = message.get_payload()
+        payload_codec = message.codec if message.codec is not None else self.codec
+        return [message.args, payload, payload_codec]
+
+    # send a message to another module
+    def send(self, message):
+        # if batching messages in this thread, send it as it is now when the batch is completed
+        if getattr(self.__batch, "messages", None) is not None:
+            entry = self.__prepare_batched(message, True)
+            if entry is not None: self.__batch.messages.append(entry)
+            return
+        entry = self.__prepare(message)
+        if entry is None: return
+        # deliver it directly if the recipient runs in this process, publishing it only if mirrored
+        if self.loopback and self.__mqtt.send_local(message, entry[0]) and not self.loopback_mirror: return
         # publish it to the message bus
-        self.__mqtt.publish(message.house_id, message.recipient, message.command, message.args, payload, message.retain)
+        self.__mqtt.publish(message.house_id, message.recipient, message.command, entry[0], entry[1], message.retain, entry[2], message.qos)
+
+    # send a request and return a future completed with the reply (the message with the same request_id), failing if not received within timeout seconds. The reply is not delivered to on_message(). Wait for it with future.wait() (not from on_message(), whose thread receives the reply), future.add_done_callback() or by yielding it from a coroutine
+    def request(self, message, timeout=10):
+        future = self.sessions.expect(message, [message.recipient], timeout)
+        self.send(message)
+        return future
+
+    # send a request to each of the given modules and return a future completed with the replies by sender, once all received or with those received within timeout seconds
+    def request_many(self, message, recipients, timeout=10):
+        future = self.sessions.expect(message, recipients, timeout, many=True)
+        for recipient in recipients:
+            # every copy shares the payload, and so the request_id, of the original message
+            entry = Message(self)
+            entry.recipient = recipient
+            entry.command = message.command
+            entry.args = message.args
+            entry.qos = message.qos
+            entry.codec = message.codec
+            message.share_payload(entry)
+            self.send(entry)
+        return future
+
+    # validate a message to be batched and return it as [house_id, recipient, command, args, payload, codec, qos, retain] or None if invalid. If copy_payload is true, the payload is copied so that changes made to the message afterwards are not sent
+    def __prepare_batched(self, message, copy_payload=False):
+        entry = self.__prepare(message)
+        if entry is None: return None
+        args, payload, payload_codec = entry
+        if copy_payload: payload = copy.deepcopy(payload)
+        qos = message.qos if message.qos is not None else self.__mqtt.get_qos(message.command)
+        return [message.house_id, message.recipient, message.command, args, payload, payload_codec, qos, message.retain]
+
+    # send multiple messages by packing those addressed to the same module into a single publish. Inspection listeners of other modules receive the batch only if subscribing its BATCH topic (e.g. with command "+")
+    def send_batch(self, messages):
+        self.__send_batched([entry for entry in [self.__prepare_batched(message) for message in messages] if entry is not None])
+
+    # send the given messages, as returned by __prepare_batched()
+    def __send_batched(self, entries):
+        # group messages by house, recipient and codec
+        groups = collections.OrderedDict()
+        for house_id, recipient, command, args, payload, payload_codec, qos, retain in entries:
+            # retained messages and broadcasts are sent individually
+            if retain or recipient == "*/*":
+                self.__mqtt.publish(house_id, recipient, command, args, payload, retain, payload_codec, qos)
+                continue
+            key = (house_id, recipient, payload_codec)
+            if key not in groups: groups[key] = []
+            groups[key].append([command, args, payload, qos])
+        # publish a batch for each group with the highest QoS level of its messages, will be unpacked by the recipient's mqtt client
+        for (house_id, recipient, payload_codec), items in groups.items():
+            if len(items) == 1:
+                self.__mqtt.publish(house_id, recipient, items[0][0], items[0][1], items[0][2], False, payload_codec, items[0][3])
+                continue
+            batch = Message(self)
+            batch.set_data([item[:3] for item in items])
+            self.__mqtt.publish(house_id, recipient, "BATCH", str(len(items)), batch.get_payload(), False, payload_codec, max([item[3] for item in items]))
+
+    # batch all the messages sent from the current thread within the context (e.g. with self.batch(): ...)
+    @contextlib.contextmanager
+    def batch(self):
+        # nested batches are sent by the outermost one
+        if getattr(self.__batch, "messages", None) is not None:
+            yield
+            return
+        self.__batch.messages = []
+        try:
+            yield
+        finally:
+            entries = self.__batch.messages
+            self.__batch.messages = None
+            self.__send_batched(entries)
         
-    # log a message
-    def __log(self, severity, text, allow_remote_logging):
+    # true if logging debug messages, the same as setting the log level to debug (True) or info (False)
+    @property
+    def debug(self):
+        return self.log_levels[""] <= logger.DEBUG
+
+    @debug.setter
+    def debug(self, value):
+        self.set_log_level(value)
+
+    # return the log threshold of the given logger
+    def get_log_level(self, name=""):
+        return self.log_levels.get(name, self.log_levels[""])
+
+    # set the log threshold of the given logger ("" for the module's one) to a level name (e.g. "warning"), a number or a debug flag
+    def set_log_level(self, level, name=""):
+        self.log_levels[name] = logger.get_level(level)
+
+    # return a structured logger with the given name, whose threshold can be set independently
+    def get_logger(self, name):
+        return logger.Logger(self, name)
+
+    # log a message (called by the log_*() methods and the structured loggers)
+    def _log(self, severity, text, allow_remote_logging):
+        if self.__log_shipper is not None:
+            if self.logging_local or (self.logging_remote and allow_remote_logging): self.__log_shipper.put(self, severity, text, allow_remote_logging)
+            return
         if self.logging_local:
             print sdk.python.utils.strings.format_log_line(severity, self.fullname, text)
         if self.logging_remote and allow_remote_logging:
             # send the message to the logger module
-            message = Message(self)
-            message.recipient = "controller/logger"
-            message.command = "LOG"
-            message.args = severity
-            message.set_data(text)
-            self.send(message)
+            self.send(logger.get_message(self, severity, text))
+
+    # print and ship at once the logs of this module waiting to be shipped
+    def flush_logs(self):
+        if self.__log_shipper is not None: self.__log_shipper.flush(self)
+
+    # trace the code within the context as a span with the given name (e.g. with self.span("poll"): ...), as part of the current trace or of a new one if sampled. Messages sent within the span are its children
+    @contextlib.contextmanager
+    def span(self, name):
+        entry = tracing.start_span(self, name) if self.tracing else None
+        try:
+            yield
+        finally:
+            if entry is not None: tracing.finish_span(self, entry)
+
+    # export at once the spans of this module waiting to be exported
+    def flush_spans(self):
+        if self.tracing: tracing.get_exporter().flush(self)
+
+    # return the number of spans of the process exported, dropped because the buffer was full and queued (None if not tracing)
+    def get_trace_stats(self):
+        if not self.tracing: return None
+        return tracing.get_exporter().get_stats()
+
+    # return the number of logs of the process shipped, dropped because the buffer was full, suppressed by the rate limit, sampled out and queued (None if logging synchronously)
+    def get_log_stats(self):
+        if self.__log_shipper is None: return None
+        return self.__log_shipper.get_stats()
 
     # handle debug logs
     def log_debug(self, text, allow_remote_logging=True):
-        if not self.debug: return
-        self.__log("debug", text, allow_remote_logging)
+        if self.log_levels[""] > logger.DEBUG: return
+        self._log("debug", text, allow_remote_logging)
     
     # handle info logs
     def log_info(self, text, allow_remote_logging=True):
-        self.__log("info", text, allow_remote_logging)
+        if self.log_levels[""] > logger.INFO: return
+        self._log("info", text, allow_remote_logging)
     
     # handle warning logs
     def log_warning(self, text, allow_remote_logging=True):
-        self.__log("warning", text, allow_remote_logging)
+        if self.log_levels[""] > logger.WARNING: return
+        self._log("warning", text, allow_remote_logging)
     
     # handle error logs
     def log_error(self, text, allow_remote_logging=True):
-        self.__log("error", text, allow_remote_logging)
+        if self.log_levels[""] > logger.ERROR: return
+        self._log("error", text, allow_remote_logging)
 
     # ensure all the items of an array of settings are included in the configuration object provided
     def is_valid_configuration(self, settings, configuration):
-        if not isinstance(configuration, dict): return False
+        if not isinstance(configuration, collections.Mapping): return False
         for item in settings:
             if not item in configuration or configuration[item] is None: 
                 self.log_warning("Invalid configuration received, "+item+" missing in "+str(configuration))
                 return False
         return True
     
+    # return for each lane (control, data) of the incoming queues the messages consumed and waiting, the average/max time spent in the queue and the average time spent in the handler
+    def get_consumer_stats(self):
+        return self.__mqtt.get_stats()
+
+    # return the number of incoming messages shed by the overload policies, how many times and how long topics have been paused and the restarts requested
+    def get_overload_stats(self):
+        return dict(self.__mqtt.overload_stats)
+
+    # return the number of outgoing messages published for each QoS level, dropped because the publishing pipeline was full, queued and in flight (None if not publishing from a dedicated thread)
+    def get_publish_stats(self):
+        return self.__mqtt.get_publish_stats()
+
+    # return the number of messages spooled while offline, replayed and dropped because the spool was full, and the messages and bytes waiting on disk (None if not spooling on disk)
+    def get_spool_stats(self):
+        return self.__mqtt.get_spool_stats()
+
+    # return the number of sessions active and those expired and evicted before being restored so far
+    def get_session_stats(self):
+        return self.sessions.get_stats()
+
+    # return the idents of the threads running the module's code: the module's thread, the consumer threads and those running its scheduled jobs (for an async module, the event loop thread shared with the other async modules of the process)
+    def get_thread_ids(self):
+        thread_ids = [self.ident] if self.is_alive() else []
+        return thread_ids + self.__mqtt.get_consumer_thread_ids() + list(self.job_threads)
+
     # wrap around time sleep so to break if the module is stopping
     def sleep(self, sleep_time):
         step = 0.5
@@ -174,8 +421,8 @@ class Module(threading.Thread):
         self.send(message)
         self.log_info("Requesting to upgrade configuration "+filename+" from v"+str(from_version)+" to v"+str(to_version))
     
-    # run the module, called when starting the thread
-    def run(self):
+    # connect to the gateway and tell everybody this module is starting (called by run() or by subclasses running the module differently)
+    def _setup(self):
         build = " (build "+self.build+")" if self.build is not None else ""
         self.log_info("Starting module"+build)
         # connect to the mqtt broker
@@ -188,6 +435,10 @@ class Module(threading.Thread):
         message.command = "STATUS"
         message.args = "1"
         self.send(message)
+
+    # run the module, called when starting the thread
+    def run(self):
+        self._setup()
         # if the service is not configured (waiting for a configuration file), sleep until it will be
         while not self.configured:
             self.sleep(1)
@@ -208,6 +459,12 @@ class Module(threading.Thread):
         message.args = "0"
         self.send(message)
         self.on_stop()
+        self.flush_logs()
+        self.flush_spans()
+        self._stop_mqtt()
+
+    # disconnect from the gateway (called by join() or by subclasses stopping the module differently)
+    def _stop_mqtt(self):
         self.__mqtt.stop()
         
     # What to do when initializing (subclass has to implement)
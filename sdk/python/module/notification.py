@@ -12,9 +12,9 @@ class Notification(Module):
     __metaclass__ = ABCMeta 
     
     # What to do when initializing
-    def __init__(self, scope, name):
+    def __init__(self, scope, name, **kwargs):
         # call superclass function
-        super(Notification, self).__init__(scope, name)
+        super(Notification, self).__init__(scope, name, **kwargs)
         # module's configuration
         self.config = {}
         # count number of notifications
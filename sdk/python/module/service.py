@@ -3,6 +3,7 @@ import os
 
 from sdk.python.module.module import Module
 from sdk.python.module.helpers.cache import Cache
+import sdk.python.module.helpers.cache as cache
 from sdk.python.module.helpers.scheduler import Scheduler
 from sdk.python.module.helpers.message import Message
 
@@ -12,11 +13,12 @@ import sdk.python.utils.exceptions as exception
 # service common functionalities
 class Service(Module):
     # What to do when initializing
-    def __init__(self, scope, name):
+    def __init__(self, scope, name, **kwargs):
         # call superclass function
-        super(Service, self).__init__(scope, name)
-        # initialize internal cache
-        self.cache = Cache()
+        super(Service, self).__init__(scope, name, **kwargs)
+        # initialize internal cache, keeping up to this number of entries (0 for no limit)
+        self.cache_max_size = int(os.getenv("EGEOFFREY_CACHE_MAX_SIZE", 1000))
+        self.cache = Cache(self.cache_max_size)
         # scheduler is needed for polling sensors
         self.__scheduler = Scheduler(self)
         # map sensor_id with scheduler job_id
@@ -37,7 +39,9 @@ class Service(Module):
         message.command = "IN"
         message.args = sensor_id
         message.set_data(configuration)
-        self.on_message(message)
+        # trace the polling, the values sent to the hub will be part of its trace
+        with self.span("poll "+sensor_id):
+            self.on_message(message)
 
     # unschedule a job
     def __remove_schedule(self, sensor_id):
@@ -76,7 +80,8 @@ class Service(Module):
     # register an pull/push sensor
     def register_sensor(self, message, validate=[]):
         sensor_id = message.args.replace("sensors/","")
-        sensor = message.get_data()
+        # inspect the sensor through a read-only view, most of the sensors are not for this service
+        sensor = message.get_data(copy=False)
         # a sensor has been added/updated, filter in only relevant sensors
         if "service" not in sensor or sensor["service"]["name"] != self.name: return
         if "disabled" in sensor and sensor["disabled"]: return
@@ -87,16 +92,20 @@ class Service(Module):
             # for pull sensors we need a schedule
             if not self.is_valid_configuration(["schedule"], service): return
             # schedule for polling the sensor
-            self.log_debug("Scheduling "+sensor_id+" polling at "+str(service["schedule"])+" with configuration "+str(service["configuration"]))
+            self.log.debug("Scheduling sensor polling", sensor=sensor_id, schedule=service["schedule"], configuration=service["configuration"])
             self.__add_schedule(sensor_id, service["schedule"], service["configuration"])
         # in push mode the sensor will unsolicited generate new measures
         elif service["mode"] == "push":
             if not self.is_valid_configuration(validate, service["configuration"]): return
-            self.log_debug("registered push sensor "+sensor_id+" with configuration "+str(service["configuration"]))
+            self.log.debug("Registered push sensor", sensor=sensor_id, configuration=service["configuration"])
         # keep track of the sensor's configuration
         self.sensors[sensor_id] = service["configuration"]
         return sensor_id
 
+    # return the cache with the given name shared by the modules of this process, e.g. those of the same package polling the same provider
+    def get_shared_cache(self, name):
+        return cache.get_shared(name, self.cache_max_size)
+
     # unregister a sensor
     def unregister_sensor(self, message):
         sensor_id = message.args.replace("sensors/","")
@@ -13,6 +13,8 @@ import yaml
 
 from sdk.python.module.module import Module
 from sdk.python.module.helpers.message import Message
+from sdk.python.module.helpers.profiler import Profiler
+import sdk.python.module.helpers.metrics as metrics
 
 import sdk.python.utils.exceptions as exception
 
@@ -22,6 +24,8 @@ class Watchdog(Module):
         # variables
         self.supported_manifest_schema = 2
         self.broadcast_manifest = bool(int(os.getenv("EGEOFFREY_BROADCAST_MANIFEST", False)))
+        # file the metrics of all the modules are periodically written to in the text exposition format, if any
+        self.metrics_file = os.getenv("EGEOFFREY_METRICS_FILE", "")
         # load this package manifest file
         try:
             self.manifest = self.get_manifest("manifest.yml")
@@ -52,6 +56,8 @@ class Watchdog(Module):
         self.aliases = {}
         # map module fullname with thread
         self.threads = {}
+        # map module fullname with the profiler running on it, if any
+        self.profilers = {}
         self.parse_modules(os.getenv("EGEOFFREY_MODULES", None))
         # if aliases are used, alter the manifest and rename the module's name in the modules array
         for i in range(len(self.manifest["modules"])):
@@ -131,7 +137,8 @@ class Watchdog(Module):
                 "scope": package,
                 "name": name,
                 "started": False,
-                "ping": 0
+                "ping": 0,
+                "queue_wait": 0
             }
             module["fullname"] = module["scope"]+"/"+module["name"]
             self.modules.append(module)
@@ -213,6 +220,47 @@ class Watchdog(Module):
             self.send(message)
             self.sleep(1)
             
+    # return the snapshots of the metrics of this watchdog and of its modules as a list of [fullname, snapshot]
+    def get_metrics_snapshots(self):
+        snapshots = [[self.fullname, self.metrics.snapshot()]]
+        for fullname, thread in self.threads.items():
+            snapshots.append([fullname, thread.metrics.snapshot()])
+        return snapshots
+
+    # write the metrics of this watchdog and of its modules to the metrics file, if configured, so to be scraped locally
+    def write_metrics(self):
+        if self.metrics_file == "": return
+        snapshots = self.get_metrics_snapshots()
+        try:
+            # replace the previous file at once so to never expose a partial one
+            with open(self.metrics_file+".tmp", "w") as f: f.write(metrics.get_text(snapshots))
+            os.rename(self.metrics_file+".tmp", self.metrics_file)
+        except Exception,e:
+            self.log_warning("unable to write the metrics to "+self.metrics_file+": "+exception.get(e))
+
+    # profile the threads of a module for the given number of seconds and reply to the request with the stats
+    def profile_module(self, module, message):
+        if module["fullname"] in self.profilers:
+            self.log_warning("module "+module["fullname"]+" is already being profiled")
+            return
+        # either the number of seconds or the settings of the profiler (e.g. {"duration": 30, "interval": 0.01, "top": 20, "collapsed": True, "idle": False})
+        settings = message.get_data()
+        if not isinstance(settings, dict): settings = {"duration": settings}
+        duration = float(settings.get("duration", 10))
+        self.log_info("profiling module "+module["fullname"]+" for "+str(duration)+" seconds")
+        # reply with the stats once done
+        def on_done(profiler):
+            del self.profilers[module["fullname"]]
+            try:
+                message.reply()
+                message.set_data(profiler.get_stats(int(settings.get("top", 20)), bool(settings.get("collapsed", False)), bool(settings.get("idle", False))))
+                self.send(message)
+            except Exception,e:
+                self.log_error("unable to report the profile of module "+module["fullname"]+": "+exception.get(e))
+        profiler = Profiler(self.threads[module["fullname"]].get_thread_ids, duration, float(settings.get("interval", 0.01)), on_done)
+        self.profilers[module["fullname"]] = profiler
+        profiler.start()
+
     # read out the default config if any, pack it in a data structure and return it
     def load_default_config(self):
         config_dir = "default_config"
@@ -271,6 +319,7 @@ class Watchdog(Module):
         self.sleep(60)
         # loop forever
         while True:
+            self.write_metrics()
             self.sleep(10)
         
     # What to do when shutting down
@@ -293,9 +342,10 @@ class Watchdog(Module):
             # get back the module's object
             module = self.get_module(message.sender)
             if module is None: return
-            # calculate roundtrip time
+            # calculate roundtrip time and keep track of how long the ping waited in the module's queue
             module["ping"] = round(time.time() - module["ping"], 3)
-            self.log_debug("Received ping reply from "+module["fullname"]+": "+str(module["ping"])+"ms")
+            module["queue_wait"] = message.get("queue_wait") if message.has("queue_wait") else 0
+            self.log_debug("Received ping reply from "+module["fullname"]+": "+str(module["ping"])+"s (queue wait "+str(module["queue_wait"])+"s)")
             return
         # reply with the list of managed modules and their status
         elif message.command == "DISCOVER":
@@ -308,9 +358,11 @@ class Watchdog(Module):
                 if message.args != "*" and module["fullname"] != message.args: continue
                 if module["fullname"] not in self.threads: continue
                 module["debug"] = self.threads[module["fullname"]].debug
+                module["log_levels"] = dict(self.threads[module["fullname"]].log_levels)
                 module["version"] = self.threads[module["fullname"]].version
                 module["build"] = self.threads[module["fullname"]].build
                 module["configured"] = self.threads[module["fullname"]].configured
+                module["metrics"] = self.threads[module["fullname"]].metrics.snapshot()
                 modules.append(module)
             if len(modules) > 0:
                 # reply to the discovery request
@@ -318,15 +370,27 @@ class Watchdog(Module):
                 message.reply()
                 message.sender = self.fullname
                 message.set_data(modules)
+                # when discovering all the modules, add the metrics of the whole process: those of the modules summed up and the watchdog's own ones
+                if message.args == "*": message.set_header("process_metrics", {"aggregate": metrics.aggregate(self.get_metrics_snapshots()), "watchdog": self.metrics.snapshot()})
                 self.send(message)
             return
-        # set debug at runtime
+        # set debug or log levels at runtime
         elif message.command == "DEBUG":
             module = self.get_module(message.args)
             if module is None: return
-            self.log_info("setting debug to "+str(message.get_data())+" to module "+module["fullname"])
-            self.threads[message.args].debug = bool(int(message.get_data()))
-            module["debug"] = bool(int(self.threads[message.args].debug))
+            # either a debug flag ("1" or "0"), a level (e.g. "warning") or the level of each logger (e.g. {"": "info", "scheduler": "debug"})
+            levels = message.get_data()
+            if not isinstance(levels, dict): levels = {"": levels}
+            self.log_info("setting log levels "+str(levels)+" to module "+module["fullname"])
+            for name, level in levels.iteritems():
+                self.threads[message.args].set_log_level(level, name)
+            module["debug"] = self.threads[message.args].debug
+            module["log_levels"] = dict(self.threads[message.args].log_levels)
+        # profile the threads of a module for some seconds
+        elif message.command == "PROFILE":
+            module = self.get_module(message.args)
+            if module is None or module["fullname"] not in self.threads: return
+            self.profile_module(module, message)
         # stop a started module
         elif message.command == "STOP": 
             module = self.get_module(message.args)
@@ -0,0 +1,74 @@
+### Test an AsyncModule being stopped waits for its on_stop() coroutine and reports the event loop thread as its own
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m unittest discover -s sdk/python/tests -t .
+
+import os
+import time
+import threading
+import unittest
+import paho.mqtt.client as mqtt
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.async_module import AsyncModule
+from sdk.python.module.helpers.message import Message
+
+# module sending a message once stopped, after waiting a bit
+class Stopping(AsyncModule):
+    def on_init(self):
+        self.started = False
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        yield self.sleep(0.2)
+        message = Message(self)
+        message.recipient = "service/receiver"
+        message.command = "BYE"
+        self.send(message)
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+
+# wait up to timeout seconds for the given condition to be true
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end: time.sleep(0.01)
+    return condition()
+
+class Test_async_module(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker()
+        self.broker.configure()
+        self.broker.start()
+        self.module = Stopping("service", "stopping")
+        self.module.start()
+        self.assertTrue(wait_for(lambda: self.module.started and self.module.connected))
+        # the recipient, a plain mqtt client
+        self.received = []
+        subscribed = threading.Event()
+        receiver = mqtt.Client()
+        receiver.on_connect = lambda client, userdata, flags, rc: client.subscribe("egeoffrey/v1/+/service/stopping/service/receiver/BYE/#")
+        receiver.on_subscribe = lambda client, userdata, mid, qos: subscribed.set()
+        receiver.on_message = lambda client, userdata, msg: self.received.append(msg.topic)
+        receiver.connect("127.0.0.1", self.broker.port)
+        receiver.loop_start()
+        self.addCleanup(receiver.loop_stop)
+        self.assertTrue(subscribed.wait(5))
+
+    def test_on_stop_completes_before_disconnecting(self):
+        self.module.join()
+        self.assertTrue(wait_for(lambda: len(self.received) == 1))
+
+    def test_thread_ids(self):
+        thread_ids = self.module.get_thread_ids()
+        self.module.join()
+        self.assertNotIn(None, thread_ids)
+        self.assertIn(self.module.event_loop.ident, thread_ids)
+
+if __name__ == "__main__":
+    unittest.main()
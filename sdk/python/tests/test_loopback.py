@@ -0,0 +1,97 @@
+### Test the messages delivered locally are mirrored to the gateway for the inspection listeners of other processes, and delivered only once locally
+## DEPENDENCIES:
+# OS:
+# Python: paho-mqtt
+## USAGE: python -m unittest discover -s sdk/python/tests -t .
+
+import os
+import time
+import threading
+import unittest
+import paho.mqtt.client as mqtt
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+os.environ["EGEOFFREY_LOOPBACK"] = "1"
+
+from sdk.python.benchmarks.broker import Broker
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.message import Message
+
+# module keeping track of the messages received
+class Recorder(Module):
+    def on_init(self):
+        self.started = False
+        self.received = []
+    def on_start(self):
+        self.started = True
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        if message.command == "IN": self.received.append(message.get("value"))
+    def on_configuration(self, message):
+        pass
+
+# wait up to timeout seconds for the given condition to be true
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end: time.sleep(0.01)
+    return condition()
+
+class Test_loopback(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker()
+        self.broker.configure()
+        self.broker.start()
+        self.modules = []
+
+    def tearDown(self):
+        for module in self.modules: module.join()
+
+    # start a module sending and one receiving within this process and an inspection listener in another process, a plain mqtt client
+    def start(self, mirror):
+        os.environ["EGEOFFREY_LOOPBACK_MIRROR"] = "1" if mirror else "0"
+        for name in ["sender", "receiver"]:
+            module = Recorder("service", name)
+            module.daemon = True
+            module.start()
+            self.modules.append(module)
+        self.assertTrue(wait_for(lambda: all([module.started and module.connected for module in self.modules])))
+        self.inspected = []
+        subscribed = threading.Event()
+        inspector = mqtt.Client()
+        inspector.on_connect = lambda client, userdata, flags, rc: client.subscribe("egeoffrey/v1/+/service/sender/service/receiver/IN/#")
+        inspector.on_subscribe = lambda client, userdata, mid, qos: subscribed.set()
+        inspector.on_message = lambda client, userdata, msg: self.inspected.append(msg.topic)
+        inspector.connect("127.0.0.1", self.broker.port)
+        inspector.loop_start()
+        self.addCleanup(inspector.loop_stop)
+        self.assertTrue(subscribed.wait(5))
+        return self.modules
+
+    # send a message from the sender to the receiver
+    def send(self, sender, value):
+        message = Message(sender)
+        message.recipient = "service/receiver"
+        message.command = "IN"
+        message.set("value", value)
+        sender.send(message)
+
+    def test_mirrored(self):
+        sender, receiver = self.start(True)
+        for value in range(3): self.send(sender, value)
+        self.assertTrue(wait_for(lambda: len(self.inspected) == 3))
+        # the copy published to the gateway is not delivered again
+        time.sleep(0.5)
+        self.assertEqual(receiver.received, [0, 1, 2])
+
+    def test_not_mirrored(self):
+        sender, receiver = self.start(False)
+        for value in range(3): self.send(sender, value)
+        self.assertTrue(wait_for(lambda: len(receiver.received) == 3))
+        time.sleep(0.5)
+        self.assertEqual(self.inspected, [])
+        self.assertEqual(receiver.received, [0, 1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+### Test the logs of the scheduler are filtered by the module's "scheduler" threshold
+## DEPENDENCIES:
+# OS:
+# Python: APScheduler
+## USAGE: python -m unittest discover -s sdk/python/tests -t .
+
+import os
+import logging
+import unittest
+
+os.environ["EGEOFFREY_LOGGING_REMOTE"] = "0"
+os.environ["EGEOFFREY_LOGGING_LOCAL"] = "0"
+
+from sdk.python.module.module import Module
+from sdk.python.module.helpers.scheduler import Scheduler
+
+# module keeping track of its logs
+class Recorder(Module):
+    def on_init(self):
+        self.logs = []
+    def on_start(self):
+        pass
+    def on_stop(self):
+        pass
+    def on_message(self, message):
+        pass
+    def on_configuration(self, message):
+        pass
+    def _log(self, severity, text, allow_remote_logging):
+        self.logs.append([severity, str(text)])
+
+class Test_scheduler_logging(unittest.TestCase):
+    def setUp(self):
+        self.module = Recorder("service", "scheduler_test")
+        self.scheduler = Scheduler(self.module)
+
+    def tearDown(self):
+        # the apscheduler loggers are global, do not leave the handler of this module behind
+        for name in ["apscheduler.executors.default", "apscheduler.scheduler"]:
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers): logger.removeHandler(handler)
+
+    def test_silenced_by_default(self):
+        logging.getLogger("apscheduler.scheduler").info("Added job")
+        self.assertEqual(self.module.logs, [])
+
+    def test_threshold_lowered_at_runtime(self):
+        self.module.set_log_level("info", "scheduler")
+        logging.getLogger("apscheduler.scheduler").info("Added job")
+        logging.getLogger("apscheduler.scheduler").debug("Looking for jobs to run")
+        self.assertEqual(self.module.logs, [["info", "Added job logger=scheduler"]])
+        self.module.set_log_level("debug", "scheduler")
+        logging.getLogger("apscheduler.executors.default").debug("Looking for jobs to run")
+        self.assertEqual(self.module.logs[-1], ["debug", "Looking for jobs to run logger=scheduler"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+### Reconstruct the per-hop latency of the traced messages from the spans collected as json lines (e.g. in EGEOFFREY_TRACE_FILE)
+## DEPENDENCIES:
+# OS:
+# Python:
+## USAGE: python -m sdk.python.tools.traces <spans file> [trace_id]
+
+import sys
+import json
+import collections
+
+# return the spans read from the given file, skipping the invalid lines
+def load(filename):
+    spans = []
+    with open(filename) as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(span, dict) and "trace_id" in span: spans.append(span)
+    return spans
+
+# return the name of the hop of a span, e.g. "service/sensor -> controller/hub IN sensor1" or "service/sensor poll sensor1" for a local span
+def get_hop(span):
+    if "sender" in span: return span["sender"]+" -> "+span["module"]+" "+span["name"]
+    return span["module"]+" "+span["name"]
+
+# return the time in milliseconds spent by a span in the network and broker (from the sender's clock to the recipient's one), in the recipient's queue and in the handler
+def get_segments(span):
+    network = queue = None
+    if "sent" in span and span.get("received") is not None:
+        network = (span["received"] - span["sent"]) * 1000
+        queue = (span["started"] - span["received"]) * 1000
+    return [network, queue, (span["finished"] - span["started"]) * 1000]
+
+# return when a span began, i.e. when its message was sent
+def get_start(span):
+    return span["sent"] if "sent" in span else span["started"]
+
+# return the given percentile of a sorted list of values
+def get_percentile(values, percentile):
+    return values[min(len(values) - 1, int(len(values) * percentile))]
+
+# return the spans of each trace by trace_id
+def get_traces(spans):
+    traces = collections.OrderedDict()
+    for span in spans: traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+# return for each hop the number of spans and the average and 95th percentile of the time spent in the network, in the queue and in the handler
+def get_breakdown(spans):
+    hops = collections.OrderedDict()
+    for span in sorted(spans, key=get_start):
+        segments = get_segments(span)
+        entry = hops.setdefault(get_hop(span), [[], [], []])
+        for i in range(3):
+            if segments[i] is not None: entry[i].append(segments[i])
+    breakdown = []
+    for hop, values in hops.iteritems():
+        stats = []
+        for segment in values:
+            segment.sort()
+            stats.append([sum(segment) / len(segment), get_percentile(segment, 0.95)] if len(segment) > 0 else None)
+        breakdown.append([hop, max([len(segment) for segment in values])] + stats)
+    return breakdown
+
+# return the spans of a trace as [depth, span] in the order they happened, each after its parent. A message broadcasted to multiple modules has a span for each recipient with the same span_id, so the parent is identified by span_id and module
+def get_tree(spans):
+    index = dict([((span["span_id"], span["module"]), span) for span in spans])
+    children = collections.defaultdict(list)
+    roots = []
+    for span in spans:
+        parent = (span["parent_id"], span.get("sender", span["module"]))
+        if span["parent_id"] is not None and parent in index: children[parent].append(span)
+        else: roots.append(span)
+    tree = []
+    def visit(span, depth):
+        tree.append([depth, span])
+        for child in sorted(children[(span["span_id"], span["module"])], key=get_start): visit(child, depth + 1)
+    for root in sorted(roots, key=get_start): visit(root, 0)
+    return tree
+
+# return the duration in milliseconds of a trace, from the first message sent to the last handler finished
+def get_duration(spans):
+    return (max([span["finished"] for span in spans]) - min([get_start(span) for span in spans])) * 1000
+
+# format a time in milliseconds
+def format_ms(value):
+    return "%8.1f" % value if value is not None else "%8s" % "-"
+
+# print the per-hop breakdown of all the traces and the slowest of them
+def print_summary(spans):
+    traces = get_traces(spans)
+    durations = sorted([get_duration(trace) for trace in traces.values()])
+    print "%d spans in %d traces, duration avg %.1f ms, p95 %.1f ms" % (len(spans), len(traces), sum(durations) / len(durations), get_percentile(durations, 0.95))
+    print
+    print "%-60s %6s  %17s  %17s  %17s" % ("hop", "count", "network avg/p95", "queue avg/p95", "handler avg/p95")
+    for hop, count, network, queue, handler in get_breakdown(spans):
+        print "%-60s %6d  %s  %s  %s" % (hop[:60], count, format_ms(network[0] if network else None)+" "+format_ms(network[1] if network else None), format_ms(queue[0] if queue else None)+" "+format_ms(queue[1] if queue else None), format_ms(handler[0])+" "+format_ms(handler[1]))
+    print
+    print "slowest traces:"
+    for trace_id, trace in sorted(traces.items(), key=lambda item: -get_duration(item[1]))[:5]:
+        print "  %s %8.1f ms, %d spans" % (trace_id, get_duration(trace), len(trace))
+
+# print each hop of a trace with when it began since the start of the trace and the time spent in the network, in the queue and in the handler
+def print_trace(spans):
+    start = min([get_start(span) for span in spans])
+    print "%8s  %-60s  %8s  %8s  %8s" % ("at", "hop", "network", "queue", "handler")
+    for depth, span in get_tree(spans):
+        network, queue, handler = get_segments(span)
+        print "%8.1f  %-60s  %s  %s  %s" % ((get_start(span) - start) * 1000, ("  " * depth + get_hop(span))[:60], format_ms(network), format_ms(queue), format_ms(handler))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "USAGE: python -m sdk.python.tools.traces <spans file> [trace_id]"
+        sys.exit(1)
+    spans = load(sys.argv[1])
+    if len(spans) == 0:
+        print "no spans found in "+sys.argv[1]
+        sys.exit(1)
+    if len(sys.argv) > 2:
+        trace = [span for span in spans if span["trace_id"] == sys.argv[2]]
+        if len(trace) == 0:
+            print "trace "+sys.argv[2]+" not found"
+            sys.exit(1)
+        print_trace(trace)
+    else:
+        print_summary(spans)
@@ -18,9 +18,9 @@ def hex2string(hex):
         return string
     except: return None
 
-# format a log line for printing
-def format_log_line(severity, module, text):
+# format a log line for printing, with the given timestamp (now if None)
+def format_log_line(severity, module, text, timestamp=None):
     severity = str(severity.upper())
     if severity == "WARNING": severity = "\033[33mWARNING\033[0m"
     elif severity == "ERROR": severity = "\033[31mERROR\033[0m"
-    return "["+datetime.now().strftime("%Y-%m-%d %H:%M:%S")+"]["+str(module)+"] "+severity+ ": "+truncate(str(text), 2000)
\ No newline at end of file
+    return "["+(datetime.fromtimestamp(timestamp) if timestamp is not None else datetime.now()).strftime("%Y-%m-%d %H:%M:%S")+"]["+str(module)+"] "+severity+ ": "+truncate(str(text), 2000)
\ No newline at end of file